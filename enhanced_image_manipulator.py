@@ -1,34 +1,66 @@
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox, scrolledtext
-import base64
-from PIL import Image, ImageOps, ImageEnhance, ImageFilter, ImageFont, ImageDraw
+from tkinter import ttk, filedialog, messagebox, scrolledtext, simpledialog
+from PIL import Image, ImageTk, ImageOps
 from PIL.ExifTags import TAGS, GPSTAGS
-import io
 import os
 import json
 import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
 from datetime import datetime
 import pillow_heif
 import cv2
 import numpy as np
-from collections import Counter
+from image_filters import FILTER_NAMES, apply_named_filter
+from image_pipeline import (Pipeline, EditHistory, resize, rotate, enhance, apply_filter, crop_to_ratio,
+                            watermark, flatten, encode, fit_within, FORMAT_MAP)
+from image_metadata import metadata_from_image
+from image_analysis import extract_color_palette
+from image_quality import parse_byte_size, SEARCH_FORMATS
+from image_cache import LRUCache, file_key, decode_file
 
 pillow_heif.register_heif_opener()
 
+# Edits are applied to a proxy of at most this size for the preview, the full
+# resolution image is only rendered when it is needed (save, analysis)
+PREVIEW_PROXY_SIZE = (1200, 1200)
+
+# Decoded images, preview proxies and edit results of the files opened or batch processed
+# share this memory budget; the least recently used are evicted first
+IMAGE_CACHE_BYTES = 1024 * 1024 * 1024
+
 class EnhancedImageManipulator:
-    def __init__(self, root):
+    def __init__(self, root, cache_bytes=IMAGE_CACHE_BYTES):
         self.root = root
         self.root.title("Enhanced Image Manipulator Pro")
         self.root.geometry("1200x800")
         self.root.configure(bg='#2b2b2b')
         
         self.current_image_path = None
-        self.processed_image = None
+        self.image_cache = LRUCache(cache_bytes)
+        self.image_metadata = None
+        self.history = None
         self.preview_image = None
+        self.preview_key = None
         
         self.setup_ui()
         
+    @property
+    def processed_image(self):
+        """Full resolution result of all edits, rendered on first access"""
+        return self.history.image if self.history else None
+        
+    @processed_image.setter
+    def processed_image(self, img):
+        # Setting an image directly starts a new edit history from it
+        self.history = EditHistory(img, preview_size=PREVIEW_PROXY_SIZE) if img is not None else None
+        
+    def apply_operation(self, op):
+        """Apply an image_pipeline operation to the preview; the full image is rendered lazily"""
+        self.history.push(op)
+        self.display_preview()
+        
     def setup_ui(self):
         main_frame = ttk.Frame(self.root)
         main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -113,8 +145,12 @@ class EnhancedImageManipulator:
         ttk.Checkbutton(resize_frame, text="Maintain aspect ratio", 
                        variable=self.maintain_aspect_var).grid(row=2, column=0, columnspan=2, sticky=tk.W, pady=5)
         
+        self.fast_decode_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(resize_frame, text="Fast JPEG decode (batch)", 
+                       variable=self.fast_decode_var).grid(row=3, column=0, columnspan=2, sticky=tk.W)
+        
         ttk.Button(resize_frame, text="Resize", 
-                  command=self.resize_image).grid(row=3, column=0, columnspan=2, pady=5)
+                  command=self.resize_image).grid(row=4, column=0, columnspan=2, pady=5)
         
         # Rotate section
         rotate_frame = ttk.LabelFrame(parent, text="Rotate")
@@ -276,6 +312,7 @@ class EnhancedImageManipulator:
         # Files list
         self.batch_listbox = tk.Listbox(parent, height=8)
         self.batch_listbox.pack(fill=tk.BOTH, expand=True, pady=5)
+        self.batch_listbox.bind('<<ListboxSelect>>', self.open_batch_selection)
         
     def select_image(self):
         file_path = filedialog.askopenfilename(
@@ -305,59 +342,96 @@ class EnhancedImageManipulator:
             self.update_batch_list()
             messagebox.showinfo("Success", f"Added {len(file_paths)} files to batch list")
             
+    def open_batch_selection(self, event=None):
+        """Open the file selected in the batch list"""
+        selection = self.batch_listbox.curselection()
+        if not selection:
+            return
+        self.current_image_path = self.batch_files[selection[0]]
+        self.load_and_display_image(self.current_image_path)
+        self.update_image_info()
+        
     def load_and_display_image(self, file_path):
+        self.image_metadata = None
         try:
-            with Image.open(file_path) as img:
-                self.processed_image = img.copy()
-                self.display_preview()
+            # The decoded image, its header metadata (kept for the info panel) and the preview
+            # proxy are cached by path, mtime and size, so reopening a file decodes nothing
+            key = file_key(file_path)
+            img = self.image_cache.get_or_compute(key, decode_file, file_path)
+            self.image_metadata = dict(self.image_cache.get_or_compute(key + ('info',), metadata_from_image, img,
+                                                                       include_exif=False))
+            self.image_metadata.update(path=file_path, file_size=key[2])
+            # The edit history applies the EXIF orientation, folded into a first resize; it only
+            # reads the cached image, edits make new images
+            self.history = EditHistory(img, key, self.image_cache, preview_size=PREVIEW_PROXY_SIZE)
+            self.display_preview()
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load image: {str(e)}")
             
     def display_preview(self):
-        if self.processed_image:
-            # Calculate display size
-            display_size = (400, 300)
-            img_copy = self.processed_image.copy()
-            img_copy.thumbnail(display_size, Image.Resampling.LANCZOS)
+        if self.history:
+            # The thumbnail only changes when the edit history does
+            preview_key = (self.history, self.history.version)
+            if preview_key == self.preview_key:
+                return
+            self.preview_key = preview_key
+            
+            thumbnail = self.preview_thumbnail(self.history.preview)
             
-            # Convert to PhotoImage for display
-            import tkinter.image_names
-            photo = tk.PhotoImage(data=self.pil_to_base64(img_copy))
+            # Pixels are copied straight into the Tk photo; an existing photo of the
+            # same size is reused instead of creating a new Tk image
+            photo = self.preview_image
+            if photo is not None and photo.width() == thumbnail.width and photo.height() == thumbnail.height:
+                photo.paste(thumbnail)
+            else:
+                photo = ImageTk.PhotoImage(thumbnail)
+                self.preview_image = photo
             
             self.preview_label.configure(image=photo, text="")
             self.preview_label.image = photo
             
-    def pil_to_base64(self, img):
-        buffered = io.BytesIO()
-        img.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue())
-        return img_str
+    def preview_thumbnail(self, img, display_size=(400, 300)):
+        """Downsample img to fit the preview area, in a mode Tk can show directly"""
+        size = fit_within(img.size, display_size)
+        if size != img.size:
+            # reducing_gap shrinks by an integer factor first, then resamples the rest
+            img = img.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+        if img.mode not in ('L', 'RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+        return img
         
     def update_image_info(self):
-        if not self.current_image_path:
+        if not self.current_image_path or not self.image_metadata:
             return
             
         try:
-            with Image.open(self.current_image_path) as img:
-                file_size = Path(self.current_image_path).stat().st_size
-                
-                info = f"File: {Path(self.current_image_path).name}\n"
-                info += f"Path: {self.current_image_path}\n"
-                info += f"Size: {file_size / 1024 / 1024:.2f} MB ({file_size:,} bytes)\n"
-                info += f"Format: {img.format}\n"
-                info += f"Mode: {img.mode}\n"
-                info += f"Dimensions: {img.width}x{img.height}\n"
-                info += f"Aspect Ratio: {img.width / img.height:.2f}\n"
-                info += f"Transparency: {'Yes' if img.mode in ('RGBA', 'LA') else 'No'}\n"
-                
-                self.info_text.delete(1.0, tk.END)
-                self.info_text.insert(tk.END, info)
+            metadata = self.image_metadata
+            file_size = metadata['file_size']
+            
+            info = f"File: {Path(self.current_image_path).name}\n"
+            info += f"Path: {self.current_image_path}\n"
+            info += f"Size: {file_size / 1024 / 1024:.2f} MB ({file_size:,} bytes)\n"
+            info += f"Format: {metadata['format']}\n"
+            info += f"Mode: {metadata['mode']}\n"
+            info += f"Dimensions: {metadata['width']}x{metadata['height']}\n"
+            info += f"Aspect Ratio: {metadata['width'] / metadata['height']:.2f}\n"
+            info += f"Transparency: {'Yes' if metadata['has_transparency'] else 'No'}\n"
+            info += f"EXIF: {'Yes' if metadata['has_exif'] else 'No'} (orientation {metadata['orientation']})\n"
+            info += f"Color Profile: {'ICC' if metadata['icc_profile_size'] else 'None'}\n"
+            
+            stats = self.image_cache.stats()
+            info += (f"Image Cache: {stats['entries']} entries, {stats['bytes'] / 1024 / 1024:.0f} of "
+                     f"{stats['max_bytes'] / 1024 / 1024:.0f} MB, {stats['hits']} hits, {stats['misses']} misses, "
+                     f"{stats['evictions']} evictions\n")
+            
+            self.info_text.delete(1.0, tk.END)
+            self.info_text.insert(tk.END, info)
                 
         except Exception as e:
             messagebox.showerror("Error", f"Failed to get image info: {str(e)}")
             
     def save_image(self):
-        if not self.processed_image:
+        if not self.history:
             messagebox.showwarning("Warning", "No processed image to save")
             return
             
@@ -376,8 +450,8 @@ class EnhancedImageManipulator:
         
         if file_path:
             try:
-                # Handle format conversion for saving
-                save_image = self.processed_image.copy()
+                # Handle format conversion for saving (this renders the edits at full resolution)
+                save_image = self.processed_image
                 format_ext = Path(file_path).suffix.lower()
                 
                 if format_ext in ['.jpg', '.jpeg']:
@@ -399,7 +473,7 @@ class EnhancedImageManipulator:
                 
     # Basic operations
     def resize_image(self):
-        if not self.processed_image:
+        if not self.history:
             messagebox.showwarning("Warning", "No image loaded")
             return
             
@@ -407,12 +481,7 @@ class EnhancedImageManipulator:
             width = int(self.width_var.get())
             height = int(self.height_var.get())
             
-            if self.maintain_aspect_var.get():
-                self.processed_image.thumbnail((width, height), Image.Resampling.LANCZOS)
-            else:
-                self.processed_image = self.processed_image.resize((width, height), Image.Resampling.LANCZOS)
-                
-            self.display_preview()
+            self.apply_operation(resize(width, height, maintain_aspect=self.maintain_aspect_var.get(), draft=False))
             messagebox.showinfo("Success", "Image resized successfully")
             
         except ValueError:
@@ -421,14 +490,13 @@ class EnhancedImageManipulator:
             messagebox.showerror("Error", f"Failed to resize image: {str(e)}")
             
     def rotate_image(self):
-        if not self.processed_image:
+        if not self.history:
             messagebox.showwarning("Warning", "No image loaded")
             return
             
         try:
             angle = float(self.angle_var.get())
-            self.processed_image = self.processed_image.rotate(angle, expand=True, fillcolor='white')
-            self.display_preview()
+            self.apply_operation(rotate(angle))
             messagebox.showinfo("Success", f"Image rotated by {angle} degrees")
             
         except ValueError:
@@ -437,7 +505,7 @@ class EnhancedImageManipulator:
             messagebox.showerror("Error", f"Failed to rotate image: {str(e)}")
             
     def convert_format(self):
-        if not self.processed_image:
+        if not self.history:
             messagebox.showwarning("Warning", "No image loaded")
             return
             
@@ -446,289 +514,162 @@ class EnhancedImageManipulator:
         
     # Enhancement operations
     def apply_brightness(self):
-        if not self.processed_image:
+        if not self.history:
             messagebox.showwarning("Warning", "No image loaded")
             return
             
         try:
-            enhancer = ImageEnhance.Brightness(self.processed_image)
-            self.processed_image = enhancer.enhance(self.brightness_var.get())
-            self.display_preview()
+            self.apply_operation(enhance(brightness=self.brightness_var.get()))
             
         except Exception as e:
             messagebox.showerror("Error", f"Failed to adjust brightness: {str(e)}")
             
     def apply_contrast(self):
-        if not self.processed_image:
+        if not self.history:
             messagebox.showwarning("Warning", "No image loaded")
             return
             
         try:
-            enhancer = ImageEnhance.Contrast(self.processed_image)
-            self.processed_image = enhancer.enhance(self.contrast_var.get())
-            self.display_preview()
+            self.apply_operation(enhance(contrast=self.contrast_var.get()))
             
         except Exception as e:
             messagebox.showerror("Error", f"Failed to adjust contrast: {str(e)}")
             
     def apply_saturation(self):
-        if not self.processed_image:
+        if not self.history:
             messagebox.showwarning("Warning", "No image loaded")
             return
             
         try:
-            enhancer = ImageEnhance.Color(self.processed_image)
-            self.processed_image = enhancer.enhance(self.saturation_var.get())
-            self.display_preview()
+            self.apply_operation(enhance(saturation=self.saturation_var.get()))
             
         except Exception as e:
             messagebox.showerror("Error", f"Failed to adjust saturation: {str(e)}")
             
     def apply_sharpness(self):
-        if not self.processed_image:
+        if not self.history:
             messagebox.showwarning("Warning", "No image loaded")
             return
             
         try:
-            enhancer = ImageEnhance.Sharpness(self.processed_image)
-            self.processed_image = enhancer.enhance(self.sharpness_var.get())
-            self.display_preview()
+            self.apply_operation(enhance(sharpness=self.sharpness_var.get()))
             
         except Exception as e:
             messagebox.showerror("Error", f"Failed to adjust sharpness: {str(e)}")
             
     # Filter operations
     def apply_grayscale(self):
-        if not self.processed_image:
+        if not self.history:
             messagebox.showwarning("Warning", "No image loaded")
             return
             
-        self.processed_image = self.processed_image.convert('L').convert('RGB')
-        self.display_preview()
+        self.apply_operation(apply_filter("Grayscale"))
         
     def apply_sepia(self):
-        if not self.processed_image:
+        if not self.history:
             messagebox.showwarning("Warning", "No image loaded")
             return
             
-        # Convert to numpy array for sepia effect
-        img_array = np.array(self.processed_image)
-        sepia_filter = np.array([
-            [0.393, 0.769, 0.189],
-            [0.349, 0.686, 0.168],
-            [0.272, 0.534, 0.131]
-        ])
-        
-        sepia_img = img_array.dot(sepia_filter.T)
-        sepia_img = np.clip(sepia_img, 0, 255).astype(np.uint8)
-        self.processed_image = Image.fromarray(sepia_img)
-        self.display_preview()
+        # Sepia color matrix, applied by Pillow on uint8 data
+        self.apply_operation(apply_filter("Sepia"))
         
     def apply_blur(self):
-        if not self.processed_image:
+        if not self.history:
             messagebox.showwarning("Warning", "No image loaded")
             return
             
-        self.processed_image = self.processed_image.filter(ImageFilter.BLUR)
-        self.display_preview()
+        self.apply_operation(apply_filter("Blur"))
         
     def apply_gaussian_blur(self):
-        if not self.processed_image:
+        if not self.history:
             messagebox.showwarning("Warning", "No image loaded")
             return
             
-        self.processed_image = self.processed_image.filter(ImageFilter.GaussianBlur(radius=2))
-        self.display_preview()
+        self.apply_operation(apply_filter("Gaussian Blur"))
         
     def apply_edge_enhance(self):
-        if not self.processed_image:
+        if not self.history:
             messagebox.showwarning("Warning", "No image loaded")
             return
             
-        self.processed_image = self.processed_image.filter(ImageFilter.EDGE_ENHANCE)
-        self.display_preview()
+        self.apply_operation(apply_filter("Edge Enhance"))
         
     def apply_emboss(self):
-        if not self.processed_image:
+        if not self.history:
             messagebox.showwarning("Warning", "No image loaded")
             return
             
-        self.processed_image = self.processed_image.filter(ImageFilter.EMBOSS)
-        self.display_preview()
+        self.apply_operation(apply_filter("Emboss"))
         
     def apply_find_edges(self):
-        if not self.processed_image:
+        if not self.history:
             messagebox.showwarning("Warning", "No image loaded")
             return
             
-        self.processed_image = self.processed_image.filter(ImageFilter.FIND_EDGES)
-        self.display_preview()
+        self.apply_operation(apply_filter("Find Edges"))
         
     def apply_vintage(self):
-        if not self.processed_image:
+        if not self.history:
             messagebox.showwarning("Warning", "No image loaded")
             return
             
-        # Apply vintage effect (sepia + vignette + noise)
-        self.apply_sepia()
-        
-        # Add slight blur for vintage feel
-        self.processed_image = self.processed_image.filter(ImageFilter.GaussianBlur(radius=0.5))
-        
-        # Reduce contrast slightly
-        enhancer = ImageEnhance.Contrast(self.processed_image)
-        self.processed_image = enhancer.enhance(0.9)
-        
-        self.display_preview()
+        # Apply vintage effect (sepia + slight blur + reduced contrast)
+        self.apply_operation(apply_filter("Vintage"))
         
     def apply_cool_filter(self):
-        if not self.processed_image:
+        if not self.history:
             messagebox.showwarning("Warning", "No image loaded")
             return
             
-        # Cool filter (boost blues, reduce reds)
-        img_array = np.array(self.processed_image).astype(float)
-        img_array[:, :, 0] *= 0.8  # Reduce red
-        img_array[:, :, 2] *= 1.2  # Boost blue
-        img_array = np.clip(img_array, 0, 255).astype(np.uint8)
-        self.processed_image = Image.fromarray(img_array)
-        self.display_preview()
+        # Cool filter (boost blues, reduce reds), applied through a precomputed LUT
+        self.apply_operation(apply_filter("Cool"))
         
     def apply_warm_filter(self):
-        if not self.processed_image:
+        if not self.history:
             messagebox.showwarning("Warning", "No image loaded")
             return
             
-        # Warm filter (boost reds/yellows, reduce blues)
-        img_array = np.array(self.processed_image).astype(float)
-        img_array[:, :, 0] *= 1.2  # Boost red
-        img_array[:, :, 1] *= 1.1  # Boost green slightly
-        img_array[:, :, 2] *= 0.8  # Reduce blue
-        img_array = np.clip(img_array, 0, 255).astype(np.uint8)
-        self.processed_image = Image.fromarray(img_array)
-        self.display_preview()
+        # Warm filter (boost reds/yellows, reduce blues), applied through a precomputed LUT
+        self.apply_operation(apply_filter("Warm"))
         
     # Advanced operations
     def crop_center(self):
-        if not self.processed_image:
+        if not self.history:
             messagebox.showwarning("Warning", "No image loaded")
             return
             
         ratio = self.crop_ratio_var.get()
-        width, height = self.processed_image.size
-        
         if ratio == "Original":
             return
-        elif ratio == "1:1":
-            size = min(width, height)
-            new_width, new_height = size, size
-        elif ratio == "4:3":
-            if width > height:
-                new_height = height
-                new_width = int(height * 4 / 3)
-            else:
-                new_width = width
-                new_height = int(width * 3 / 4)
-        elif ratio == "16:9":
-            if width > height:
-                new_height = height
-                new_width = int(height * 16 / 9)
-            else:
-                new_width = width
-                new_height = int(width * 9 / 16)
-        elif ratio == "3:2":
-            if width > height:
-                new_height = height
-                new_width = int(height * 3 / 2)
-            else:
-                new_width = width
-                new_height = int(width * 2 / 3)
-        else:
-            return
             
         # Center crop
-        left = (width - new_width) // 2
-        top = (height - new_height) // 2
-        right = left + new_width
-        bottom = top + new_height
-        
-        self.processed_image = self.processed_image.crop((left, top, right, bottom))
-        self.display_preview()
+        self.apply_operation(crop_to_ratio(ratio))
         messagebox.showinfo("Success", f"Image cropped to {ratio} aspect ratio")
         
     def add_watermark(self):
-        if not self.processed_image:
+        if not self.history:
             messagebox.showwarning("Warning", "No image loaded")
             return
             
         try:
-            # Create a copy for watermarking
-            watermarked = self.processed_image.copy()
-            draw = ImageDraw.Draw(watermarked)
-            
             text = self.watermark_text_var.get()
             position = self.watermark_pos_var.get()
             
-            # Try to load a font, fallback to default if not available
-            try:
-                font_size = max(20, min(watermarked.width, watermarked.height) // 20)
-                font = ImageFont.truetype("arial.ttf", font_size)
-            except:
-                font = ImageFont.load_default()
-            
-            # Get text size
-            bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-            
-            # Calculate position
-            margin = 20
-            if position == "Top Left":
-                x, y = margin, margin
-            elif position == "Top Right":
-                x, y = watermarked.width - text_width - margin, margin
-            elif position == "Bottom Left":
-                x, y = margin, watermarked.height - text_height - margin
-            elif position == "Bottom Right":
-                x, y = watermarked.width - text_width - margin, watermarked.height - text_height - margin
-            else:  # Center
-                x, y = (watermarked.width - text_width) // 2, (watermarked.height - text_height) // 2
-            
-            # Add semi-transparent background
-            overlay = Image.new('RGBA', watermarked.size, (255, 255, 255, 0))
-            overlay_draw = ImageDraw.Draw(overlay)
-            overlay_draw.rectangle([x-5, y-5, x+text_width+5, y+text_height+5], 
-                                 fill=(0, 0, 0, 128))
-            overlay_draw.text((x, y), text, font=font, fill=(255, 255, 255, 200))
-            
-            # Composite the overlay
-            if watermarked.mode != 'RGBA':
-                watermarked = watermarked.convert('RGBA')
-            watermarked = Image.alpha_composite(watermarked, overlay)
-            
-            if watermarked.mode == 'RGBA':
-                watermarked = watermarked.convert('RGB')
-                
-            self.processed_image = watermarked
-            self.display_preview()
+            # Only the area under the text is composited, not a full-size overlay
+            self.apply_operation(watermark(text, position))
             messagebox.showinfo("Success", "Watermark added successfully")
             
         except Exception as e:
             messagebox.showerror("Error", f"Failed to add watermark: {str(e)}")
             
     def extract_color_palette(self):
-        if not self.processed_image:
+        if not self.history:
             messagebox.showwarning("Warning", "No image loaded")
             return
             
         try:
-            # Convert image to RGB and get pixels
-            rgb_img = self.processed_image.convert('RGB')
-            pixels = list(rgb_img.getdata())
-            
             # Get most common colors
-            color_counts = Counter(pixels)
-            most_common = color_counts.most_common(10)
+            palette = extract_color_palette(self.processed_image, 10)
             
             # Create palette display
             palette_window = tk.Toplevel(self.root)
@@ -736,9 +677,8 @@ class EnhancedImageManipulator:
             palette_window.geometry("600x400")
             
             info_text = "Top 10 Most Common Colors:\n\n"
-            for i, (color, count) in enumerate(most_common):
-                percentage = (count / len(pixels)) * 100
-                info_text += f"{i+1}. RGB{color} - {percentage:.2f}% ({count} pixels)\n"
+            for i, color_info in enumerate(palette):
+                info_text += f"{i+1}. RGB{color_info['color']} - {color_info['percentage']:.2f}% ({color_info['count']} pixels)\n"
             
             text_widget = scrolledtext.ScrolledText(palette_window, wrap=tk.WORD)
             text_widget.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -748,7 +688,7 @@ class EnhancedImageManipulator:
             messagebox.showerror("Error", f"Failed to extract color palette: {str(e)}")
             
     def show_histogram(self):
-        if not self.processed_image:
+        if not self.history:
             messagebox.showwarning("Warning", "No image loaded")
             return
             
@@ -777,7 +717,7 @@ class EnhancedImageManipulator:
             messagebox.showerror("Error", f"Failed to show histogram: {str(e)}")
             
     def detect_and_blur_faces(self):
-        if not self.processed_image:
+        if not self.history:
             messagebox.showwarning("Warning", "No image loaded")
             return
             
@@ -855,37 +795,19 @@ class EnhancedImageManipulator:
             width = int(self.width_var.get())
             height = int(self.height_var.get())
             maintain_aspect = self.maintain_aspect_var.get()
-            
-            progress_window = self.create_progress_window("Batch Resize", len(self.batch_files))
-            
-            for i, file_path in enumerate(self.batch_files):
-                try:
-                    with Image.open(file_path) as img:
-                        if maintain_aspect:
-                            img.thumbnail((width, height), Image.Resampling.LANCZOS)
-                        else:
-                            img = img.resize((width, height), Image.Resampling.LANCZOS)
-                        
-                        output_path = Path(target_dir) / f"resized_{Path(file_path).name}"
-                        
-                        # Handle format conversion for saving
-                        if img.mode in ('RGBA', 'LA', 'P') and output_path.suffix.lower() in ['.jpg', '.jpeg']:
-                            background = Image.new('RGB', img.size, (255, 255, 255))
-                            if img.mode in ('RGBA', 'LA'):
-                                background.paste(img, mask=img.split()[-1])
-                            else:
-                                background.paste(img)
-                            img = background
-                        
-                        img.save(output_path, quality=95 if output_path.suffix.lower() in ['.jpg', '.jpeg'] else None)
-                        
-                except Exception as e:
-                    print(f"Error processing {file_path}: {str(e)}")
+            draft = self.fast_decode_var.get()
+            
+            jobs = []
+            for file_path in self.batch_files:
+                output_path = Path(target_dir) / f"resized_{Path(file_path).name}"
+                save_kwargs = {'quality': 95} if output_path.suffix.lower() in ['.jpg', '.jpeg'] else {}
+                pipeline = Pipeline([
+                    resize(width, height, maintain_aspect=maintain_aspect, draft=draft),
+                    encode(**save_kwargs)
+                ])
+                jobs.append((file_path, pipeline, output_path))
                 
-                self.update_progress(progress_window, i + 1)
-                
-            progress_window.destroy()
-            messagebox.showinfo("Success", f"Batch resize completed. Files saved to {target_dir}")
+            self.run_batch("Batch Resize", jobs, f"Batch resize completed. Files saved to {target_dir}")
             
         except ValueError:
             messagebox.showerror("Error", "Please enter valid width and height values")
@@ -905,36 +827,14 @@ class EnhancedImageManipulator:
         if target_format == 'jpeg':
             target_format = 'jpg'
             
-        progress_window = self.create_progress_window("Batch Convert", len(self.batch_files))
+        save_kwargs = {}
+        if target_format in ['jpg', 'jpeg']:
+            save_kwargs['quality'] = 95
+        pipeline = Pipeline([encode(**save_kwargs)])
         
-        for i, file_path in enumerate(self.batch_files):
-            try:
-                with Image.open(file_path) as img:
-                    output_path = Path(target_dir) / f"{Path(file_path).stem}.{target_format}"
-                    
-                    # Handle format conversion
-                    if target_format in ['jpg', 'jpeg'] and img.mode in ('RGBA', 'LA', 'P'):
-                        background = Image.new('RGB', img.size, (255, 255, 255))
-                        if img.mode in ('RGBA', 'LA'):
-                            background.paste(img, mask=img.split()[-1])
-                        else:
-                            background.paste(img)
-                        img = background
-                    
-                    save_kwargs = {}
-                    if target_format in ['jpg', 'jpeg']:
-                        save_kwargs['quality'] = 95
-                        save_kwargs['optimize'] = True
-                    
-                    img.save(output_path, **save_kwargs)
-                    
-            except Exception as e:
-                print(f"Error processing {file_path}: {str(e)}")
-            
-            self.update_progress(progress_window, i + 1)
-            
-        progress_window.destroy()
-        messagebox.showinfo("Success", f"Batch conversion completed. Files saved to {target_dir}")
+        jobs = [(file_path, pipeline, Path(target_dir) / f"{Path(file_path).stem}.{target_format}")
+                for file_path in self.batch_files]
+        self.run_batch("Batch Convert", jobs, f"Batch conversion completed. Files saved to {target_dir}")
         
     def batch_compress(self):
         if not self.batch_files:
@@ -946,32 +846,31 @@ class EnhancedImageManipulator:
             return
             
         quality = 85  # Default compression quality
+        target = simpledialog.askstring("Batch Compress", "Maximum size per image, e.g. 200KB "
+                                        "(leave empty for quality 85):", parent=self.root)
+        if target is None:
+            return
+        try:
+            max_bytes = parse_byte_size(target) if target.strip() else None
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
         
-        progress_window = self.create_progress_window("Batch Compress", len(self.batch_files))
+        # Convert to RGB if needed for JPEG compression; one pipeline is shared by all files so
+        # the quality search of each image starts from the quality found for the previous ones
+        if max_bytes:
+            pipeline = Pipeline([flatten(), encode(max_bytes=max_bytes, profile="max")])
+        else:
+            pipeline = Pipeline([flatten(), encode(quality=quality, profile="max")])
         
-        for i, file_path in enumerate(self.batch_files):
-            try:
-                with Image.open(file_path) as img:
-                    output_path = Path(target_dir) / f"compressed_{Path(file_path).name}"
-                    
-                    # Convert to RGB if needed for JPEG compression
-                    if img.mode in ('RGBA', 'LA', 'P'):
-                        background = Image.new('RGB', img.size, (255, 255, 255))
-                        if img.mode in ('RGBA', 'LA'):
-                            background.paste(img, mask=img.split()[-1])
-                        else:
-                            background.paste(img)
-                        img = background
-                    
-                    img.save(output_path, quality=quality, optimize=True)
-                    
-            except Exception as e:
-                print(f"Error processing {file_path}: {str(e)}")
-            
-            self.update_progress(progress_window, i + 1)
-            
-        progress_window.destroy()
-        messagebox.showinfo("Success", f"Batch compression completed. Files saved to {target_dir}")
+        jobs = []
+        for file_path in self.batch_files:
+            output_name = f"compressed_{Path(file_path).name}"
+            if max_bytes and FORMAT_MAP.get(Path(file_path).suffix.lower()) not in SEARCH_FORMATS:
+                # Only JPEG and WebP have a quality to search, other formats are saved as JPEG
+                output_name = f"compressed_{Path(file_path).stem}.jpg"
+            jobs.append((file_path, pipeline, Path(target_dir) / output_name))
+        self.run_batch("Batch Compress", jobs, f"Batch compression completed. Files saved to {target_dir}")
         
     def batch_apply_filter(self):
         if not self.batch_files:
@@ -986,10 +885,8 @@ class EnhancedImageManipulator:
         ttk.Label(filter_window, text="Select filter to apply:").pack(pady=10)
         
         filter_var = tk.StringVar(value="Grayscale")
-        filters = ["Grayscale", "Sepia", "Blur", "Gaussian Blur", "Edge Enhance", 
-                  "Emboss", "Find Edges", "Vintage", "Cool", "Warm"]
         
-        for filter_name in filters:
+        for filter_name in FILTER_NAMES:
             ttk.Radiobutton(filter_window, text=filter_name, variable=filter_var, 
                            value=filter_name).pack(anchor=tk.W, padx=20)
         
@@ -998,115 +895,163 @@ class EnhancedImageManipulator:
             if not target_dir:
                 return
                 
+            filter_name = filter_var.get()
             filter_window.destroy()
             
-            progress_window = self.create_progress_window("Batch Filter", len(self.batch_files))
-            
-            for i, file_path in enumerate(self.batch_files):
-                try:
-                    with Image.open(file_path) as img:
-                        # Apply selected filter
-                        filtered_img = self.apply_filter_to_image(img.copy(), filter_var.get())
-                        
-                        output_path = Path(target_dir) / f"filtered_{Path(file_path).name}"
-                        
-                        # Save with appropriate format handling
-                        if filtered_img.mode in ('RGBA', 'LA', 'P') and output_path.suffix.lower() in ['.jpg', '.jpeg']:
-                            background = Image.new('RGB', filtered_img.size, (255, 255, 255))
-                            if filtered_img.mode in ('RGBA', 'LA'):
-                                background.paste(filtered_img, mask=filtered_img.split()[-1])
-                            else:
-                                background.paste(filtered_img)
-                            filtered_img = background
-                        
-                        filtered_img.save(output_path, quality=95 if output_path.suffix.lower() in ['.jpg', '.jpeg'] else None)
-                        
-                except Exception as e:
-                    print(f"Error processing {file_path}: {str(e)}")
+            jobs = []
+            for file_path in self.batch_files:
+                output_path = Path(target_dir) / f"filtered_{Path(file_path).name}"
+                save_kwargs = {'quality': 95} if output_path.suffix.lower() in ['.jpg', '.jpeg'] else {}
+                pipeline = Pipeline([apply_filter(filter_name), encode(**save_kwargs)])
+                jobs.append((file_path, pipeline, output_path))
                 
-                self.update_progress(progress_window, i + 1)
-                
-            progress_window.destroy()
-            messagebox.showinfo("Success", f"Batch filter applied. Files saved to {target_dir}")
+            self.run_batch("Batch Filter", jobs, f"Batch filter applied. Files saved to {target_dir}")
         
         ttk.Button(filter_window, text="Apply Filter", command=apply_batch_filter).pack(pady=20)
         
     def apply_filter_to_image(self, img, filter_name):
-        if filter_name == "Grayscale":
-            return img.convert('L').convert('RGB')
-        elif filter_name == "Sepia":
-            img_array = np.array(img)
-            sepia_filter = np.array([
-                [0.393, 0.769, 0.189],
-                [0.349, 0.686, 0.168],
-                [0.272, 0.534, 0.131]
-            ])
-            sepia_img = img_array.dot(sepia_filter.T)
-            sepia_img = np.clip(sepia_img, 0, 255).astype(np.uint8)
-            return Image.fromarray(sepia_img)
-        elif filter_name == "Blur":
-            return img.filter(ImageFilter.BLUR)
-        elif filter_name == "Gaussian Blur":
-            return img.filter(ImageFilter.GaussianBlur(radius=2))
-        elif filter_name == "Edge Enhance":
-            return img.filter(ImageFilter.EDGE_ENHANCE)
-        elif filter_name == "Emboss":
-            return img.filter(ImageFilter.EMBOSS)
-        elif filter_name == "Find Edges":
-            return img.filter(ImageFilter.FIND_EDGES)
-        elif filter_name == "Vintage":
-            # Apply sepia
-            img_array = np.array(img)
-            sepia_filter = np.array([
-                [0.393, 0.769, 0.189],
-                [0.349, 0.686, 0.168],
-                [0.272, 0.534, 0.131]
-            ])
-            sepia_img = img_array.dot(sepia_filter.T)
-            sepia_img = np.clip(sepia_img, 0, 255).astype(np.uint8)
-            vintage_img = Image.fromarray(sepia_img)
-            
-            # Add blur and reduce contrast
-            vintage_img = vintage_img.filter(ImageFilter.GaussianBlur(radius=0.5))
-            enhancer = ImageEnhance.Contrast(vintage_img)
-            return enhancer.enhance(0.9)
-        elif filter_name == "Cool":
-            img_array = np.array(img).astype(float)
-            img_array[:, :, 0] *= 0.8  # Reduce red
-            img_array[:, :, 2] *= 1.2  # Boost blue
-            img_array = np.clip(img_array, 0, 255).astype(np.uint8)
-            return Image.fromarray(img_array)
-        elif filter_name == "Warm":
-            img_array = np.array(img).astype(float)
-            img_array[:, :, 0] *= 1.2  # Boost red
-            img_array[:, :, 1] *= 1.1  # Boost green slightly
-            img_array[:, :, 2] *= 0.8  # Reduce blue
-            img_array = np.clip(img_array, 0, 255).astype(np.uint8)
-            return Image.fromarray(img_array)
+        return apply_named_filter(img, filter_name)
+            
+    def run_batch(self, title, jobs, success_message):
+        """Run (file_path, pipeline, output_path) jobs on a worker pool without blocking the mainloop"""
+        progress_window = self.create_progress_window(title, len(jobs))
+        progress_queue = queue.Queue()
+        
+        worker = threading.Thread(
+            target=self.batch_worker,
+            args=(jobs, progress_queue, progress_window.pause_event, progress_window.cancel_event),
+            daemon=True
+        )
+        worker.start()
+        
+        self.root.after(100, self.poll_batch_progress, progress_window, progress_queue, success_message)
+        
+    def batch_worker(self, jobs, progress_queue, pause_event, cancel_event):
+        # Runs on a background thread: no Tk calls here, only messages on progress_queue.
+        # Pillow releases the GIL while decoding, resampling and encoding, so threads scale with cores.
+        workers = os.cpu_count() or 1
+        remaining = iter(jobs)
+        exhausted = False
+        pending = {}
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                # Keep the pool busy unless paused or cancelled, with a bounded number in flight
+                while not (exhausted or cancel_event.is_set() or pause_event.is_set()) and len(pending) < workers * 2:
+                    job = next(remaining, None)
+                    if job is None:
+                        exhausted = True
+                        break
+                    file_path, pipeline, output_path = job
+                    pending[executor.submit(self.run_batch_job, file_path, pipeline, output_path)] = file_path
+                    
+                if not pending:
+                    if exhausted or cancel_event.is_set():
+                        break
+                    # Paused: idle until resumed or cancelled
+                    cancel_event.wait(0.1)
+                    continue
+                    
+                done, _ = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_path = pending.pop(future)
+                    progress_queue.put(('progress', file_path, future.exception()))
+                    
+        progress_queue.put(('finished', cancel_event.is_set()))
+        
+    def run_batch_job(self, file_path, pipeline, output_path):
+        """Run one batch job on the decoded image from the image cache, so a file that was viewed
+        or processed by another batch operation is not decoded again. A leading draft resize of
+        a file that is not cached reads the file itself, the reduced-scale decode is faster"""
+        key = file_key(file_path)
+        first = pipeline.operations[0] if pipeline.operations else None
+        if key not in self.image_cache and first is not None and first.name == 'resize' and first.params['draft']:
+            return pipeline.run(file_path, output_path)
+        return pipeline.run(self.image_cache.get_or_compute(key, decode_file, file_path), output_path)
+        
+    def poll_batch_progress(self, progress_window, progress_queue, success_message):
+        finished = cancelled = False
+        try:
+            while True:
+                message = progress_queue.get_nowait()
+                if message[0] == 'progress':
+                    _, file_path, error = message
+                    progress_window.completed += 1
+                    if error is not None:
+                        progress_window.errors += 1
+                        print(f"Error processing {file_path}: {str(error)}")
+                else:
+                    finished, cancelled = True, message[1]
+        except queue.Empty:
+            pass
+            
+        if progress_window.winfo_exists():
+            progress_window.progress_var.set(progress_window.completed)
+            status = f"Processed {progress_window.completed}/{progress_window.total} files"
+            if progress_window.pause_event.is_set() and not finished:
+                status += " (paused)"
+            progress_window.status_var.set(status)
+            
+        if not finished:
+            self.root.after(100, self.poll_batch_progress, progress_window, progress_queue, success_message)
+            return
+            
+        completed, errors = progress_window.completed, progress_window.errors
+        if progress_window.winfo_exists():
+            progress_window.destroy()
+            
+        if cancelled:
+            messagebox.showinfo("Cancelled", f"Batch cancelled after {completed} of {progress_window.total} files")
+        elif errors:
+            messagebox.showwarning("Warning", f"{success_message}\n{errors} file(s) failed, see console for details")
         else:
-            return img
+            messagebox.showinfo("Success", success_message)
             
     def create_progress_window(self, title, total):
         progress_window = tk.Toplevel(self.root)
         progress_window.title(title)
-        progress_window.geometry("400x100")
+        progress_window.geometry("400x140")
         progress_window.resizable(False, False)
         
-        ttk.Label(progress_window, text=f"Processing {total} files...").pack(pady=10)
+        status_var = tk.StringVar(value=f"Processing {total} files...")
+        ttk.Label(progress_window, textvariable=status_var).pack(pady=10)
         
         progress_var = tk.DoubleVar()
         progress_bar = ttk.Progressbar(progress_window, variable=progress_var, maximum=total)
-        progress_bar.pack(fill=tk.X, padx=20, pady=10)
+        progress_bar.pack(fill=tk.X, padx=20, pady=5)
         
+        progress_window.total = total
+        progress_window.completed = 0
+        progress_window.errors = 0
+        progress_window.status_var = status_var
         progress_window.progress_var = progress_var
         progress_window.progress_bar = progress_bar
+        progress_window.pause_event = threading.Event()
+        progress_window.cancel_event = threading.Event()
         
-        return progress_window
+        buttons_frame = ttk.Frame(progress_window)
+        buttons_frame.pack(pady=5)
         
-    def update_progress(self, progress_window, current):
-        if progress_window and progress_window.winfo_exists():
-            progress_window.progress_var.set(current)
-            progress_window.update()
+        pause_button = ttk.Button(buttons_frame, text="Pause")
+        
+        def toggle_pause():
+            if progress_window.pause_event.is_set():
+                progress_window.pause_event.clear()
+                pause_button.configure(text="Pause")
+            else:
+                progress_window.pause_event.set()
+                pause_button.configure(text="Resume")
+                
+        def cancel():
+            progress_window.cancel_event.set()
+            progress_window.status_var.set("Cancelling...")
+            
+        pause_button.configure(command=toggle_pause)
+        pause_button.pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons_frame, text="Cancel", command=cancel).pack(side=tk.LEFT, padx=5)
+        progress_window.protocol("WM_DELETE_WINDOW", cancel)
+        
+        return progress_window
 
 def main():
     root = tk.Tk()
@@ -0,0 +1,123 @@
+from PIL import Image
+import numpy as np
+
+PALETTE_MODES = ["exact", "quantized", "median_cut", "kmeans"]
+
+# Approximate palette modes work on a downsampled copy of about this many pixels
+PALETTE_SAMPLE_PIXELS = 256 * 256
+
+def pack_rgb(image):
+    """Return the pixels of image as a flat uint32 array of 0xBBGGRR values"""
+    rgb_img = image.convert('RGB')
+    # RGBX is 4 bytes per pixel, so the buffer can be viewed as one uint32 per pixel
+    packed = np.asarray(rgb_img.convert('RGBX')).view('<u4').ravel()
+    return packed & 0xFFFFFF
+
+def unpack_rgb(packed):
+    """Inverse of pack_rgb, returning an (n, 3) uint8 array"""
+    packed = np.asarray(packed, dtype=np.uint32)
+    return np.stack([packed & 0xFF, (packed >> 8) & 0xFF, (packed >> 16) & 0xFF], axis=-1).astype(np.uint8)
+
+def sample_image(image, max_pixels=PALETTE_SAMPLE_PIXELS):
+    """Downsample image with a box filter so it has at most about max_pixels pixels"""
+    factor = int((image.width * image.height / max_pixels) ** 0.5)
+    if factor <= 1:
+        return image
+    return image.reduce(factor)
+
+def top_counts(counts, num_colors):
+    """Indices of the num_colors largest non-zero counts, largest first"""
+    # Selecting among the non-zero entries only avoids a slow argpartition over a
+    # mostly empty 16M bin histogram
+    present = np.flatnonzero(counts)
+    num_colors = min(num_colors, len(present))
+    if num_colors <= 0:
+        return present
+    top = present[np.argpartition(counts[present], -num_colors)[-num_colors:]]
+    # Sort by count (descending), breaking ties by index so the result is deterministic
+    return top[np.lexsort((top, -counts[top]))]
+
+def palette_info_from(colors, counts, total_pixels):
+    """Build the [{'color', 'count', 'percentage'}] list shared by the GUIs"""
+    palette_info = []
+    for color, count in zip(colors, counts):
+        palette_info.append({
+            'color': tuple(int(c) for c in color),
+            'count': int(count),
+            'percentage': (int(count) / total_pixels) * 100
+        })
+    return palette_info
+
+def _exact_palette(image, num_colors):
+    packed = pack_rgb(image)
+    if packed.size < (1 << 20):
+        # Sorting is cheaper than a 16M entry histogram for small images
+        values, counts = np.unique(packed, return_counts=True)
+    else:
+        counts = np.bincount(packed, minlength=1 << 24)
+        values = None
+    top = top_counts(counts, num_colors)
+    colors = unpack_rgb(values[top] if values is not None else top)
+    return palette_info_from(colors, counts[top], packed.size)
+
+def _quantized_palette(image, num_colors, bits=4):
+    total_pixels = image.width * image.height
+    sample = np.asarray(sample_image(image).convert('RGB')).reshape(-1, 3)
+    shift = 8 - bits
+    bins = ((sample[:, 0] >> shift).astype(np.uint32) << (2 * bits)) | \
+           ((sample[:, 1] >> shift).astype(np.uint32) << bits) | \
+           (sample[:, 2] >> shift).astype(np.uint32)
+    counts = np.bincount(bins, minlength=1 << (3 * bits))
+    top = top_counts(counts, num_colors)
+    
+    # Report the mean color of each bin rather than its corner
+    colors = np.stack([
+        np.bincount(bins, weights=sample[:, channel], minlength=counts.size)[top] / counts[top]
+        for channel in range(3)
+    ], axis=-1).round()
+    return palette_info_from(colors, counts[top] * total_pixels / len(sample), total_pixels)
+
+def _median_cut_palette(image, num_colors):
+    total_pixels = image.width * image.height
+    sample = sample_image(image).convert('RGB')
+    quantized = sample.quantize(colors=num_colors, method=Image.Quantize.MEDIANCUT)
+    palette = np.array(quantized.getpalette()[:3 * num_colors]).reshape(-1, 3)
+    counts = np.bincount(np.asarray(quantized).ravel(), minlength=len(palette))[:len(palette)]
+    top = top_counts(counts, num_colors)
+    return palette_info_from(palette[top], counts[top] * total_pixels / counts.sum(), total_pixels)
+
+def _kmeans_palette(image, num_colors, iterations=10):
+    total_pixels = image.width * image.height
+    sample = sample_image(image).convert('RGB')
+    pixels = np.asarray(sample, dtype=np.float32).reshape(-1, 3)
+    
+    # Seed with the median cut palette so results are deterministic
+    seed = sample.quantize(colors=num_colors, method=Image.Quantize.MEDIANCUT)
+    centers = np.array(seed.getpalette()[:3 * num_colors], dtype=np.float32).reshape(-1, 3)
+    
+    for _ in range(iterations):
+        distances = ((pixels[:, None, :] - centers[None, :, :]) ** 2).sum(axis=-1)
+        labels = distances.argmin(axis=1)
+        counts = np.bincount(labels, minlength=len(centers))
+        sums = np.stack([np.bincount(labels, weights=pixels[:, c], minlength=len(centers)) for c in range(3)], axis=-1)
+        new_centers = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centers)
+        if np.allclose(new_centers, centers, atol=0.5):
+            centers = new_centers
+            break
+        centers = new_centers
+    
+    top = top_counts(counts, num_colors)
+    return palette_info_from(centers[top].round(), counts[top] * total_pixels / len(pixels), total_pixels)
+
+def extract_color_palette(image, num_colors=10, mode="exact"):
+    """Extract the most common colors of an image as [{'color', 'count', 'percentage'}].
+    mode is one of PALETTE_MODES; all but 'exact' work on a downsampled copy"""
+    if mode == "exact":
+        return _exact_palette(image, num_colors)
+    elif mode == "quantized":
+        return _quantized_palette(image, num_colors)
+    elif mode == "median_cut":
+        return _median_cut_palette(image, num_colors)
+    elif mode == "kmeans":
+        return _kmeans_palette(image, num_colors)
+    raise ValueError(f"Unknown palette mode '{mode}'. Available: {', '.join(PALETTE_MODES)}")
@@ -0,0 +1,79 @@
+import binascii
+
+# Bytes of binary data encoded per block; a multiple of 3 so only the last block is padded
+B64_CHUNK_SIZE = 3 * 1024 * 1024
+
+# Decoded data and re-encoded images are kept in memory up to this size, then spill to a temporary file
+SPOOL_MAX_BYTES = 32 * 1024 * 1024
+
+B64_ALPHABET = b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+B64_WHITESPACE = b' \t\r\n\v\f'
+
+def encode_base64_stream(src, dst, prefix=b'', chunk_size=B64_CHUNK_SIZE):
+    """Base64 encode the binary file object src into dst a block at a time, after an optional
+    prefix such as a data URI header; returns the number of characters written"""
+    chunk_size = max(3, chunk_size - chunk_size % 3)
+    dst.write(prefix)
+    written = len(prefix)
+    
+    pending = b''
+    while True:
+        chunk = src.read(chunk_size)
+        data = pending + chunk if pending else chunk
+        # Short reads (pipes) would put padding in the middle, so only whole groups of 3 are encoded
+        usable = len(data) if not chunk else len(data) - len(data) % 3
+        if usable:
+            encoded = binascii.b2a_base64(data[:usable], newline=False)
+            dst.write(encoded)
+            written += len(encoded)
+        pending = data[usable:]
+        if not chunk:
+            return written
+
+def decode_base64_stream(src, dst, chunk_size=4 * B64_CHUNK_SIZE // 3):
+    """Decode base64 text (optionally a data URI) from the binary file object src into dst a block
+    at a time; whitespace is ignored and the data is validated like base64.b64decode(validate=True).
+    Returns the number of bytes written, raising ValueError for invalid input"""
+    pending = b''
+    header = True
+    padded = False
+    read_any = False
+    written = 0
+    
+    while True:
+        chunk = src.read(chunk_size)
+        eof = not chunk
+        data = pending + chunk.translate(None, B64_WHITESPACE)
+        if header and data:
+            # A data URI header at the start may span blocks, so it is collected until its comma
+            if not eof and len(data) < 256 and b',' not in data and (
+                    data.startswith(b'data:image') or b'data:image'.startswith(data)):
+                pending = data
+                continue
+            header = False
+            if data.startswith(b'data:image'):
+                if b',' not in data:
+                    raise ValueError("Invalid data URI format")
+                data = data.split(b',', 1)[1]
+        
+        read_any = read_any or bool(data)
+        if data.translate(None, B64_ALPHABET + b'='):
+            raise ValueError("Invalid base64 characters found")
+        
+        # Decode whole groups of 4 characters and carry the rest over to the next block
+        usable = len(data) if eof else len(data) - len(data) % 4
+        block, pending = data[:usable], data[usable:]
+        if block:
+            # Padding is only allowed at the very end of the data
+            padding = block.find(b'=')
+            if padded or (padding != -1 and (padding < len(block) - 2 or block[padding:].strip(b'='))):
+                raise binascii.Error("Incorrect padding")
+            padded = padding != -1
+            decoded = binascii.a2b_base64(block)
+            dst.write(decoded)
+            written += len(decoded)
+        
+        if eof:
+            if not read_any:
+                raise ValueError("Empty base64 string")
+            return written
@@ -0,0 +1,116 @@
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from PIL import Image
+
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+
+def content_digest(data):
+    """Stable hash of raw file bytes, used as the root of every cache key"""
+    return hashlib.sha1(data).hexdigest()
+
+def file_key(path):
+    """Cache key of an image file: its resolved path, modification time and size, so a file
+    that changed on disk gets a new key"""
+    path = Path(path).resolve()
+    stat = path.stat()
+    return (str(path), stat.st_mtime_ns, stat.st_size)
+
+def decode_file(path):
+    """Open and fully decode an image file for caching; the result keeps its format and header
+    info (EXIF orientation) and holds no open file"""
+    img = Image.open(path)
+    img.load()
+    if getattr(img, 'fp', None) is not None:
+        # Multi-frame formats keep the file open after load, cache a copy of the frame instead
+        frame = img.copy()
+        frame.format = img.format
+        img.close()
+        img = frame
+    return img
+
+def estimate_nbytes(value):
+    """Approximate memory held by a cached value"""
+    if isinstance(value, Image.Image):
+        return value.width * value.height * len(value.getbands())
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_nbytes(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_nbytes(item) for item in value.values())
+    return sys.getsizeof(value)
+
+class LRUCache:
+    """Thread-safe least recently used cache bounded by the total size of its values.
+    Cached images are shared between callers and must not be modified in place"""
+    
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+    
+    def put(self, key, value):
+        size = estimate_nbytes(value)
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            # Values larger than the whole budget are returned but not kept
+            if size > self.max_bytes:
+                return value
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+        return value
+    
+    def get_or_compute(self, key, func, *args, **kwargs):
+        """Return the cached value for key, computing and storing it on a miss"""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = self.put(key, func(*args, **kwargs))
+        return value
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def __contains__(self, key):
+        return key in self._entries
+    
+    def stats(self):
+        """Hit/miss counters and memory use, for display or logging"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,270 @@
+from functools import lru_cache
+from PIL import Image, ImageFilter
+import numpy as np
+
+FILTER_NAMES = [
+    "Grayscale", "Sepia", "Blur", "Gaussian Blur", "Edge Enhance",
+    "Emboss", "Find Edges", "Vintage", "Cool", "Warm"
+]
+
+SEPIA_MATRIX = (
+    (0.393, 0.769, 0.189),
+    (0.349, 0.686, 0.168),
+    (0.272, 0.534, 0.131)
+)
+
+def apply_color_matrix(image, matrix, offset=(0, 0, 0), tile_height=None):
+    """Transform RGB values by a 3x3 matrix (plus offset) in a single uint8 pass, preserving alpha;
+    tile_height processes the image in horizontal strips to bound the temporary memory"""
+    alpha = image.getchannel('A') if image.mode in ('RGBA', 'LA') else None
+    img = image if image.mode == 'RGB' else image.convert('RGB')
+    
+    # Pillow rounds the result, -0.5 makes it truncate like the old float filters did
+    pillow_matrix = tuple(value for row, row_offset in zip(matrix, offset)
+                          for value in tuple(row) + (row_offset - 0.5,))
+    
+    if not tile_height or tile_height >= img.height:
+        result = img.convert('RGB', pillow_matrix)
+    else:
+        result = Image.new('RGB', img.size)
+        for top in range(0, img.height, tile_height):
+            strip = img.crop((0, top, img.width, min(top + tile_height, img.height)))
+            result.paste(strip.convert('RGB', pillow_matrix), (0, top))
+    
+    if alpha is not None:
+        result = result.convert('RGBA')
+        result.putalpha(alpha)
+    return result
+
+def apply_sepia(image, tile_height=None):
+    """Apply sepia effect"""
+    return apply_color_matrix(image, SEPIA_MATRIX, tile_height=tile_height)
+
+def apply_vintage(image, tile_height=None, contrast=None):
+    """Apply vintage effect; contrast can be a LUTChain bound to the whole image when
+    the image is processed in strips"""
+    # Sepia and blur run on uint8 data in C, the contrast reduction is a single LUT pass. The
+    # contrast cannot be folded into the sepia matrix: sepia clips at 255 before it, and the
+    # GaussianBlur is kept as it is so the output matches the original filter
+    vintage_img = apply_sepia(image, tile_height)
+    vintage_img = vintage_img.filter(ImageFilter.GaussianBlur(radius=0.5))
+    return (contrast or VINTAGE_CONTRAST_LUT).apply(vintage_img)
+
+# ITU-R 601-2 luma weights, as used by Image.convert('L')
+LUMA_WEIGHTS = (0.299, 0.587, 0.114)
+
+class LUTChain:
+    """Chain of per-channel point operations compiled into one 256-entry table per channel
+    and applied in a single Image.point() pass; grayscale splits the chain in two passes"""
+    
+    def __init__(self, steps=()):
+        self.steps = list(steps)
+    
+    def _add(self, *step):
+        return LUTChain(self.steps + [step])
+    
+    def scale(self, red=1.0, green=1.0, blue=1.0):
+        """Multiply each channel by a factor (truncating, like the old float filters)"""
+        return self._add('scale', (red, green, blue))
+    
+    def brightness(self, factor):
+        """Equivalent to ImageEnhance.Brightness(img).enhance(factor)"""
+        return self._add('brightness', factor)
+    
+    def contrast(self, factor):
+        """Equivalent to ImageEnhance.Contrast(img).enhance(factor), around the mean luma at that point"""
+        return self._add('contrast', factor)
+    
+    def grayscale(self):
+        """Convert to luma and back to RGB"""
+        return self._add('grayscale')
+    
+    def bind(self, histogram):
+        """Resolve the contrast means from the histogram of the whole image, so the chain
+        gives the same result when it is later applied to parts of that image"""
+        if any(step[0] == 'grayscale' for step in self.steps):
+            raise ValueError("bind() does not support chains containing grayscale")
+        steps = []
+        for step in self.steps:
+            if step[0] == 'contrast':
+                step = ('contrast', step[1], self._mean(self._compile(steps), histogram))
+            steps.append(step)
+        return LUTChain(steps)
+    
+    def __add__(self, other):
+        return LUTChain(self.steps + other.steps)
+    
+    def tables(self, image):
+        """The compiled (3, 256) uint8 tables for image, reading contrast means from its histogram"""
+        if any(step[0] == 'grayscale' for step in self.steps):
+            raise ValueError("tables() does not support chains containing grayscale")
+        if any(step[0] == 'contrast' and len(step) == 2 for step in self.steps):
+            return self._compile(self.steps, image.histogram())
+        return _static_tables(tuple(self.steps))
+    
+    def _segments(self):
+        # Grayscale cannot be expressed per channel, so it separates LUT passes
+        segment = []
+        for step in self.steps:
+            if step[0] == 'grayscale':
+                yield segment, True
+                segment = []
+            else:
+                segment.append(step)
+        yield segment, False
+    
+    @staticmethod
+    def _compile(steps, histogram=None):
+        tables = np.tile(np.arange(256, dtype=np.float64), (3, 1))
+        for step in steps:
+            if step[0] == 'scale':
+                tables = np.floor(np.clip(tables * np.array(step[1])[:, None], 0, 255))
+            elif step[0] == 'brightness':
+                tables = _blend(0, tables, step[1])
+            elif step[0] == 'contrast':
+                # Mean luma of the image after the previous steps (unless already bound)
+                mean = step[2] if len(step) > 2 else LUTChain._mean(tables, histogram)
+                tables = _blend(mean, tables, step[1])
+        return tables.astype(np.uint8)
+    
+    @staticmethod
+    def _mean(tables, histogram):
+        # Read from the input histogram mapped through the tables, with one histogram
+        # row per channel, or a single row after grayscale
+        counts = np.asarray(histogram, dtype=np.float64).reshape(-1, 256)[:3]
+        channel_means = (tables * counts).sum(axis=1) / counts.sum(axis=1)
+        return int(np.dot(channel_means, LUMA_WEIGHTS) + 0.5)
+    
+    def apply(self, image):
+        """Apply the chain to an image, preserving its alpha channel"""
+        alpha = image.getchannel('A') if image.mode in ('RGBA', 'LA') else None
+        img = image if image.mode == 'RGB' else image.convert('RGB')
+        
+        for steps, to_grayscale in self._segments():
+            if steps:
+                if any(step[0] == 'contrast' and len(step) == 2 for step in steps):
+                    tables = self._compile(steps, img.histogram())
+                else:
+                    tables = _static_tables(tuple(steps))
+                if img.mode == 'L':
+                    img = Image.merge('RGB', [img.point(table.tolist()) for table in tables])
+                else:
+                    img = img.point(tables.ravel().tolist())
+            if to_grayscale:
+                img = img.convert('L')
+        
+        if img.mode == 'L':
+            img = img.convert('RGB')
+        if alpha is not None:
+            img = img.convert('RGBA')
+            img.putalpha(alpha)
+        return img
+
+def _blend(degenerate, values, factor):
+    # Same single precision arithmetic and truncation as Image.blend(), which ImageEnhance uses
+    degenerate = np.float32(degenerate)
+    blended = degenerate + np.float32(factor) * (np.asarray(values, dtype=np.float32) - degenerate)
+    return np.clip(np.trunc(blended), 0, 255).astype(np.float64)
+
+@lru_cache(maxsize=64)
+def _static_tables(steps):
+    # Tables that do not depend on the image are only built once per chain
+    return LUTChain._compile(steps)
+
+COOL_LUT = LUTChain().scale(red=0.8, blue=1.2)
+WARM_LUT = LUTChain().scale(red=1.2, green=1.1, blue=0.8)
+GRAYSCALE_LUT = LUTChain().grayscale()
+VINTAGE_CONTRAST_LUT = LUTChain().contrast(0.9)
+
+# Filters that are pure point operations and can share a single LUT pass
+LUT_FILTERS = {"Grayscale": GRAYSCALE_LUT, "Cool": COOL_LUT, "Warm": WARM_LUT}
+
+# ImageEnhance.Sharpness blends with ImageFilter.SMOOTH
+SMOOTH_WEIGHTS = (1, 1, 1, 1, 5, 1, 1, 1, 1)
+
+def saturation_matrix(factor):
+    """Color matrix equivalent to ImageEnhance.Color(img).enhance(factor)"""
+    return tuple(tuple(factor * (row == column) + (1 - factor) * LUMA_WEIGHTS[column] for column in range(3))
+                 for row in range(3))
+
+def sharpness_kernel(factor):
+    """3x3 kernel equivalent to ImageEnhance.Sharpness(img).enhance(factor)"""
+    weights = [(1 - factor) * weight / sum(SMOOTH_WEIGHTS) for weight in SMOOTH_WEIGHTS]
+    weights[4] += factor
+    return ImageFilter.Kernel((3, 3), weights, scale=1)
+
+def apply_enhancements(image, brightness=1.0, contrast=1.0, saturation=1.0, sharpness=1.0):
+    """Same as chaining ImageEnhance Brightness, Contrast, Color and Sharpness (factors of 1.0 are
+    skipped), in one LUT pass, one color matrix pass and one convolution instead of four blends"""
+    alpha = image.getchannel('A') if image.mode in ('RGBA', 'LA') else None
+    img = image if image.mode in ('L', 'RGB') else image.convert('L' if image.mode == 'LA' else 'RGB')
+    
+    # Brightness and contrast are per channel, so they compile into one table per channel
+    chain = LUTChain()
+    if brightness != 1.0:
+        chain = chain.brightness(brightness)
+    if contrast != 1.0:
+        chain = chain.contrast(contrast)
+    if chain.steps:
+        tables = chain.tables(img)
+        img = img.point((tables[0] if img.mode == 'L' else tables.ravel()).tolist())
+    
+    # Saturation mixes the channels with their luma, which leaves grayscale images unchanged
+    if saturation != 1.0 and img.mode == 'RGB':
+        img = apply_color_matrix(img, saturation_matrix(saturation))
+    
+    if sharpness != 1.0:
+        img = img.filter(sharpness_kernel(sharpness))
+    
+    if alpha is not None:
+        img = img.convert('RGBA' if img.mode == 'RGB' else 'LA')
+        img.putalpha(alpha)
+    return img
+
+def apply_cool_filter(image):
+    """Apply cool color filter"""
+    return COOL_LUT.apply(image)
+
+def apply_warm_filter(image):
+    """Apply warm color filter"""
+    return WARM_LUT.apply(image)
+
+def apply_named_filter(image, filter_name):
+    """Apply one of FILTER_NAMES to an image and return the result"""
+    if filter_name == "Grayscale":
+        return image.convert('L').convert('RGB')
+    elif filter_name == "Sepia":
+        return apply_sepia(image)
+    elif filter_name == "Blur":
+        return image.filter(ImageFilter.BLUR)
+    elif filter_name == "Gaussian Blur":
+        return image.filter(ImageFilter.GaussianBlur(radius=2))
+    elif filter_name == "Edge Enhance":
+        return image.filter(ImageFilter.EDGE_ENHANCE)
+    elif filter_name == "Emboss":
+        return image.filter(ImageFilter.EMBOSS)
+    elif filter_name == "Find Edges":
+        return image.filter(ImageFilter.FIND_EDGES)
+    elif filter_name == "Vintage":
+        return apply_vintage(image)
+    elif filter_name == "Cool":
+        return apply_cool_filter(image)
+    elif filter_name == "Warm":
+        return apply_warm_filter(image)
+    else:
+        return image
+
+def apply_named_filters(image, filter_names):
+    """Apply several FILTER_NAMES in order, fusing consecutive point filters into one LUT pass"""
+    chain = None
+    for filter_name in filter_names:
+        if filter_name in LUT_FILTERS:
+            chain = LUT_FILTERS[filter_name] if chain is None else chain + LUT_FILTERS[filter_name]
+            continue
+        if chain is not None:
+            image = chain.apply(image)
+            chain = None
+        image = apply_named_filter(image, filter_name)
+    if chain is not None:
+        image = chain.apply(image)
+    return image
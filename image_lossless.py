@@ -0,0 +1,185 @@
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+from pathlib import Path
+from PIL import Image, JpegImagePlugin
+from image_metadata import header_exif
+from image_pipeline import FORMAT_MAP, ORIENTATION_TRANSPOSE, EXIF_ORIENTATION, encoder_options, flatten_alpha
+
+# jpegtran (libjpeg-turbo) transforms JPEGs in the DCT domain without decoding them; without it
+# JPEGs are transposed in memory and re-encoded with their own quantization tables
+JPEGTRAN = shutil.which('jpegtran')
+
+# Image.rotate angles (counter-clockwise) that are a transpose of the pixels
+ROTATE_TRANSPOSE = {
+    90: Image.Transpose.ROTATE_90,
+    180: Image.Transpose.ROTATE_180,
+    270: Image.Transpose.ROTATE_270,
+}
+
+# jpegtran arguments for each transpose; its rotations are clockwise
+JPEGTRAN_TRANSFORMS = {
+    Image.Transpose.FLIP_LEFT_RIGHT: ['-flip', 'horizontal'],
+    Image.Transpose.FLIP_TOP_BOTTOM: ['-flip', 'vertical'],
+    Image.Transpose.ROTATE_90: ['-rotate', '270'],
+    Image.Transpose.ROTATE_180: ['-rotate', '180'],
+    Image.Transpose.ROTATE_270: ['-rotate', '90'],
+    Image.Transpose.TRANSPOSE: ['-transpose'],
+    Image.Transpose.TRANSVERSE: ['-transverse'],
+}
+
+# MCU size in pixels for each JpegImagePlugin.get_sampling value (4:4:4, 4:2:2, 4:2:0)
+JPEG_MCU_SIZES = {0: (8, 8), 1: (16, 8), 2: (16, 16)}
+
+def rotation_transpose(angle):
+    """Transpose equivalent to Image.rotate(angle, expand=True), None unless angle is a
+    non-zero multiple of 90 degrees"""
+    if angle % 90:
+        return None
+    return ROTATE_TRANSPOSE.get(int(angle) % 360)
+
+def jpeg_mcu_size(img):
+    """Size of the minimum coded unit of an opened JPEG, None for unusual samplings"""
+    if img.mode == 'L':
+        return (8, 8)
+    return JPEG_MCU_SIZES.get(JpegImagePlugin.get_sampling(img))
+
+def run_jpegtran(args, source_path, output_path):
+    """Transform a JPEG file with jpegtran, keeping all metadata; False if jpegtran is missing or
+    the transform is not exact (-perfect refuses partial MCUs at the edges)"""
+    if not JPEGTRAN:
+        return False
+    
+    # Write next to the output and rename, so the source can also be the output
+    fd, temp_path = tempfile.mkstemp(suffix='.jpg', dir=Path(output_path).parent)
+    os.close(fd)
+    try:
+        result = subprocess.run([JPEGTRAN, '-copy', 'all', '-perfect', *args, '-outfile', temp_path,
+                                 str(source_path)], capture_output=True)
+        if result.returncode != 0:
+            return False
+        os.replace(temp_path, output_path)
+        return True
+    finally:
+        Path(temp_path).unlink(missing_ok=True)
+
+def set_jpeg_orientation(path, orientation=1):
+    """Overwrite the EXIF orientation tag of a JPEG file in place, without rewriting the file;
+    returns False if the file has no orientation tag"""
+    with open(path, 'r+b') as f:
+        if f.read(2) != b'\xff\xd8':
+            return False
+        while True:
+            marker, length = struct.unpack('>2sH', f.read(4))
+            if marker[0] != 0xff or marker[1] == 0xda:
+                return False
+            segment_start = f.tell()
+            if marker[1] == 0xe1 and f.read(6) == b'Exif\x00\x00':
+                break
+            f.seek(segment_start + length - 2)
+        
+        tiff_start = f.tell()
+        order = '<' if f.read(2) == b'II' else '>'
+        f.seek(2, os.SEEK_CUR)
+        f.seek(tiff_start + struct.unpack(order + 'I', f.read(4))[0])
+        for _ in range(struct.unpack(order + 'H', f.read(2))[0]):
+            tag, value_type = struct.unpack(order + 'HH', f.read(4))
+            if tag == EXIF_ORIENTATION and value_type == 3:
+                # A single SHORT is stored left aligned in the 4 byte value field
+                f.seek(4, os.SEEK_CUR)
+                f.write(struct.pack(order + 'H', orientation))
+                return True
+            f.seek(8, os.SEEK_CUR)
+    return False
+
+def _jpeg_keep_options(img):
+    """Save options that re-encode a JPEG with its own quantization tables and subsampling, so a
+    pixel-exact transform of whole MCUs loses almost nothing"""
+    options = {'qtables': img.quantization}
+    sampling = JpegImagePlugin.get_sampling(img)
+    if sampling != -1:
+        options['subsampling'] = sampling
+    return options
+
+def _save_transformed(img, result, output_path, output_format, profile, reset_orientation=False):
+    """Encode the transformed copy of img, keeping its EXIF (with the orientation reset to 1 if
+    asked) and ICC profile"""
+    save_kwargs = {}
+    exif = header_exif(img)
+    if reset_orientation and exif.get(EXIF_ORIENTATION, 1) != 1:
+        exif[EXIF_ORIENTATION] = 1
+        save_kwargs['exif'] = exif.tobytes()
+    elif img.info.get('exif'):
+        save_kwargs['exif'] = img.info['exif']
+    if img.info.get('icc_profile'):
+        save_kwargs['icc_profile'] = img.info['icc_profile']
+    
+    if output_format == 'JPEG':
+        result = flatten_alpha(result)
+        if img.format == 'JPEG' and img.mode == result.mode:
+            save_kwargs.update(_jpeg_keep_options(img))
+        else:
+            save_kwargs['quality'] = 95
+    result.save(output_path, format=output_format, **encoder_options(output_format, profile, **save_kwargs))
+
+def transpose_file(image_path, output_path, method, reset_orientation=False, profile=None):
+    """Flip or rotate an image file by a multiple of 90 degrees. JPEG to JPEG uses jpegtran when
+    it can do so exactly, otherwise the pixels are transposed (no resampling) and JPEGs are
+    re-encoded with their own tables. The EXIF is kept with its orientation reset to 1, since a
+    viewer would otherwise apply it on top of the new pixels; method None with reset_orientation
+    only resets the tag. Returns 'lossless' or 'transpose'"""
+    reset_orientation = reset_orientation or method is not None
+    output_format = FORMAT_MAP.get(Path(output_path).suffix.lower())
+    with Image.open(image_path) as img:
+        output_format = output_format or img.format
+        if img.format == 'JPEG' and output_format == 'JPEG':
+            if method is None:
+                if Path(image_path).resolve() != Path(output_path).resolve():
+                    shutil.copyfile(image_path, output_path)
+                done = True
+            else:
+                done = run_jpegtran(JPEGTRAN_TRANSFORMS[method], image_path, output_path)
+            if done and reset_orientation and not set_jpeg_orientation(output_path, 1):
+                # The tag could not be patched in place, so it is only safe if there is none
+                with Image.open(output_path) as written:
+                    done = header_exif(written).get(EXIF_ORIENTATION, 1) == 1
+            if done:
+                return 'lossless'
+        
+        result = img.transpose(method) if method is not None else img
+        _save_transformed(img, result, output_path, output_format, profile, reset_orientation)
+        return 'transpose'
+
+def auto_orient_file(image_path, output_path, profile=None):
+    """Apply the EXIF orientation of an image file to its pixels and reset the tag; returns the
+    orientation found and how it was applied (None if the image was already upright)"""
+    with Image.open(image_path) as img:
+        orientation = header_exif(img).get(EXIF_ORIENTATION, 1)
+    method = ORIENTATION_TRANSPOSE.get(orientation)
+    if method is None:
+        return orientation, None
+    return orientation, transpose_file(image_path, output_path, method, reset_orientation=True, profile=profile)
+
+def crop_file(image_path, output_path, box, profile=None):
+    """Crop an image file to box (left, upper, right, lower). JPEG to JPEG crops starting on an
+    MCU boundary are done losslessly with jpegtran; returns 'lossless' or 'crop'"""
+    left, upper, right, lower = box
+    output_format = FORMAT_MAP.get(Path(output_path).suffix.lower())
+    with Image.open(image_path) as img:
+        output_format = output_format or img.format
+        if not (0 <= left < right <= img.width and 0 <= upper < lower <= img.height):
+            raise ValueError(f"Crop box {box} is outside the {img.width}x{img.height} image")
+        
+        if img.format == 'JPEG' and output_format == 'JPEG':
+            # jpegtran moves an unaligned corner up and left to the MCU boundary, so only
+            # aligned crops are exact
+            mcu = jpeg_mcu_size(img)
+            if mcu and left % mcu[0] == 0 and upper % mcu[1] == 0:
+                args = ['-crop', f"{right - left}x{lower - upper}+{left}+{upper}"]
+                if run_jpegtran(args, image_path, output_path):
+                    return 'lossless'
+        
+        _save_transformed(img, img.crop(box), output_path, output_format, profile)
+        return 'crop'
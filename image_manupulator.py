@@ -1,17 +1,34 @@
-import base64
+import binascii
 from PIL import Image, ImageOps, ImageEnhance
-from PIL.ExifTags import TAGS, GPSTAGS
 import io
 import os
 import json
 import sys
+import glob
+import time
+import argparse
+import shutil
+import tempfile
 from pathlib import Path
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, wait, as_completed, FIRST_COMPLETED
 import pillow_heif
+from image_pipeline import (Pipeline, parse_operation, resize, flatten_alpha, encoder_options, FORMAT_MAP,
+                            ENCODER_PROFILES, DEFAULT_ENCODER_PROFILE, ORIENTATION_TRANSPOSE, exif_orientation,
+                            apply_orientation, fold_orientation, compose_transposes)
+from image_metadata import open_image, read_metadata, read_exif, exif_value, build_index
+from image_lossless import rotation_transpose, transpose_file, auto_orient_file, crop_file
+from image_quality import QualitySearch, parse_byte_size, parse_ssim, SEARCH_FORMATS
+from image_base64 import encode_base64_stream, decode_base64_stream, B64_CHUNK_SIZE, SPOOL_MAX_BYTES
 
 # Register HEIF opener
 pillow_heif.register_heif_opener()
 
+# Output extensions for the formats named in data URIs or --format
+BULK_EXTENSIONS = {'jpeg': '.jpg', 'jpg': '.jpg', 'png': '.png', 'gif': '.gif', 'bmp': '.bmp', 'webp': '.webp'}
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.heic', '.heif', '.tif', '.tiff'}
+
 def validate_file_path(file_path, check_exists=True):
     """Validate and normalize file path"""
     try:
@@ -39,31 +56,36 @@ def get_image_info(image_path):
             return f"Error: {result}"
         
         image_path = result
-        file_size = Path(image_path).stat().st_size
+        # Only the file header is read, the pixels are never decoded
+        metadata = read_metadata(image_path, include_exif=False)
+        file_size = metadata["file_size"]
+        
+        info = {
+            "file_path": image_path,
+            "file_name": Path(image_path).name,
+            "file_size_bytes": file_size,
+            "file_size_mb": round(file_size / (1024 * 1024), 2),
+            "image_format": metadata["format"],
+            "image_mode": metadata["mode"],
+            "dimensions": {
+                "width": metadata["width"],
+                "height": metadata["height"],
+                "aspect_ratio": round(metadata["width"] / metadata["height"], 2)
+            },
+            "has_transparency": metadata["has_transparency"],
+            "has_exif": metadata["has_exif"],
+            "orientation": metadata["orientation"],
+            "icc_profile_size": metadata["icc_profile_size"]
+        }
+        
+        return info
         
-        with Image.open(image_path) as img:
-            info = {
-                "file_path": image_path,
-                "file_name": Path(image_path).name,
-                "file_size_bytes": file_size,
-                "file_size_mb": round(file_size / (1024 * 1024), 2),
-                "image_format": img.format,
-                "image_mode": img.mode,
-                "dimensions": {
-                    "width": img.width,
-                    "height": img.height,
-                    "aspect_ratio": round(img.width / img.height, 2)
-                },
-                "has_transparency": img.mode in ('RGBA', 'LA') or 'transparency' in img.info
-            }
-            
-            return info
-            
     except Exception as e:
         return f"Error getting image info: {str(e)}"
 
-def extract_exif_data(image_path, output_format="terminal"):
-    """Extract EXIF data from image"""
+def extract_exif_data(image_path, output_format="terminal", tags=None, include_binary=False):
+    """Extract EXIF data from image; tags limits it to those tag names, and binary values
+    such as MakerNote or thumbnails are left out unless include_binary is set"""
     try:
         valid, result = validate_file_path(image_path, check_exists=True)
         if not valid:
@@ -71,36 +93,23 @@ def extract_exif_data(image_path, output_format="terminal"):
         
         image_path = result
         
-        with Image.open(image_path) as img:
-            exif_data = {}
-            
-            # Get basic EXIF
-            if hasattr(img, '_getexif') and img._getexif() is not None:
-                exif = img._getexif()
-                for tag_id, value in exif.items():
-                    tag = TAGS.get(tag_id, tag_id)
-                    
-                    # Handle GPS data specially
-                    if tag == "GPSInfo":
-                        gps_data = {}
-                        for gps_tag_id, gps_value in value.items():
-                            gps_tag = GPSTAGS.get(gps_tag_id, gps_tag_id)
-                            gps_data[gps_tag] = str(gps_value)
-                        exif_data[tag] = gps_data
-                    else:
-                        exif_data[tag] = str(value)
+        with open_image(image_path) as img:
+            # Typed values: numbers stay numbers, rationals become floats, GPS gets decimal degrees
+            exif_data = read_exif(img, tags, include_binary)
             
             # Get additional info
-            if img.info:
+            if img.info and tags is None:
                 for key, value in img.info.items():
-                    if key not in exif_data:
-                        exif_data[key] = str(value)
+                    if key not in exif_data and key != 'exif':
+                        value = exif_value(value, include_binary)
+                        if value is not None:
+                            exif_data[key] = value
             
             if not exif_data:
                 return "No EXIF data found in the image"
             
             if output_format.lower() == "json":
-                return json.dumps(exif_data, indent=2, ensure_ascii=False)
+                return json.dumps(exif_data, indent=2, ensure_ascii=False, default=str)
             else:
                 # Terminal format
                 output = "EXIF Data:\n" + "="*50 + "\n"
@@ -116,8 +125,12 @@ def extract_exif_data(image_path, output_format="terminal"):
     except Exception as e:
         return f"Error extracting EXIF data: {str(e)}"
 
-def compress_image(image_path, output_path, compression_type="lossy", quality=85, optimize=True):
-    """Compress image with lossy or lossless compression"""
+def compress_image(image_path, output_path, compression_type="lossy", quality=85, optimize=None,
+                   target_size=None, target_ssim=None, search=None, profile="max", auto_orient=True):
+    """Compress image with lossy or lossless compression, using the encoder effort of profile
+    (see ENCODER_PROFILES). With target_size (bytes) and/or target_ssim, or a shared
+    QualitySearch, the JPEG/WebP quality is searched instead. auto_orient applies the EXIF
+    orientation, which the output does not keep"""
     try:
         valid, result = validate_file_path(image_path, check_exists=True)
         if not valid:
@@ -136,13 +149,37 @@ def compress_image(image_path, output_path, compression_type="lossy", quality=85
         original_size = Path(image_path).stat().st_size
         
         with Image.open(image_path) as img:
+            if auto_orient:
+                img = apply_orientation(img)
+            
             # Determine output format
             output_ext = Path(output_path).suffix.lower()
             format_map = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', 
                          '.webp': 'WEBP', '.bmp': 'BMP', '.gif': 'GIF'}
             output_format = format_map.get(output_ext, 'JPEG')
             
-            save_kwargs = {'optimize': optimize}
+            save_kwargs = encoder_options(output_format, profile)
+            if optimize is not None:
+                save_kwargs['optimize'] = optimize
+            
+            if compression_type.lower() == "lossy" and (search or target_size or target_ssim):
+                if output_format not in SEARCH_FORMATS or (search and search.format != output_format):
+                    return "Error: A size or SSIM target needs JPEG or WebP output"
+                search = search or QualitySearch(output_format, target_size, target_ssim, **save_kwargs)
+                result = search.search(img)
+                with open(output_path, 'wb') as f:
+                    f.write(result["data"])
+                
+                new_size = result["size"]
+                compression_ratio = round((1 - new_size/original_size) * 100, 2)
+                ssim_text = f", SSIM {result['ssim']:.4f}" if result["ssim"] is not None else ""
+                status = "" if result["met"] else "Warning: target not reachable, closest result kept\n"
+                return (f"Image compressed successfully!\n{status}"
+                       f"Original size: {original_size:,} bytes ({original_size/1024/1024:.2f} MB)\n"
+                       f"New size: {new_size:,} bytes ({new_size/1024/1024:.2f} MB)\n"
+                       f"Compression: {compression_ratio}% reduction\n"
+                       f"Quality: {result['quality']}{ssim_text} ({result['trials']} trial encodes)\n"
+                       f"Saved to: {output_path}")
             
             if compression_type.lower() == "lossy":
                 if output_format in ['JPEG', 'WEBP']:
@@ -158,9 +195,7 @@ def compress_image(image_path, output_path, compression_type="lossy", quality=85
                         img = background
                         
             elif compression_type.lower() == "lossless":
-                if output_format == 'PNG':
-                    save_kwargs['compress_level'] = 9  # Maximum compression
-                elif output_format == 'WEBP':
+                if output_format == 'WEBP':
                     save_kwargs['lossless'] = True
                 elif output_format == 'JPEG':
                     save_kwargs['quality'] = 100
@@ -179,8 +214,9 @@ def compress_image(image_path, output_path, compression_type="lossy", quality=85
     except Exception as e:
         return f"Error compressing image: {str(e)}"
 
-def convert_format(image_path, output_path, maintain_quality=True):
-    """Convert image from one format to another"""
+def convert_format(image_path, output_path, maintain_quality=True, profile=None, auto_orient=True):
+    """Convert image from one format to another, using the encoder effort of profile
+    (see ENCODER_PROFILES, default: balanced); auto_orient applies the EXIF orientation"""
     try:
         valid, result = validate_file_path(image_path, check_exists=True)
         if not valid:
@@ -198,12 +234,14 @@ def convert_format(image_path, output_path, maintain_quality=True):
         
         with Image.open(image_path) as img:
             original_format = img.format
+            if auto_orient:
+                img = apply_orientation(img)
             output_ext = Path(output_path).suffix.lower()
             format_map = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', 
                          '.webp': 'WEBP', '.bmp': 'BMP', '.gif': 'GIF', '.heic': 'HEIF'}
             output_format = format_map.get(output_ext, 'JPEG')
             
-            save_kwargs = {}
+            save_kwargs = encoder_options(output_format, profile)
             
             # Handle format-specific conversions
             if output_format == 'JPEG':
@@ -216,15 +254,11 @@ def convert_format(image_path, output_path, maintain_quality=True):
                     img = background
                 
                 if maintain_quality:
-                    save_kwargs.update({'quality': 95, 'optimize': True})
-                    
-            elif output_format == 'PNG':
-                if maintain_quality:
-                    save_kwargs['compress_level'] = 1  # Fast compression
+                    save_kwargs['quality'] = 95
                     
             elif output_format == 'WEBP':
                 if maintain_quality:
-                    save_kwargs.update({'quality': 95, 'method': 6})
+                    save_kwargs['quality'] = 95
             
             img.save(output_path, format=output_format, **save_kwargs)
             
@@ -239,8 +273,38 @@ def convert_format(image_path, output_path, maintain_quality=True):
     except Exception as e:
         return f"Error converting format: {str(e)}"
 
-def resize_image(image_path, output_path, dimensions, maintain_aspect=True, resample_filter="LANCZOS"):
-    """Resize image with various options"""
+def measure_encoder_profiles(image_path, formats=("JPEG", "PNG", "WEBP"), profiles=None, repeat=1):
+    """Encode one decoded image to memory with every encoder profile of each format, returning a
+    record per combination with the output size and the best encode time of repeat runs"""
+    profiles = profiles or list(ENCODER_PROFILES)
+    with Image.open(image_path) as img:
+        img.load()
+        pixels = img.width * img.height
+        records = []
+        for output_format in formats:
+            source = flatten_alpha(img) if output_format == 'JPEG' else img
+            for profile in profiles:
+                save_kwargs = encoder_options(output_format, profile)
+                best = None
+                for _ in range(max(1, repeat)):
+                    buffer = io.BytesIO()
+                    started = time.perf_counter()
+                    source.save(buffer, format=output_format, **save_kwargs)
+                    elapsed = time.perf_counter() - started
+                    best = elapsed if best is None else min(best, elapsed)
+                records.append({
+                    "format": output_format,
+                    "profile": profile,
+                    "bytes": buffer.tell(),
+                    "encode_ms": round(best * 1000, 2),
+                    "mpixels_per_s": round(pixels / best / 1e6, 2) if best else None
+                })
+    return records
+
+def resize_image(image_path, output_path, dimensions, maintain_aspect=True, resample_filter="LANCZOS", draft=True,
+                 auto_orient=True):
+    """Resize image with various options (draft enables the fast reduced-scale JPEG decode);
+    auto_orient applies the EXIF orientation as part of the same resample"""
     try:
         valid, result = validate_file_path(image_path, check_exists=True)
         if not valid:
@@ -268,19 +332,18 @@ def resize_image(image_path, output_path, dimensions, maintain_aspect=True, resa
         
         with Image.open(image_path) as img:
             original_size = img.size
+            original_format = img.format
             
-            if maintain_aspect:
-                img.thumbnail((width, height), getattr(Image.Resampling, resample_filter))
-                new_size = img.size
-            else:
-                img = img.resize((width, height), getattr(Image.Resampling, resample_filter))
-                new_size = (width, height)
+            orientation = exif_orientation(img) if auto_orient else 1
+            op = resize(width, height, maintain_aspect, resample_filter, draft)
+            img = fold_orientation([op], orientation)[0](img)
+            new_size = img.size
             
             # Determine output format and save
             output_ext = Path(output_path).suffix.lower()
             format_map = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', 
                          '.webp': 'WEBP', '.bmp': 'BMP'}
-            output_format = format_map.get(output_ext, img.format)
+            output_format = format_map.get(output_ext, original_format)
             
             save_kwargs = {}
             if output_format == 'JPEG' and img.mode in ('RGBA', 'LA', 'P'):
@@ -294,7 +357,8 @@ def resize_image(image_path, output_path, dimensions, maintain_aspect=True, resa
             
             img.save(output_path, format=output_format, **save_kwargs)
             
-            return (f"Image resized successfully!\n"
+            oriented = f" (EXIF orientation {orientation} applied)" if orientation != 1 else ""
+            return (f"Image resized successfully!{oriented}\n"
                    f"Original size: {original_size[0]}x{original_size[1]}\n"
                    f"New size: {new_size[0]}x{new_size[1]}\n"
                    f"Saved to: {output_path}")
@@ -302,8 +366,10 @@ def resize_image(image_path, output_path, dimensions, maintain_aspect=True, resa
     except Exception as e:
         return f"Error resizing image: {str(e)}"
 
-def rotate_image(image_path, output_path, angle, expand=True):
-    """Rotate image by specified angle"""
+def rotate_image(image_path, output_path, angle, expand=True, lossless=True, auto_orient=True):
+    """Rotate image by specified angle. Multiples of 90 degrees are a transpose of the pixels,
+    lossless for JPEGs when jpegtran is available (see image_lossless). auto_orient rotates the
+    image as displayed, i.e. after its EXIF orientation; for a transpose both are done at once"""
     try:
         valid, result = validate_file_path(image_path, check_exists=True)
         if not valid:
@@ -319,8 +385,20 @@ def rotate_image(image_path, output_path, angle, expand=True):
         if not success:
             return f"Error: {error}"
         
+        method = rotation_transpose(angle) if lossless else None
+        if method is not None and (expand or angle % 180 == 0):
+            orientation = 1
+            if auto_orient:
+                with Image.open(image_path) as img:
+                    orientation = exif_orientation(img)
+            if orientation != 1:
+                method = compose_transposes(ORIENTATION_TRANSPOSE[orientation], method)
+            how = transpose_file(image_path, output_path, method, reset_orientation=orientation != 1)
+            return f"Image rotated by {angle}° ({how}) and saved to: {output_path}"
+        
         with Image.open(image_path) as img:
-            rotated = img.rotate(angle, expand=expand, fillcolor='white')
+            rotated = apply_orientation(img) if auto_orient else img
+            rotated = rotated.rotate(angle, expand=expand, fillcolor='white')
             
             # Determine output format
             output_ext = Path(output_path).suffix.lower()
@@ -345,6 +423,91 @@ def rotate_image(image_path, output_path, angle, expand=True):
     except Exception as e:
         return f"Error rotating image: {str(e)}"
 
+def auto_orient_image(image_path, output_path):
+    """Apply the EXIF orientation to the pixels and reset the tag, losslessly for JPEGs when
+    jpegtran is available; upright images are copied unchanged"""
+    try:
+        valid, result = validate_file_path(image_path, check_exists=True)
+        if not valid:
+            return f"Error: {result}"
+        image_path = result
+        
+        valid, result = validate_file_path(output_path, check_exists=False)
+        if not valid:
+            return f"Error with output path: {result}"
+        output_path = result
+        
+        success, error = ensure_directory_exists(output_path)
+        if not success:
+            return f"Error: {error}"
+        
+        orientation, how = auto_orient_file(image_path, output_path)
+        if how is None:
+            if Path(image_path).resolve() != Path(output_path).resolve():
+                shutil.copyfile(image_path, output_path)
+            return f"Image already upright (orientation {orientation}), saved to: {output_path}"
+        return f"Image orientation {orientation} applied ({how}) and saved to: {output_path}"
+    
+    except Exception as e:
+        return f"Error orienting image: {str(e)}"
+
+def crop_image(image_path, output_path, box):
+    """Crop image to box (left, upper, right, lower), losslessly for JPEGs when the corner is on
+    an MCU boundary and jpegtran is available"""
+    try:
+        valid, result = validate_file_path(image_path, check_exists=True)
+        if not valid:
+            return f"Error: {result}"
+        image_path = result
+        
+        valid, result = validate_file_path(output_path, check_exists=False)
+        if not valid:
+            return f"Error with output path: {result}"
+        output_path = result
+        
+        success, error = ensure_directory_exists(output_path)
+        if not success:
+            return f"Error: {error}"
+        
+        how = crop_file(image_path, output_path, box)
+        left, upper, right, lower = box
+        return f"Image cropped to {right - left}x{lower - upper} at ({left}, {upper}) ({how}) and saved to: {output_path}"
+    
+    except Exception as e:
+        return f"Error cropping image: {str(e)}"
+
+def process_pipeline(image_path, output_path, operations, strip_height=None, auto_orient=True):
+    """Run a chain of operations with a single decode and a single encode, optionally in strips;
+    auto_orient applies the EXIF orientation first (not in strips)"""
+    try:
+        valid, result = validate_file_path(image_path, check_exists=True)
+        if not valid:
+            return f"Error: {result}"
+        image_path = result
+        
+        valid, result = validate_file_path(output_path, check_exists=False)
+        if not valid:
+            return f"Error with output path: {result}"
+        output_path = result
+        
+        success, error = ensure_directory_exists(output_path)
+        if not success:
+            return f"Error: {error}"
+        
+        operations = [parse_operation(op) if isinstance(op, str) else op for op in operations]
+        pipeline = Pipeline(operations, auto_orient=auto_orient)
+        result = pipeline.run(image_path, output_path, strip_height=strip_height)
+        
+        steps = " -> ".join(repr(op) for op in operations)
+        return (f"Pipeline applied successfully!\n"
+               f"Operations: {steps}\n"
+               f"Original size: {result['input_size'][0]}x{result['input_size'][1]}\n"
+               f"New size: {result['output_size'][0]}x{result['output_size'][1]} ({result['format']})\n"
+               f"Saved to: {output_path}")
+            
+    except Exception as e:
+        return f"Error running pipeline: {str(e)}"
+
 def image_to_base64(image_path, output_text_file=None):
     """Convert image to base64 string with comprehensive error handling"""
     try:
@@ -354,25 +517,27 @@ def image_to_base64(image_path, output_text_file=None):
         
         image_path = result
         
-        with Image.open(image_path) as img:
-            if img.mode in ('RGBA', 'LA', 'P'):
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'RGBA' or img.mode == 'LA':
-                    background.paste(img, mask=img.split()[-1])
-                else:
-                    background.paste(img)
-                img = background
-            
+        with Image.open(image_path) as img, tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as encoded:
             original_format = img.format or 'JPEG'
-            img_byte_arr = io.BytesIO()
             save_format = original_format if original_format in ['JPEG', 'PNG', 'GIF', 'BMP', 'WEBP'] else 'JPEG'
-            img.save(img_byte_arr, format=save_format, quality=95 if save_format == 'JPEG' else None)
-            img_byte_arr = img_byte_arr.getvalue()
-            
-            base64_string = base64.b64encode(img_byte_arr).decode('utf-8')
-            full_data_uri = f"data:image/{save_format.lower()};base64,{base64_string}"
+            data_uri_prefix = f"data:image/{save_format.lower()};base64,".encode('ascii')
+            
+            # A file already in the output format is encoded as it is, without decoding it; files
+            # with EXIF are re-encoded so that camera and GPS metadata are not embedded
+            passthrough = save_format == original_format and not img.info.get('exif')
+            if not passthrough:
+                if save_format == 'JPEG' and img.mode in ('RGBA', 'LA', 'P'):
+                    if img.mode == 'P':
+                        img = img.convert('RGBA')
+                    background = Image.new('RGB', img.size, (255, 255, 255))
+                    if img.mode == 'RGBA' or img.mode == 'LA':
+                        background.paste(img, mask=img.split()[-1])
+                    else:
+                        background.paste(img)
+                    img = background
+                
+                img.save(encoded, format=save_format, **({'quality': 95} if save_format in ('JPEG', 'WEBP') else {}))
+                encoded.seek(0)
             
             if output_text_file:
                 valid, result = validate_file_path(output_text_file, check_exists=False)
@@ -384,105 +549,91 @@ def image_to_base64(image_path, output_text_file=None):
                 if not success:
                     return f"Error: {error}"
                 
-                with open(output_text_file, 'w', encoding='utf-8') as f:
-                    f.write(full_data_uri)
+                # Encoded block by block straight into the text file
+                with (open(image_path, 'rb') if passthrough else encoded) as source, open(output_text_file, 'wb') as f:
+                    encode_base64_stream(source, f, data_uri_prefix)
                 return f"Base64 string saved to '{output_text_file}'"
             else:
-                return full_data_uri
+                full_data_uri = io.BytesIO()
+                with (open(image_path, 'rb') if passthrough else encoded) as source:
+                    encode_base64_stream(source, full_data_uri, data_uri_prefix)
+                return full_data_uri.getvalue().decode('ascii')
                     
     except Exception as e:
         return f"Error converting to base64: {str(e)}"
 
-def read_base64_from_file(file_path):
-    """Read base64 string from file with error handling"""
-    try:
-        valid, result = validate_file_path(file_path, check_exists=True)
-        if not valid:
-            return False, result
-        
-        file_path = result
-        file_size = Path(file_path).stat().st_size
-        if file_size > 100 * 1024 * 1024:  # 100MB
-            return False, f"File is too large ({file_size / 1024 / 1024:.1f}MB). Maximum recommended size is 100MB."
-        
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read().strip()
-            
-        if not content:
-            return False, "File is empty"
-            
-        return True, content
-        
-    except UnicodeDecodeError:
-        return False, "File contains invalid characters. Please ensure it's a text file with base64 data."
-    except Exception as e:
-        return False, f"Error reading file: {str(e)}"
-
 def base64_to_image(base64_input, output_path):
     """Convert base64 string to image with comprehensive error handling"""
     try:
         if os.path.exists(base64_input.strip().strip('"\'')):
-            success, base64_string = read_base64_from_file(base64_input)
-            if not success:
-                return f"Error reading base64 file: {base64_string}"
+            # Files are decoded as a stream, so there is no limit on their size
+            valid, result = validate_file_path(base64_input, check_exists=True)
+            if not valid:
+                return f"Error reading base64 file: {result}"
+            base64_source = open(result, 'rb')
         else:
-            base64_string = base64_input.strip()
-        
-        valid, result = validate_file_path(output_path, check_exists=False)
-        if not valid:
-            return f"Error with output path: {result}"
-        
-        output_path = result
-        success, error = ensure_directory_exists(output_path)
-        if not success:
-            return f"Error: {error}"
+            base64_source = io.BytesIO(base64_input.strip().encode('utf-8'))
         
-        # Handle and validate output extension
-        valid_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+        with base64_source:
+            return _decode_base64_to_image(base64_source, output_path)
+            
+    except Exception as e:
+        return f"Unexpected error: {str(e)}"
+
+def _decode_base64_to_image(base64_source, output_path):
+    valid, result = validate_file_path(output_path, check_exists=False)
+    if not valid:
+        return f"Error with output path: {result}"
+    
+    output_path = result
+    success, error = ensure_directory_exists(output_path)
+    if not success:
+        return f"Error: {error}"
+    
+    # Handle and validate output extension
+    valid_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+    output_path_obj = Path(output_path)
+    output_ext = output_path_obj.suffix.lower()
+    
+    if output_path.startswith('.') and len(output_path_obj.parts) == 1:
+        output_path = f"output{output_path}"
         output_path_obj = Path(output_path)
         output_ext = output_path_obj.suffix.lower()
-        
-        if output_path.startswith('.') and len(output_path_obj.parts) == 1:
-            output_path = f"output{output_path}"
-            output_path_obj = Path(output_path)
-            output_ext = output_path_obj.suffix.lower()
-        elif output_path.lower() in ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp']:
-            output_path = f"output.{output_path.lower()}"
-            output_path_obj = Path(output_path)
-            output_ext = output_path_obj.suffix.lower()
-        
-        if output_ext not in valid_extensions:
-            return f"Error: Output file must have a valid image extension {valid_extensions}\nExample: output.jpg or just type 'jpg' for default name"
-        
-        if base64_string.startswith('data:image'):
-            if ',' not in base64_string:
-                return "Error: Invalid data URI format"
-            base64_string = base64_string.split(',', 1)[1]
-        
-        base64_string = ''.join(base64_string.split())
-        
-        if not base64_string:
-            return "Error: Empty base64 string"
-        
-        valid_chars = set('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=')
-        if not set(base64_string).issubset(valid_chars):
-            return "Error: Invalid base64 characters found"
-        
+    elif output_path.lower() in ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp']:
+        output_path = f"output.{output_path.lower()}"
+        output_path_obj = Path(output_path)
+        output_ext = output_path_obj.suffix.lower()
+    
+    if output_ext not in valid_extensions:
+        return f"Error: Output file must have a valid image extension {valid_extensions}\nExample: output.jpg or just type 'jpg' for default name"
+    
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as img_data:
         try:
-            img_data = base64.b64decode(base64_string, validate=True)
-        except Exception as e:
+            decoded_size = decode_base64_stream(base64_source, img_data)
+        except binascii.Error as e:
             return f"Error decoding base64: {str(e)}"
+        except ValueError as e:
+            return f"Error: {str(e)}"
         
-        if len(img_data) == 0:
+        if decoded_size == 0:
             return "Error: Decoded data is empty"
         
         try:
-            img = Image.open(io.BytesIO(img_data))
+            img_data.seek(0)
+            img = Image.open(img_data)
             
             output_format = output_ext.replace('.', '').upper()
             if output_format == 'JPG':
                 output_format = 'JPEG'
             
+            width, height = img.size
+            if img.format == output_format:
+                # Already in the requested format: the decoded bytes are written as they are
+                img_data.seek(0)
+                with open(output_path, 'wb') as f:
+                    shutil.copyfileobj(img_data, f, B64_CHUNK_SIZE)
+                return f"Image saved to '{output_path}' (Size: {width}x{height}, Format: {output_format})"
+            
             if output_format == 'JPEG' and img.mode in ('RGBA', 'LA', 'P'):
                 background = Image.new('RGB', img.size, (255, 255, 255))
                 if img.mode in ('RGBA', 'LA'):
@@ -497,15 +648,10 @@ def base64_to_image(base64_input, output_path):
                 save_kwargs['optimize'] = True
             
             img.save(output_path, format=output_format, **save_kwargs)
-            
-            width, height = img.size
             return f"Image saved to '{output_path}' (Size: {width}x{height}, Format: {output_format})"
             
         except Exception as e:
             return f"Error creating/saving image: {str(e)}"
-            
-    except Exception as e:
-        return f"Unexpected error: {str(e)}"
 
 def get_default_output_name(input_path, suffix="_processed", extension=None):
     """Generate default output filename"""
@@ -514,6 +660,517 @@ def get_default_output_name(input_path, suffix="_processed", extension=None):
         extension = input_path.suffix
     return str(input_path.parent / f"{input_path.stem}{suffix}{extension}")
 
+def collect_image_files(inputs, recursive=False):
+    """Expand files, directories and glob patterns into a list of image paths"""
+    files = []
+    seen = set()
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            candidates = path.rglob('*') if recursive else path.iterdir()
+            candidates = sorted(p for p in candidates if p.is_file() and p.suffix.lower() in IMAGE_EXTENSIONS)
+        elif path.is_file():
+            candidates = [path]
+        else:
+            candidates = sorted(Path(p) for p in glob.glob(item, recursive=recursive) if Path(p).is_file())
+        
+        for candidate in candidates:
+            if str(candidate) not in seen:
+                seen.add(str(candidate))
+                files.append(str(candidate))
+    return files
+
+def build_output_path(image_path, output_dir, suffix, extension=None):
+    """Generate the output filename for a CLI task, optionally inside output_dir"""
+    output_path = get_default_output_name(image_path, suffix, extension)
+    if output_dir:
+        output_path = str(Path(output_dir) / Path(output_path).name)
+    return output_path
+
+def parse_crop_box(value):
+    """Parse 'left,top,width,height' or jpegtran style 'WIDTHxHEIGHT+LEFT+TOP' into (left, top, width, height)"""
+    try:
+        if 'x' in value:
+            size, left, top = value.split('+')
+            width, height = size.split('x')
+        else:
+            left, top, width, height = value.split(',')
+        return int(left), int(top), int(width), int(height)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid crop box '{value}', expected left,top,width,height or WxH+left+top")
+
+# Quality searches of this process by target, so consecutive batch files warm-start each other
+_quality_searches = {}
+
+def shared_quality_search(output_path, target_size, target_ssim, profile="max"):
+    """QualitySearch reused by every batch task with the same output format and targets, or None
+    if the output format has no quality to search"""
+    output_format = FORMAT_MAP.get(Path(output_path).suffix.lower())
+    if output_format not in SEARCH_FORMATS:
+        return None
+    key = (output_format, target_size, target_ssim, profile)
+    if key not in _quality_searches:
+        _quality_searches[key] = QualitySearch(output_format, target_size, target_ssim,
+                                               **encoder_options(output_format, profile))
+    return _quality_searches[key]
+
+def run_cli_task(task):
+    """Run a single CLI task and return a JSON-serializable result record"""
+    command, image_path, output_path, options = task
+    started = time.perf_counter()
+    
+    try:
+        if command == 'compress':
+            search = None
+            if options.get('target_size') or options.get('target_ssim'):
+                search = shared_quality_search(output_path, options.get('target_size'), options.get('target_ssim'),
+                                               options.get('profile') or "max")
+            result = compress_image(image_path, output_path, options['compression_type'], options['quality'],
+                                    target_size=options.get('target_size'), target_ssim=options.get('target_ssim'),
+                                    search=search, profile=options.get('profile') or "max",
+                                    auto_orient=options.get('auto_orient', True))
+        elif command == 'convert':
+            result = convert_format(image_path, output_path, options['maintain_quality'], options.get('profile'),
+                                    options.get('auto_orient', True))
+        elif command == 'resize':
+            result = resize_image(image_path, output_path, options['size'], options['maintain_aspect'],
+                                  draft=options['draft'], auto_orient=options.get('auto_orient', True))
+        elif command == 'rotate':
+            result = rotate_image(image_path, output_path, options['angle'], options['expand'], options['lossless'],
+                                  options.get('auto_orient', True))
+        elif command == 'auto-orient':
+            result = auto_orient_image(image_path, output_path)
+        elif command == 'crop':
+            result = crop_image(image_path, output_path, options['box'])
+        elif command == 'info':
+            result = get_image_info(image_path)
+        elif command == 'exif':
+            result = extract_exif_data(image_path, "json", options.get('tags'), options.get('include_binary', False))
+            if result == "No EXIF data found in the image":
+                result = {}
+            elif not result.startswith("Error"):
+                result = json.loads(result)
+        elif command == 'b64':
+            result = image_to_base64(image_path, output_path)
+        elif command == 'encoders':
+            result = {"measurements": measure_encoder_profiles(image_path, options['formats'], options['profiles'],
+                                                               options['repeat'])}
+        elif command == 'pipeline':
+            result = process_pipeline(image_path, output_path, options['operations'], options.get('strip_height'),
+                                      options.get('auto_orient', True))
+        else:
+            result = f"Error: Unknown command '{command}'"
+    except Exception as e:
+        result = f"Error: {str(e)}"
+    
+    return finish_record({"command": command, "input": image_path}, result, output_path, started)
+
+def finish_record(record, result, output_path, started):
+    """Add the status, output and timing of a task result to its JSON result record"""
+    if isinstance(result, str) and result.startswith("Error"):
+        record["status"] = "error"
+        record["error"] = result
+    else:
+        record["status"] = "ok"
+        if output_path:
+            record["output"] = output_path
+        if isinstance(result, dict):
+            record["result"] = result
+        else:
+            record["message"] = result
+    record["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return record
+
+def bulk_output_path(item, line_number, output_dir, output_format):
+    """Output path of a base64 manifest record, or None for an encode record whose data URI goes
+    into the result record"""
+    if "data" in item:
+        if item.get("output"):
+            return item["output"]
+        name = Path(str(item.get("id", f"line_{line_number}"))).name
+        data = item["data"]
+        # Keep the format of the payload unless the record or the command line asks for another
+        fmt = item.get("format") or output_format
+        if not fmt and data.startswith("data:image/"):
+            fmt = data[len("data:image/"):].split(';', 1)[0].split(',', 1)[0]
+        extension = BULK_EXTENSIONS.get((fmt or "png").lower().lstrip('.'), ".png")
+        return str(Path(output_dir or ".") / f"{name}{extension}")
+    if "path" in item:
+        if item.get("output"):
+            return item["output"]
+        if output_dir:
+            return build_output_path(item["path"], output_dir, "_base64", ".txt")
+    return None
+
+def b64_bulk_record(task):
+    """Decode ('data') or encode ('path') one record of a base64 JSONL manifest"""
+    line_number, item, output_path, error = task
+    started = time.perf_counter()
+    record = {"command": "b64-bulk", "line": line_number}
+    
+    if isinstance(item, dict) and "id" in item:
+        record["id"] = item["id"]
+    
+    try:
+        if error:
+            result = error
+        elif "data" in item:
+            result = _decode_base64_to_image(io.BytesIO(item["data"].encode('utf-8')), output_path)
+        elif "path" in item:
+            record["input"] = item["path"]
+            result = image_to_base64(item["path"], output_path)
+            if output_path is None and not result.startswith("Error"):
+                # Without an output file the data URI goes into the result record
+                record["data_uri"] = result
+                result = "Encoded to data URI"
+        else:
+            result = "Error: Record needs a 'data' field to decode or a 'path' field to encode"
+    except (ValueError, AttributeError) as e:
+        result = f"Error: Invalid manifest record: {str(e)}"
+    except Exception as e:
+        result = f"Error: {str(e)}"
+    
+    return finish_record(record, result, output_path, started)
+
+def run_bounded(func, tasks, jobs=1, max_in_flight=None):
+    """Like run_tasks for a stream of tasks of unknown length: at most max_in_flight tasks are
+    queued or running, so reading more input waits for the workers (results in completion order)"""
+    if jobs <= 1:
+        for task in tasks:
+            yield func(task)
+        return
+    
+    max_in_flight = max_in_flight or jobs * 4
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = set()
+        for task in tasks:
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(executor.submit(func, task))
+        
+        for future in as_completed(pending):
+            yield future.result()
+
+def read_manifest(stream, output_dir, output_format):
+    """Yield b64_bulk_record tasks for the non-blank lines of a JSONL manifest. Records whose
+    output path was already claimed by an earlier line (duplicate ids, or ids with the same
+    basename) get an error instead of overwriting that output"""
+    claimed = {}
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        item, output_path, error = None, None, None
+        try:
+            item = json.loads(line)
+            if not isinstance(item, dict):
+                raise ValueError("record is not a JSON object")
+            output_path = bulk_output_path(item, line_number, output_dir, output_format)
+        except (ValueError, AttributeError) as e:
+            error = f"Error: Invalid manifest record: {str(e)}"
+        
+        if output_path:
+            key = os.path.normcase(os.path.abspath(output_path))
+            if key in claimed:
+                error = f"Error: Output '{output_path}' is already written by line {claimed[key]}"
+            else:
+                claimed[key] = line_number
+        yield (line_number, item, output_path, error)
+
+def run_tasks(tasks, jobs=1):
+    """Run CLI tasks, fanning them out over a process pool when jobs > 1"""
+    if jobs <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield run_cli_task(task)
+        return
+    
+    # Chunk the work so that a large batch does not create one future per file
+    chunksize = max(1, min(64, len(tasks) // (jobs * 4)))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(run_cli_task, tasks, chunksize=chunksize)
+
+def build_cli_tasks(args, files):
+    """Build (command, input, output, options) tuples for every input file"""
+    tasks = []
+    for image_path in files:
+        output_path = None
+        options = {}
+        
+        if args.command == 'compress':
+            options = {'compression_type': args.type, 'quality': args.quality, 'profile': args.profile,
+                       'target_size': args.target_size, 'target_ssim': args.target_ssim,
+                       'auto_orient': not args.no_auto_orient}
+            output_path = build_output_path(image_path, args.output_dir, args.suffix or "_compressed")
+        elif args.command == 'convert':
+            target_format = args.format.lower()
+            if not target_format.startswith('.'):
+                target_format = f".{target_format}"
+            options = {'maintain_quality': not args.fast, 'profile': args.profile or ('fast' if args.fast else None),
+                       'auto_orient': not args.no_auto_orient}
+            output_path = build_output_path(image_path, args.output_dir, args.suffix or "_converted", target_format)
+        elif args.command == 'resize':
+            options = {'size': args.size, 'maintain_aspect': not args.no_aspect, 'draft': not args.no_draft,
+                       'auto_orient': not args.no_auto_orient}
+            output_path = build_output_path(image_path, args.output_dir, args.suffix or "_resized")
+        elif args.command == 'rotate':
+            options = {'angle': args.angle, 'expand': not args.no_expand, 'lossless': not args.reencode,
+                       'auto_orient': not args.no_auto_orient}
+            output_path = build_output_path(image_path, args.output_dir, args.suffix or f"_rotated_{int(args.angle)}")
+        elif args.command == 'auto-orient':
+            output_path = build_output_path(image_path, args.output_dir, args.suffix or "_oriented")
+        elif args.command == 'crop':
+            left, upper, width, height = args.box
+            options = {'box': (left, upper, left + width, upper + height)}
+            output_path = build_output_path(image_path, args.output_dir, args.suffix or "_cropped")
+        elif args.command == 'exif':
+            options = {'tags': args.tags.split(',') if args.tags else None, 'include_binary': args.include_binary}
+        elif args.command == 'encoders':
+            options = {'formats': args.formats, 'profiles': args.profiles, 'repeat': args.repeat}
+        elif args.command == 'b64':
+            output_path = build_output_path(image_path, args.output_dir, args.suffix or "_base64", ".txt")
+        elif args.command == 'pipeline':
+            options = {'operations': args.op, 'strip_height': args.strip_height,
+                       'auto_orient': not args.no_auto_orient}
+            output_path = build_output_path(image_path, args.output_dir, args.suffix or "_processed", args.extension)
+        
+        tasks.append((args.command, image_path, output_path, options))
+    return tasks
+
+def build_arg_parser():
+    """Build the argparse parser for the non-interactive batch CLI"""
+    parser = argparse.ArgumentParser(
+        prog="image_manupulator.py",
+        description="Complete Image Manipulator and Inspector Tool. "
+                    "Run without arguments for the interactive menu."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    inputs_parser = argparse.ArgumentParser(add_help=False)
+    inputs_parser.add_argument("inputs", nargs="+", help="Image files, directories or glob patterns")
+    inputs_parser.add_argument("-r", "--recursive", action="store_true",
+                               help="Recurse into directories and '**' glob patterns")
+    inputs_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                               help="Number of worker processes (default: number of CPUs)")
+    inputs_parser.add_argument("--results", help="Also write the per-file JSON results to this file")
+    
+    output_parser = argparse.ArgumentParser(add_help=False)
+    output_parser.add_argument("-o", "--output-dir", help="Directory for output files (default: next to each input)")
+    output_parser.add_argument("--suffix", help="Suffix added to output file names")
+    
+    orient_parser = argparse.ArgumentParser(add_help=False)
+    orient_parser.add_argument("--no-auto-orient", action="store_true",
+                               help="Process the pixels as stored instead of applying the EXIF orientation first")
+    
+    compress_parser = subparsers.add_parser("compress", parents=[inputs_parser, output_parser, orient_parser],
+                                            help="Compress images (lossy/lossless)")
+    compress_parser.add_argument("--type", choices=["lossy", "lossless"], default="lossy",
+                                 help="Compression type (default: lossy)")
+    compress_parser.add_argument("-q", "--quality", type=int, default=85, help="Quality 1-100 (default: 85)")
+    compress_parser.add_argument("--profile", choices=list(ENCODER_PROFILES),
+                                 help="Encoder effort: fast, balanced or max (default: max)")
+    compress_parser.add_argument("--target-size", type=parse_byte_size,
+                                 help="Search the highest quality giving at most this size, e.g. 200KB")
+    compress_parser.add_argument("--target-ssim", type=parse_ssim,
+                                 help="Search the smallest file with at least this SSIM, e.g. 0.98")
+    
+    convert_parser = subparsers.add_parser("convert", parents=[inputs_parser, output_parser, orient_parser],
+                                           help="Convert image format")
+    convert_parser.add_argument("-f", "--format", required=True, help="Target format, e.g. jpg, png, webp")
+    convert_parser.add_argument("--fast", action="store_true",
+                                help="Use the default JPEG/WebP quality instead of 95 and the fast encoder profile")
+    convert_parser.add_argument("--profile", choices=list(ENCODER_PROFILES),
+                                help=f"Encoder effort: fast, balanced or max (default: {DEFAULT_ENCODER_PROFILE})")
+    
+    resize_parser = subparsers.add_parser("resize", parents=[inputs_parser, output_parser, orient_parser], help="Resize images")
+    resize_parser.add_argument("-s", "--size", required=True, help="Dimensions, e.g. 800x600 or 800 for square")
+    resize_parser.add_argument("--no-aspect", action="store_true", help="Resize to exact dimensions")
+    resize_parser.add_argument("--no-draft", action="store_true",
+                               help="Fully decode JPEGs instead of decoding at reduced scale first")
+    
+    rotate_parser = subparsers.add_parser("rotate", parents=[inputs_parser, output_parser, orient_parser], help="Rotate images")
+    rotate_parser.add_argument("-a", "--angle", type=float, required=True, help="Rotation angle in degrees")
+    rotate_parser.add_argument("--no-expand", action="store_true", help="Don't expand canvas to fit rotated image")
+    rotate_parser.add_argument("--reencode", action="store_true",
+                               help="Always decode, rotate and re-encode, even for multiples of 90 degrees")
+    
+    subparsers.add_parser("auto-orient", parents=[inputs_parser, output_parser],
+                          help="Apply the EXIF orientation to the pixels (losslessly for JPEGs with jpegtran)")
+    
+    crop_parser = subparsers.add_parser("crop", parents=[inputs_parser, output_parser],
+                                        help="Crop images (losslessly for MCU aligned JPEG crops with jpegtran)")
+    crop_parser.add_argument("-b", "--box", required=True,
+                             type=parse_crop_box,
+                             help="Crop box as left,top,width,height or WxH+left+top (jpegtran style)")
+    
+    subparsers.add_parser("info", parents=[inputs_parser], help="Show image information")
+    exif_parser = subparsers.add_parser("exif", parents=[inputs_parser], help="Extract EXIF data")
+    exif_parser.add_argument("--tags", help="Comma separated tag names to extract, e.g. Make,Model,DateTimeOriginal,GPSInfo "
+                                            "(default: all)")
+    exif_parser.add_argument("--include-binary", action="store_true",
+                             help="Include binary values such as MakerNote and thumbnails (base64 encoded)")
+    subparsers.add_parser("b64", parents=[inputs_parser, output_parser], help="Convert images to base64 text files")
+    
+    encoders_parser = subparsers.add_parser("encoders", parents=[inputs_parser],
+                                            help="Measure the output size and encode time of each encoder profile")
+    encoders_parser.add_argument("-f", "--formats", type=lambda value: [FORMAT_MAP.get(f".{fmt.strip().lower()}",
+                                                                                     fmt.strip().upper())
+                                                                        for fmt in value.split(',')],
+                                 default=["JPEG", "PNG", "WEBP"],
+                                 help="Comma separated formats to encode (default: jpeg,png,webp)")
+    encoders_parser.add_argument("--profiles", type=lambda value: [name.strip() for name in value.split(',')],
+                                 help=f"Comma separated profiles (default: {','.join(ENCODER_PROFILES)})")
+    encoders_parser.add_argument("--repeat", type=int, default=3,
+                                 help="Encode each combination this many times and keep the fastest (default: 3)")
+    
+    index_parser = subparsers.add_parser("index", help="Write a metadata index of image directories as a NumPy .npy file")
+    index_parser.add_argument("inputs", nargs="+", help="Directories or image files to index")
+    index_parser.add_argument("-o", "--output", required=True,
+                              help="Index file; an existing index is updated, only re-reading new or changed files")
+    index_parser.add_argument("--no-recursive", action="store_true", help="Don't descend into subdirectories")
+    index_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                              help="Number of worker processes (default: number of CPUs)")
+    
+    bulk_parser = subparsers.add_parser("b64-bulk", help="Decode or encode base64 records of a JSONL manifest")
+    bulk_parser.add_argument("manifest", nargs="?", default="-",
+                             help="JSONL file, one record per line: {\"id\", \"data\": data URI} to decode "
+                                  "or {\"id\", \"path\"} to encode, optional \"output\" (default: stdin)")
+    bulk_parser.add_argument("-o", "--output-dir", help="Directory for output files (default: current directory)")
+    bulk_parser.add_argument("-f", "--format", help="Format of decoded images (default: from the data URI, else png)")
+    bulk_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                             help="Number of worker processes (default: number of CPUs)")
+    bulk_parser.add_argument("--max-in-flight", type=int,
+                             help="Maximum records queued or being processed at once (default: 4 per job)")
+    bulk_parser.add_argument("--results", help="Also write the per-record JSON results to this file")
+    
+    pipeline_parser = subparsers.add_parser("pipeline", parents=[inputs_parser, output_parser, orient_parser],
+                                            help="Chain several operations with one decode and one encode")
+    pipeline_parser.add_argument("--op", action="append", required=True,
+                                 help="Operation, repeat in order: resize:1600, resize:800x600:exact, "
+                                      "resize:1600:nodraft, "
+                                      "rotate:90, filter:sepia, grayscale, flatten, "
+                                      "watermark:text:bottom_right, encode:webp:80, encode:jpg:200KB, "
+                                      "encode:jpg:ssim=0.98")
+    pipeline_parser.add_argument("--strip-height", type=int,
+                                 help="Process very large images in horizontal strips of this many rows to "
+                                      "bound memory (filters, flatten and watermark only; PPM/PGM output is "
+                                      "written incrementally)")
+    
+    return parser
+
+def write_results(records, results_path=None):
+    """Print each JSON result record (and append it to results_path), returning (succeeded, failed)"""
+    results_file = open(results_path, 'w', encoding='utf-8') if results_path else None
+    
+    succeeded = failed = 0
+    try:
+        for record in records:
+            line = json.dumps(record, ensure_ascii=False)
+            print(line, flush=True)
+            if results_file:
+                results_file.write(line + "\n")
+            
+            if record["status"] == "ok":
+                succeeded += 1
+            else:
+                failed += 1
+    finally:
+        if results_file:
+            results_file.close()
+    return succeeded, failed
+
+def print_encoder_summary(records):
+    """Print the total size and encode time of each format and profile over all measured files"""
+    totals = {}
+    for record in records:
+        for item in record.get("result", {}).get("measurements", []):
+            total = totals.setdefault((item["format"], item["profile"]), [0, 0.0])
+            total[0] += item["bytes"]
+            total[1] += item["encode_ms"]
+    
+    for (output_format, profile), (size, encode_ms) in totals.items():
+        print(f"{output_format:<5} {profile:<9} {size / 1024 / 1024:9.2f} MB {encode_ms / 1000:9.2f} s",
+              file=sys.stderr)
+
+def run_b64_bulk(args):
+    """Run the b64-bulk command over a JSONL manifest file or stdin"""
+    if args.output_dir:
+        Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    
+    stream = sys.stdin.buffer if args.manifest == '-' else open(args.manifest, 'rb')
+    started = time.perf_counter()
+    try:
+        tasks = read_manifest(stream, args.output_dir, args.format)
+        records = run_bounded(b64_bulk_record, tasks, max(1, args.jobs), args.max_in_flight)
+        succeeded, failed = write_results(records, args.results)
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+    
+    elapsed = time.perf_counter() - started
+    print(f"Processed {succeeded + failed} records in {elapsed:.2f}s: {succeeded} succeeded, {failed} failed",
+          file=sys.stderr)
+    return 1 if failed else 0
+
+def run_index(args):
+    """Run the index command, printing a JSON summary of the rows reused, read and removed"""
+    started = time.perf_counter()
+    try:
+        summary = build_index(args.inputs, args.output, not args.no_recursive, max(1, args.jobs))
+    except Exception as e:
+        print(f"Error: Failed to build index: {str(e)}", file=sys.stderr)
+        return 1
+    
+    summary = {"command": "index", "output": args.output, **summary,
+               "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)}
+    print(json.dumps(summary, ensure_ascii=False))
+    print(f"Indexed {summary['files']} files in {summary['elapsed_ms'] / 1000:.2f}s: {summary['read']} read, "
+          f"{summary['reused']} unchanged, {summary['removed']} removed", file=sys.stderr)
+    return 0
+
+def run_cli(argv=None):
+    """Entry point for the non-interactive CLI, prints one JSON result per line"""
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    
+    if args.command == 'b64-bulk':
+        return run_b64_bulk(args)
+    if args.command == 'index':
+        return run_index(args)
+    
+    if args.command == 'pipeline':
+        try:
+            operations = [parse_operation(op) for op in args.op]
+        except ValueError as e:
+            parser.error(str(e))
+        # Outputs take the extension of the encode format, if one was given
+        encoder = operations[-1] if operations[-1].name == 'encode' else None
+        fmt = encoder.params.get('format') if encoder else None
+        args.extension = {'JPEG': '.jpg', 'HEIF': '.heic'}.get(fmt, f".{fmt.lower()}") if fmt else None
+    
+    files = collect_image_files(args.inputs, args.recursive)
+    if not files:
+        print("Error: No image files found", file=sys.stderr)
+        return 1
+    
+    if getattr(args, 'output_dir', None):
+        Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    
+    tasks = build_cli_tasks(args, files)
+    
+    started = time.perf_counter()
+    records = run_tasks(tasks, max(1, args.jobs))
+    if args.command == 'encoders':
+        records = list(records)
+    succeeded, failed = write_results(records, args.results)
+    
+    elapsed = time.perf_counter() - started
+    print(f"Processed {len(tasks)} files in {elapsed:.2f}s: {succeeded} succeeded, {failed} failed",
+          file=sys.stderr)
+    if args.command == 'encoders':
+        print_encoder_summary(records)
+    return 1 if failed else 0
+
 def main():
     print("🖼️  Complete Image Manipulator and Inspector Tool")
     print("=" * 60)
@@ -597,14 +1254,27 @@ def main():
             if not compression_type:
                 compression_type = "lossy"
             
+            target_size = target_ssim = None
             if compression_type == "lossy":
                 quality = input("Quality (1-100) [default: 85]: ").strip()
                 quality = int(quality) if quality.isdigit() else 85
+                
+                target = input("Target size (e.g. 200KB) [default: none]: ").strip()
+                ssim_target = input("Target SSIM (e.g. 0.98) [default: none]: ").strip()
+                try:
+                    if target:
+                        target_size = parse_byte_size(target)
+                    if ssim_target:
+                        target_ssim = parse_ssim(ssim_target)
+                except ValueError as e:
+                    print(f"Error: {e}")
+                    continue
             else:
                 quality = 100
             
             print("Compressing image...")
-            result = compress_image(image_path, output_path, compression_type, quality)
+            result = compress_image(image_path, output_path, compression_type, quality,
+                                    target_size=target_size, target_ssim=target_ssim)
             print(result)
             
         elif choice == '4':
@@ -729,6 +1399,9 @@ def main():
             print("❌ Invalid choice. Please enter 1-9.")
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
+    
     try:
         main()
     except KeyboardInterrupt:
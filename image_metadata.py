@@ -0,0 +1,336 @@
+import os
+import base64
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from PIL import Image, UnidentifiedImageError
+from PIL.ExifTags import TAGS, GPSTAGS
+from PIL.TiffImagePlugin import IFDRational
+from image_pipeline import FORMAT_MAP
+
+IMAGE_EXTENSIONS = set(FORMAT_MAP)
+
+# Files per worker task when scanning directories
+SCAN_CHUNK_SIZE = 256
+
+EXIF_IFD = 0x8769
+GPS_IFD = 0x8825
+
+# Binary EXIF values longer than this (MakerNote, thumbnails...) are skipped unless asked for
+BINARY_TAG_LIMIT = 64
+
+# Rows converted to a NumPy block at a time while indexing
+INDEX_BLOCK_ROWS = 65536
+
+# EXIF tags copied into the metadata index, by column name
+INDEX_EXIF_TAGS = {"make": "Make", "model": "Model", "date_taken": "DateTimeOriginal"}
+
+# Columns of the metadata index; the width of the path column is set when the index is written
+INDEX_DTYPE = [
+    ("path", "S"), ("file_size", "<i8"), ("mtime", "<f8"), ("format", "S8"), ("mode", "S8"),
+    ("width", "<i4"), ("height", "<i4"), ("has_transparency", "?"), ("orientation", "<i2"),
+    ("has_exif", "?"), ("icc_profile_size", "<i4"), ("make", "S32"), ("model", "S32"),
+    ("date_taken", "S19"), ("error", "S64")
+]
+
+def open_image(path):
+    """Image.open() trying the format suggested by the extension first, which skips probing
+    the other plugins; no pixel data is read until the image is loaded"""
+    fmt = FORMAT_MAP.get(Path(path).suffix.lower())
+    if fmt:
+        try:
+            return Image.open(path, formats=[fmt])
+        except UnidentifiedImageError:
+            pass
+    return Image.open(path)
+
+def header_exif(img):
+    """EXIF of an opened image as read from its header; Image.getexif() would decode a PNG
+    whose EXIF chunk follows the pixel data"""
+    exif = Image.Exif()
+    if img.info.get('exif'):
+        exif.load(img.info['exif'])
+    elif img.format == 'TIFF':
+        exif = img.getexif()
+    return exif
+
+def exif_value(value, include_binary=False):
+    """Convert an EXIF value to a JSON friendly type: rationals become floats, tuples lists and short
+    byte strings text or numbers; None means the value is skipped (larger binary blobs such as
+    MakerNote or thumbnails, unless include_binary asks for them as base64 text)"""
+    if isinstance(value, IFDRational):
+        return float(value) if value.denominator else None
+    if isinstance(value, tuple):
+        return [exif_value(item, include_binary) for item in value]
+    if isinstance(value, bytes):
+        if len(value) == 1:
+            return value[0]
+        text = value.rstrip(b'\x00')
+        if len(text) <= BINARY_TAG_LIMIT and text.isascii() and text.decode('ascii').isprintable():
+            return text.decode('ascii')
+        if include_binary:
+            return base64.b64encode(value).decode('ascii')
+        return None
+    if isinstance(value, str):
+        return value.rstrip('\x00').strip()
+    return value
+
+def gps_decimal(gps):
+    """Latitude and Longitude in decimal degrees (negative south and west) and Altitude in
+    meters (negative below sea level) from a GPSInfo dict with typed values"""
+    decimal = {}
+    for name, ref_name, negative in (("GPSLatitude", "GPSLatitudeRef", "S"), ("GPSLongitude", "GPSLongitudeRef", "W")):
+        dms = gps.get(name)
+        if isinstance(dms, list) and len(dms) == 3 and None not in dms:
+            degrees = dms[0] + dms[1] / 60 + dms[2] / 3600
+            decimal[name[3:]] = round(-degrees if str(gps.get(ref_name, "")).upper() == negative else degrees, 7)
+    altitude = gps.get("GPSAltitude")
+    if isinstance(altitude, (int, float)):
+        decimal["Altitude"] = -altitude if gps.get("GPSAltitudeRef") == 1 else altitude
+    return decimal
+
+def exif_to_dict(exif, tags=None, include_binary=False):
+    """Typed {tag name: value} of an Image.Exif, with the Exif sub-IFD tags alongside the main ones
+    and GPSInfo as a dict with decimal coordinates added; sub-IFDs are only parsed when tags
+    (a collection of tag names) asks for something they may contain"""
+    wanted = set(tags) if tags is not None else None
+    result = {}
+    
+    def add(tag_id, value):
+        name = TAGS.get(tag_id, tag_id)
+        if wanted is None or name in wanted:
+            value = exif_value(value, include_binary)
+            if value is not None:
+                result[name] = value
+    
+    for tag_id, value in exif.items():
+        if tag_id not in (EXIF_IFD, GPS_IFD):
+            add(tag_id, value)
+    
+    if EXIF_IFD in exif and (wanted is None or wanted - result.keys() - {"GPSInfo"}):
+        for tag_id, value in exif.get_ifd(EXIF_IFD).items():
+            add(tag_id, value)
+    
+    if GPS_IFD in exif and (wanted is None or "GPSInfo" in wanted):
+        gps = {}
+        for tag_id, value in exif.get_ifd(GPS_IFD).items():
+            value = exif_value(value, include_binary)
+            if value is not None:
+                gps[GPSTAGS.get(tag_id, tag_id)] = value
+        gps.update(gps_decimal(gps))
+        result["GPSInfo"] = gps
+    return result
+
+def read_exif(source, tags=None, include_binary=False):
+    """Typed EXIF of an image file or opened image, see exif_to_dict(); read from the header
+    without decoding pixels"""
+    if isinstance(source, Image.Image):
+        return exif_to_dict(header_exif(source), tags, include_binary)
+    with open_image(source) as img:
+        return exif_to_dict(header_exif(img), tags, include_binary)
+
+def metadata_from_image(img, include_exif=True):
+    """Header metadata of an opened (not loaded) image; include_exif is True for all EXIF
+    tags, False for none or a collection of the tag names to keep"""
+    exif = header_exif(img)
+    metadata = {
+        "format": img.format,
+        "mode": img.mode,
+        "width": img.width,
+        "height": img.height,
+        "has_transparency": img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info,
+        "orientation": exif.get(0x0112, 1),
+        "has_exif": len(exif) > 0,
+        "icc_profile_size": len(img.info.get('icc_profile') or b'')
+    }
+    if include_exif:
+        metadata["exif"] = exif_to_dict(exif, None if include_exif is True else include_exif)
+    return metadata
+
+def read_metadata(path, include_exif=True):
+    """Dimensions, mode, format, transparency, orientation, EXIF and ICC size of an image file,
+    read from its header without decoding any pixels"""
+    stat = os.stat(path)
+    with open_image(path) as img:
+        metadata = metadata_from_image(img, include_exif)
+    metadata.update(path=str(path), file_size=stat.st_size, mtime=stat.st_mtime)
+    return metadata
+
+def read_thumbnail(source, size):
+    """Decode only as much of an image as a thumbnail of size needs (JPEGs are decoded at a reduced scale)"""
+    img = Image.open(source)
+    img.thumbnail(size, Image.Resampling.LANCZOS)
+    return img
+
+def iter_image_files(root, recursive=True, extensions=IMAGE_EXTENSIONS):
+    """Yield image file paths under root with os.scandir, without building the whole list"""
+    if os.path.isfile(root):
+        yield str(root)
+        return
+    directories = [str(root)]
+    while directories:
+        directory = directories.pop()
+        try:
+            entries = os.scandir(directory)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            directories.append(entry.path)
+                    elif os.path.splitext(entry.name)[1].lower() in extensions:
+                        yield entry.path
+                except OSError:
+                    continue
+
+def _read_metadata_chunk(paths, include_exif):
+    records = []
+    for path in paths:
+        try:
+            records.append(read_metadata(path, include_exif))
+        except Exception as e:
+            record = {"path": path, "error": str(e)}
+            try:
+                # With the size and mtime an index can skip the file until it changes
+                stat = os.stat(path)
+                record.update(file_size=stat.st_size, mtime=stat.st_mtime)
+            except OSError:
+                pass
+            records.append(record)
+    return records
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def scan_directory(root, recursive=True, jobs=None, include_exif=False, paths=None):
+    """Yield read_metadata() records (or {'path', 'error'}) for every image under root, or for the
+    given paths, using a process pool; records come in completion order and only a few chunks of
+    paths are held at a time, so memory stays flat for archives of any size"""
+    paths = iter_image_files(root, recursive) if paths is None else paths
+    jobs = jobs or os.cpu_count() or 1
+    
+    if jobs <= 1:
+        for chunk in _chunks(paths, SCAN_CHUNK_SIZE):
+            yield from _read_metadata_chunk(chunk, include_exif)
+        return
+    
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = set()
+        for chunk in _chunks(paths, SCAN_CHUNK_SIZE):
+            if len(pending) >= jobs * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+            pending.add(executor.submit(_read_metadata_chunk, chunk, include_exif))
+        
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
+def index_row(metadata):
+    """Convert a read_metadata() record (or {'path', 'error'}) to a tuple of INDEX_DTYPE fields"""
+    def text(value, size):
+        return str(value).strip('\x00 ').encode('utf-8', 'replace')[:size] if value is not None else b''
+    
+    def number(value, default):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return default
+    
+    exif = metadata.get("exif", {})
+    return (
+        os.fsencode(metadata["path"]), metadata.get("file_size", -1), metadata.get("mtime", -1),
+        text(metadata.get("format"), 8), text(metadata.get("mode"), 8),
+        metadata.get("width", -1), metadata.get("height", -1), metadata.get("has_transparency", False),
+        number(metadata.get("orientation"), 1), metadata.get("has_exif", False), metadata.get("icc_profile_size", 0),
+        text(exif.get(INDEX_EXIF_TAGS["make"]), 32), text(exif.get(INDEX_EXIF_TAGS["model"]), 32),
+        text(exif.get(INDEX_EXIF_TAGS["date_taken"]), 19), text(metadata.get("error"), 64)
+    )
+
+def load_index(index_path):
+    """Read a metadata index written by build_index(), or None if there is none"""
+    import numpy as np
+    if not os.path.exists(index_path):
+        return None
+    return np.load(index_path, allow_pickle=False)
+
+def build_index(roots, index_path, recursive=True, jobs=None):
+    """Write a NumPy structured array (.npy) with one INDEX_DTYPE row per image under roots, sorted
+    by path. Rows of an existing index are reused for files whose size and mtime are unchanged, so
+    only new and modified files are read; returns counts of the rows reused, read and removed.
+    Paths are stored absolute, so the index is valid from any working directory"""
+    import numpy as np
+    previous = load_index(index_path)
+    kept, updated = [], []
+    seen = set()
+    
+    def changed_paths():
+        # Runs while the workers read metadata; unchanged files are found by a binary search
+        # in the previous index, which is sorted by path
+        for root in roots:
+            for path in iter_image_files(os.path.abspath(root), recursive):
+                # Overlapping roots list the same file more than once
+                if path in seen:
+                    continue
+                seen.add(path)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if previous is not None and len(previous):
+                    encoded = os.fsencode(path)
+                    position = np.searchsorted(previous["path"], encoded)
+                    if position < len(previous) and previous["path"][position] == encoded:
+                        if (previous["file_size"][position] == stat.st_size and
+                                previous["mtime"][position] == stat.st_mtime):
+                            kept.append(position)
+                            continue
+                        updated.append(position)
+                yield path
+    
+    # Rows are packed into arrays in blocks so a large archive never exists as Python tuples
+    blocks, rows = [], []
+    for metadata in scan_directory(None, jobs=jobs, include_exif=list(INDEX_EXIF_TAGS.values()), paths=changed_paths()):
+        rows.append(index_row(metadata))
+        if len(rows) == INDEX_BLOCK_ROWS:
+            blocks.append(_index_block(rows))
+            rows = []
+    if rows:
+        blocks.append(_index_block(rows))
+    if previous is not None and kept:
+        blocks.append(previous[np.array(kept)])
+    
+    path_width = max([block.dtype["path"].itemsize for block in blocks] + [1])
+    dtype = _index_dtype(path_width)
+    index = np.concatenate([block.astype(dtype) for block in blocks]) if blocks else np.empty(0, dtype=dtype)
+    index.sort(order="path")
+    
+    # Written next to the old index and renamed over it, so an interrupted run leaves the old one intact
+    temp_path = f"{index_path}.tmp.npy"
+    np.save(temp_path, index, allow_pickle=False)
+    os.replace(temp_path, index_path)
+    
+    return {
+        "files": len(index),
+        "reused": len(kept),
+        "read": len(index) - len(kept),
+        "errors": int((index["error"] != b'').sum()),
+        "removed": (len(previous) if previous is not None else 0) - len(kept) - len(updated)
+    }
+
+def _index_dtype(path_width):
+    return [(name, f"S{path_width}" if name == "path" else kind) for name, kind in INDEX_DTYPE]
+
+def _index_block(rows):
+    import numpy as np
+    return np.array(rows, dtype=_index_dtype(max(len(row[0]) for row in rows) or 1))
@@ -0,0 +1,708 @@
+import io
+import math
+import zlib
+from pathlib import Path
+from PIL import Image, ImageOps
+import pillow_heif
+
+# Register HEIF opener (worker processes import this module directly)
+pillow_heif.register_heif_opener()
+
+FORMAT_MAP = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.webp': 'WEBP', '.bmp': 'BMP',
+              '.gif': 'GIF', '.heic': 'HEIF', '.heif': 'HEIF', '.tif': 'TIFF', '.tiff': 'TIFF',
+              '.ppm': 'PPM', '.pgm': 'PPM', '.pnm': 'PPM'}
+
+# Encoder effort per format: 'fast' favours encode throughput, 'max' the smallest file. PNG
+# 'optimize' searches the zlib settings, Z_RLE only matches runs of the same byte; WebP method
+# and the x265 preset trade encode time for size in the same way
+ENCODER_PROFILES = {
+    'fast': {
+        'JPEG': {'optimize': False, 'progressive': False, 'subsampling': '4:2:0'},
+        'PNG': {'compress_level': 1, 'compress_type': zlib.Z_RLE},
+        'WEBP': {'method': 0},
+        'GIF': {'optimize': False},
+        'HEIF': {'enc_params': {'preset': 'ultrafast'}},
+    },
+    'balanced': {
+        'JPEG': {'optimize': True, 'progressive': False, 'subsampling': '4:2:0'},
+        'PNG': {'compress_level': 6},
+        'WEBP': {'method': 4},
+        'GIF': {'optimize': True},
+        'HEIF': {'enc_params': {'preset': 'medium'}},
+    },
+    'max': {
+        'JPEG': {'optimize': True, 'progressive': True, 'subsampling': '4:2:0'},
+        'PNG': {'optimize': True},
+        'WEBP': {'method': 6},
+        'GIF': {'optimize': True},
+        'HEIF': {'enc_params': {'preset': 'slow'}},
+    },
+}
+DEFAULT_ENCODER_PROFILE = 'balanced'
+
+# Transpose that displays an image the right way up for each EXIF orientation (as ImageOps.exif_transpose)
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+EXIF_ORIENTATION = 0x0112
+
+# The draft decode keeps at least this many times the target size, so the final
+# resample still has enough pixels to produce a high quality result
+DRAFT_REDUCING_GAP = 2.0
+
+def encoder_options(format, profile=None, **save_kwargs):
+    """Save options of an encoder profile (default: DEFAULT_ENCODER_PROFILE) for format,
+    overridden by any explicit save_kwargs"""
+    profile = profile or DEFAULT_ENCODER_PROFILE
+    if profile not in ENCODER_PROFILES:
+        raise ValueError(f"Unknown encoder profile '{profile}', choose from {', '.join(ENCODER_PROFILES)}")
+    # Copy nested options, the HEIF plugin adds to enc_params
+    options = {key: dict(value) if isinstance(value, dict) else value
+               for key, value in ENCODER_PROFILES[profile].get(format, {}).items()}
+    options.update(save_kwargs)
+    return options
+
+def flatten_alpha(img):
+    """Paste transparent images onto a white background so they can be saved as JPEG"""
+    if img.mode not in ('RGBA', 'LA', 'P'):
+        return img
+    
+    background = Image.new('RGB', img.size, (255, 255, 255))
+    if img.mode in ('RGBA', 'LA'):
+        background.paste(img, mask=img.split()[-1])
+    else:
+        background.paste(img)
+    return background
+
+class Operation:
+    """A single named step of a Pipeline"""
+    
+    # Parameters measured in pixels, scaled when the operation runs on a preview proxy
+    proxy_params = ()
+    # size_func(size, **params) gives the output size for operations that change the geometry
+    size_func = None
+    
+    def __init__(self, name, func, **params):
+        self.name = name
+        self.func = func
+        self.params = params
+    
+    def __call__(self, img):
+        return self.func(img, **self.params)
+    
+    def output_size(self, size):
+        """Size of the result for an input image of the given size"""
+        return self.size_func(size, **self.params) if self.size_func else size
+    
+    def for_proxy(self, scale):
+        """Equivalent operation for a proxy that is scale times the size of the real image"""
+        if scale == 1 or not self.proxy_params:
+            return self
+        params = dict(self.params)
+        for name in self.proxy_params:
+            # Pixel counts stay whole numbers, float factors are scaled as they are
+            value = params[name] * scale
+            params[name] = value if isinstance(params[name], float) else max(1, round(value))
+        op = Operation(self.name, self.func, **params)
+        op.proxy_params = self.proxy_params
+        op.size_func = self.size_func
+        return op
+    
+    def key(self):
+        """Canonical, hashable description of the operation"""
+        return (self.name,) + tuple(sorted(self.params.items()))
+    
+    def __repr__(self):
+        params = ", ".join(f"{key}={value!r}" for key, value in self.params.items())
+        return f"{self.name}({params})"
+
+def fit_within(size, box):
+    """Largest size that fits in box keeping the aspect ratio (same rounding as Image.thumbnail)"""
+    width, height = size
+    x, y = map(math.floor, box)
+    if x >= width and y >= height:
+        return size
+    
+    def round_aspect(number, key):
+        return max(min(math.floor(number), math.ceil(number), key=key), 1)
+    
+    aspect = width / height
+    if x / y >= aspect:
+        x = round_aspect(y * aspect, key=lambda n: abs(aspect - n / y))
+    else:
+        y = round_aspect(x / aspect, key=lambda n: 0 if n == 0 else abs(aspect - x / n))
+    return x, y
+
+def draft_resize(img, size, resample=Image.Resampling.LANCZOS, draft=True):
+    """Resize img to size, letting a not yet decoded JPEG decode at 1/2, 1/4 or 1/8 scale
+    first (Image.draft) and finishing with a high quality resample; draft=False disables this"""
+    size = tuple(size)
+    if img.size == size:
+        return img
+    
+    if not draft:
+        return img.resize(size, resample)
+    
+    # draft() is a no-op for other formats and for images that are already decoded
+    box = None
+    res = img.draft(None, (int(size[0] * DRAFT_REDUCING_GAP), int(size[1] * DRAFT_REDUCING_GAP)))
+    if res is not None:
+        box = res[1]
+    return img.resize(size, resample, box=box, reducing_gap=DRAFT_REDUCING_GAP)
+
+def exif_orientation(img):
+    """EXIF orientation (1 to 8) of an opened image, read from the header without decoding the
+    pixels; 1 if the image has no valid orientation tag"""
+    exif = Image.Exif()
+    if img.info.get('exif'):
+        exif.load(img.info['exif'])
+    elif img.format == 'TIFF':
+        exif = img.getexif()
+    orientation = exif.get(EXIF_ORIENTATION, 1)
+    return orientation if orientation in ORIENTATION_TRANSPOSE else 1
+
+def oriented_size(size, orientation):
+    """Size of an image of the given stored size once its EXIF orientation is applied"""
+    return (size[1], size[0]) if orientation in (5, 6, 7, 8) else tuple(size)
+
+def apply_orientation(img, orientation=None):
+    """img turned the right way up for its EXIF orientation (default: read from img), with the
+    tag reset so it is not applied twice; img itself if it is already upright"""
+    orientation = exif_orientation(img) if orientation is None else orientation
+    method = ORIENTATION_TRANSPOSE.get(orientation)
+    if method is None:
+        return img
+    if exif_orientation(img) == orientation:
+        # exif_transpose also resets the orientation in the EXIF and XMP of the result
+        return ImageOps.exif_transpose(img)
+    return img.transpose(method)
+
+def _transpose_probe(methods):
+    probe = Image.frombytes('L', (2, 3), bytes(range(6)))
+    for method in methods:
+        probe = probe.transpose(method)
+    return probe.size, probe.tobytes()
+
+def compose_transposes(first, second):
+    """Single transpose equal to transposing by first and then by second, None if they cancel out"""
+    wanted = _transpose_probe([first, second])
+    if wanted == _transpose_probe([]):
+        return None
+    return next(method for method in Image.Transpose if _transpose_probe([method]) == wanted)
+
+def _resize(img, width, height, maintain_aspect=True, resample="LANCZOS", draft=True):
+    size = fit_within(img.size, (width, height)) if maintain_aspect else (width, height)
+    return draft_resize(img, size, getattr(Image.Resampling, resample), draft)
+
+def _resize_size(size, width, height, maintain_aspect=True, **kwargs):
+    return fit_within(size, (width, height)) if maintain_aspect else (width, height)
+
+def _orient_resize(img, orientation, width, height, maintain_aspect=True, resample="LANCZOS", draft=True):
+    # Resize the image as stored to the transposed target size, then transpose the small result:
+    # a single resample, and the draft decode still applies
+    size = _resize_size(oriented_size(img.size, orientation), width, height, maintain_aspect)
+    img = draft_resize(img, oriented_size(size, orientation), getattr(Image.Resampling, resample), draft)
+    return apply_orientation(img, orientation)
+
+def _orient_resize_size(size, orientation, **params):
+    return _resize_size(oriented_size(size, orientation), **params)
+
+def _rotate(img, angle, expand=True, fillcolor='white'):
+    return img.rotate(angle, expand=expand, fillcolor=fillcolor)
+
+def _rotate_size(size, angle, expand=True, **kwargs):
+    # Same bounding box computation as Image.rotate(expand=True)
+    width, height = size
+    angle = angle % 360.0
+    if not expand or angle == 0 or angle == 180:
+        return size
+    if angle in (90, 270):
+        return height, width
+    
+    radians = -math.radians(angle)
+    cos, sin = round(math.cos(radians), 15), round(math.sin(radians), 15)
+    cx, cy = width / 2, height / 2
+    corners = [(x - cx, y - cy) for x, y in ((0, 0), (width, 0), (width, height), (0, height))]
+    xs = [cos * x + sin * y + cx for x, y in corners]
+    ys = [-sin * x + cos * y + cy for x, y in corners]
+    return (math.ceil(max(xs)) - math.floor(min(xs)), math.ceil(max(ys)) - math.floor(min(ys)))
+
+def _orient(img, orientation):
+    return apply_orientation(img, orientation)
+
+def _orient_size(size, orientation):
+    return oriented_size(size, orientation)
+
+def _convert_mode(img, mode):
+    return img if img.mode == mode else img.convert(mode)
+
+def _flatten(img):
+    return flatten_alpha(img)
+
+def _apply_filter(img, filter_name):
+    # Filters need numpy, which the CLI version does not otherwise depend on
+    from image_filters import apply_named_filter
+    return apply_named_filter(img, filter_name)
+
+def _enhance(img, brightness=1.0, contrast=1.0, saturation=1.0, sharpness=1.0):
+    from image_filters import apply_enhancements
+    return apply_enhancements(img, brightness, contrast, saturation, sharpness)
+
+def crop_box_for_ratio(size, ratio):
+    """Centered crop box for an aspect ratio such as '4:3', or None for 'Original'"""
+    width, height = size
+    
+    if ratio == "1:1":
+        new_width = new_height = min(width, height)
+    elif ratio in ("4:3", "16:9", "3:2"):
+        ratio_w, ratio_h = map(int, ratio.split(':'))
+        if width > height:
+            new_height = height
+            new_width = int(height * ratio_w / ratio_h)
+        else:
+            new_width = width
+            new_height = int(width * ratio_h / ratio_w)
+    else:
+        return None
+    
+    # Ensure we don't exceed original dimensions
+    new_width = min(new_width, width)
+    new_height = min(new_height, height)
+    
+    # Center crop
+    left = (width - new_width) // 2
+    top = (height - new_height) // 2
+    return left, top, left + new_width, top + new_height
+
+def _crop_to_ratio(img, ratio):
+    box = crop_box_for_ratio(img.size, ratio)
+    return img.crop(box) if box else img
+
+def _crop_size(size, ratio):
+    box = crop_box_for_ratio(size, ratio)
+    return (box[2] - box[0], box[3] - box[1]) if box else size
+
+def _watermark(img, text, position="Bottom Right", scale=1.0):
+    from image_tiles import add_watermark
+    return add_watermark(img, text, position, scale)
+
+def _encode(img, format=None, **save_kwargs):
+    # Encoding is performed by Pipeline.run, this only keeps the operation callable
+    return img
+
+def resize(width, height=None, maintain_aspect=True, resample="LANCZOS", draft=True):
+    """Resize to width x height (height defaults to width), keeping aspect ratio by default;
+    draft enables the reduced-scale JPEG decode when this is the first operation"""
+    op = Operation('resize', _resize, width=int(width), height=int(height or width),
+                   maintain_aspect=maintain_aspect, resample=resample, draft=draft)
+    op.proxy_params = ('width', 'height')
+    op.size_func = _resize_size
+    return op
+
+def rotate(angle, expand=True, fillcolor='white'):
+    """Rotate counter-clockwise by angle degrees"""
+    op = Operation('rotate', _rotate, angle=float(angle), expand=expand, fillcolor=fillcolor)
+    op.size_func = _rotate_size
+    return op
+
+def orient(orientation):
+    """Apply an EXIF orientation (1-8), turning an image as stored the right way up"""
+    op = Operation('orient', _orient, orientation=int(orientation))
+    op.size_func = _orient_size
+    return op
+
+def convert_mode(mode):
+    """Convert the image to another PIL mode, e.g. 'RGB' or 'L'"""
+    return Operation('convert_mode', _convert_mode, mode=mode)
+
+def flatten():
+    """Flatten transparency onto a white background"""
+    return Operation('flatten', _flatten)
+
+def apply_filter(filter_name):
+    """Apply one of image_filters.FILTER_NAMES"""
+    from image_filters import FILTER_NAMES
+    if filter_name not in FILTER_NAMES:
+        raise ValueError(f"Unknown filter '{filter_name}'. Available: {', '.join(FILTER_NAMES)}")
+    return Operation('filter', _apply_filter, filter_name=filter_name)
+
+def enhance(brightness=1.0, contrast=1.0, saturation=1.0, sharpness=1.0):
+    """Brightness, contrast, saturation and sharpness factors (1.0 = unchanged), applied in that order"""
+    return Operation('enhance', _enhance, brightness=float(brightness), contrast=float(contrast),
+                     saturation=float(saturation), sharpness=float(sharpness))
+
+def crop_to_ratio(ratio):
+    """Center crop to an aspect ratio: '1:1', '4:3', '16:9' or '3:2'"""
+    op = Operation('crop', _crop_to_ratio, ratio=ratio)
+    op.size_func = _crop_size
+    return op
+
+def watermark(text, position="Bottom Right"):
+    """Add a semi-transparent text watermark at one of the GUI positions, e.g. 'Top Left' or 'Center'"""
+    # The font size and margins depend on the image size, so a proxy scales the watermark
+    # of the full image rather than laying out its own
+    op = Operation('watermark', _watermark, text=text, position=position, scale=1.0)
+    op.proxy_params = ('scale',)
+    return op
+
+def encode(format=None, quality=None, max_bytes=None, min_ssim=None, profile=None, **save_kwargs):
+    """Final encode step; format defaults to the output extension or the source format. The
+    encoder profile sets the effort (see ENCODER_PROFILES), save_kwargs override it. With
+    max_bytes and/or min_ssim the JPEG/WebP quality is searched (see image_quality.QualitySearch)"""
+    if profile:
+        # Fail when the pipeline is built rather than at the first encode
+        encoder_options(None, profile)
+        save_kwargs['profile'] = profile
+    if quality is not None:
+        save_kwargs['quality'] = int(quality)
+    if max_bytes:
+        save_kwargs['max_bytes'] = int(max_bytes)
+    if min_ssim:
+        save_kwargs['min_ssim'] = float(min_ssim)
+    return Operation('encode', _encode, format=format.upper() if format else None, **save_kwargs)
+
+def parse_operation(spec):
+    """Parse a CLI operation spec such as 'resize:1600', 'rotate:90', 'filter:sepia',
+    'watermark:text:bottom_right', 'encode:webp:80:fast' or 'encode:jpg:200KB:ssim=0.98'"""
+    name, *args = spec.strip().split(':')
+    name = name.lower()
+    
+    try:
+        if name == 'resize':
+            if not args:
+                raise ValueError("resize needs dimensions, e.g. resize:800x600")
+            if 'x' in args[0].lower():
+                width, height = map(int, args[0].lower().split('x'))
+            else:
+                width = height = int(args[0])
+            return resize(width, height, maintain_aspect='exact' not in args[1:],
+                          draft='nodraft' not in args[1:])
+        elif name == 'rotate':
+            if not args:
+                raise ValueError("rotate needs an angle, e.g. rotate:90")
+            return rotate(float(args[0]), expand='noexpand' not in args[1:])
+        elif name == 'filter':
+            from image_filters import FILTER_NAMES
+            wanted = args[0].replace('_', ' ').lower() if args else ''
+            matches = [f for f in FILTER_NAMES if f.lower() == wanted]
+            if not matches:
+                raise ValueError(f"Unknown filter '{wanted}'. Available: {', '.join(FILTER_NAMES)}")
+            return apply_filter(matches[0])
+        elif name == 'grayscale':
+            return apply_filter("Grayscale")
+        elif name == 'flatten':
+            return flatten()
+        elif name == 'watermark':
+            if not args:
+                raise ValueError("watermark needs a text, e.g. watermark:Copyright:bottom_right")
+            position = args[1].replace('_', ' ').title() if len(args) > 1 else "Bottom Right"
+            return watermark(args[0], position)
+        elif name == 'encode':
+            fmt = args[0] if args else None
+            if fmt and fmt.lower() in ('jpg', 'jpeg'):
+                fmt = 'JPEG'
+            quality = max_bytes = min_ssim = profile = None
+            for arg in args[1:]:
+                if arg.lower().startswith('ssim='):
+                    from image_quality import parse_ssim
+                    min_ssim = parse_ssim(arg[5:])
+                elif arg.isdigit():
+                    quality = int(arg)
+                elif arg.lower() in ENCODER_PROFILES:
+                    profile = arg.lower()
+                else:
+                    from image_quality import parse_byte_size
+                    max_bytes = parse_byte_size(arg)
+            return encode(fmt, quality, max_bytes, min_ssim, profile)
+    except (TypeError, IndexError) as e:
+        raise ValueError(f"Invalid operation '{spec}': {str(e)}")
+    
+    raise ValueError(f"Unknown operation '{name}'")
+
+def fold_orientation(operations, orientation):
+    """Operations that give the same result on an image as stored as the given operations on
+    the image turned upright for its EXIF orientation. The orientation is folded into a first
+    resize, which then resamples once and transposes the small result; otherwise an orient
+    step is prepended"""
+    operations = list(operations)
+    if orientation not in ORIENTATION_TRANSPOSE:
+        return operations
+    if operations and operations[0].name == 'resize':
+        first = operations[0]
+        op = Operation('resize', _orient_resize, orientation=orientation, **first.params)
+        op.proxy_params = first.proxy_params
+        op.size_func = _orient_resize_size
+        return [op] + operations[1:]
+    return [orient(orientation)] + operations
+
+class Pipeline:
+    """Ordered list of operations applied to a single decoded image, encoded once at the end.
+    With auto_orient the EXIF orientation of the source is applied first, folded into the first
+    operation where possible (see fold_orientation); images processed in strips keep it as stored"""
+    
+    def __init__(self, operations, auto_orient=True):
+        operations = list(operations)
+        self.auto_orient = auto_orient
+        self.encoder = None
+        if operations and operations[-1].name == 'encode':
+            self.encoder = operations.pop()
+        if any(op.name == 'encode' for op in operations):
+            raise ValueError("encode() must be the last operation of a pipeline")
+        self.operations = operations
+        # Quality searches by output format, shared by every image the pipeline encodes
+        self.quality_searches = {}
+    
+    def key(self):
+        """Canonical, hashable description of the whole pipeline"""
+        ops = self.operations + ([self.encoder] if self.encoder else [])
+        return tuple(op.key() for op in ops)
+    
+    def apply(self, img, orientation=1):
+        """Run the in-memory operations on an image, returning a new image; orientation is the
+        EXIF orientation to apply on the way"""
+        for op in fold_orientation(self.operations, orientation):
+            img = op(img)
+        return img
+    
+    def encode(self, img, output=None, source_format=None):
+        """Encode img to a path or file object, or return the encoded bytes if output is None"""
+        params = dict(self.encoder.params) if self.encoder else {}
+        output_format = params.pop('format', None)
+        if not output_format and isinstance(output, (str, Path)):
+            output_format = FORMAT_MAP.get(Path(output).suffix.lower())
+        output_format = output_format or source_format or 'PNG'
+        params = encoder_options(output_format, params.pop('profile', None), **params)
+        
+        if output_format == 'JPEG':
+            img = flatten_alpha(img)
+        
+        max_bytes = params.pop('max_bytes', None) or None
+        min_ssim = params.pop('min_ssim', None) or None
+        if max_bytes or min_ssim:
+            from image_quality import QualitySearch
+            params.pop('quality', None)
+            search = self.quality_searches.get(output_format)
+            if search is None:
+                search = self.quality_searches[output_format] = QualitySearch(output_format, max_bytes, min_ssim,
+                                                                              **params)
+            data = search.search(img)["data"]
+            if output is None:
+                return output_format, data
+            if isinstance(output, (str, Path)):
+                with open(output, 'wb') as f:
+                    f.write(data)
+            else:
+                output.write(data)
+            return output_format, None
+        
+        if output is None:
+            buffer = io.BytesIO()
+            img.save(buffer, format=output_format, **params)
+            return output_format, buffer.getvalue()
+        
+        img.save(output, format=output_format, **params)
+        return output_format, None
+    
+    def run(self, source, output=None, strip_height=None):
+        """Decode source (path, file object, bytes or PIL image) once, apply every operation and
+        encode once to output (path or file object), or return the encoded bytes if output is None;
+        strip_height processes the image in horizontal strips to bound memory (see image_tiles)"""
+        if strip_height:
+            from image_tiles import run_pipeline_in_strips
+            if isinstance(source, (bytes, bytearray)):
+                source = io.BytesIO(source)
+            return run_pipeline_in_strips(self, source, output, strip_height)
+        
+        if isinstance(source, Image.Image):
+            img = source
+            owned = None
+        else:
+            if isinstance(source, (bytes, bytearray)):
+                source = io.BytesIO(source)
+            img = owned = Image.open(source)
+        
+        try:
+            source_format = img.format or getattr(source, 'format', None)
+            input_size = img.size
+            orientation = exif_orientation(img) if self.auto_orient else 1
+            result = self.apply(img, orientation)
+            output_format, data = self.encode(result, output, source_format)
+            return {
+                "input_size": input_size,
+                "output_size": result.size,
+                "orientation": orientation,
+                "format": output_format,
+                "data": data
+            }
+        finally:
+            if owned is not None:
+                owned.close()
+
+class EditHistory:
+    """Undoable list of operations applied to a base image. Each step is computed once from the
+    previous result; results are kept as snapshots (at most max_snapshots, the base is always
+    kept) so undo and redo only move a cursor.
+    
+    With preview_size, operations are applied to a proxy no larger than that size as they are
+    pushed, and the full resolution result is only rendered when image is read (save/download).
+    
+    With auto_orient the EXIF orientation of the base image is recorded (orientation) and the
+    history starts from the upright image. The full resolution base is only transposed when it
+    is rendered, and when the first operation is a resize the orientation is folded into it"""
+    
+    def __init__(self, base_image, base_key=(), cache=None, max_snapshots=8, preview_size=None,
+                 auto_orient=True):
+        self.base_key = tuple(base_key)
+        self.cache = cache
+        self.max_snapshots = max_snapshots
+        self.operations = []
+        self.cursor = 0
+        self.version = 0
+        self.preview_size = preview_size
+        self.orientation = exif_orientation(base_image) if auto_orient else 1
+        self._sizes = [oriented_size(base_image.size, self.orientation)]
+        # Until the upright base is rendered only the image as stored is kept
+        self._stored_base = base_image
+        self._snapshots = {0: base_image} if self.orientation == 1 else {}
+        
+        self._proxy_snapshots = None
+        width, height = self._sizes[0]
+        if preview_size and (width > preview_size[0] or height > preview_size[1]):
+            # With a cache the proxy is kept with the results, so reopening the image is instant
+            if self.cache is None:
+                proxy = self._make_proxy(base_image)
+            else:
+                proxy = self.cache.get_or_compute(self.base_key + ('proxy',), self._make_proxy, base_image)
+            self._proxy_snapshots = {0: proxy}
+    
+    def _make_proxy(self, base_image):
+        proxy = base_image.copy()
+        proxy.thumbnail(oriented_size(self.preview_size, self.orientation), Image.Resampling.LANCZOS)
+        return apply_orientation(proxy, self.orientation)
+    
+    @property
+    def active_operations(self):
+        """Operations up to the cursor, i.e. without the ones that were undone"""
+        return self.operations[:self.cursor]
+    
+    @property
+    def is_modified(self):
+        return self.cursor > 0
+    
+    @property
+    def can_undo(self):
+        return self.cursor > 0
+    
+    @property
+    def can_redo(self):
+        return self.cursor < len(self.operations)
+    
+    def key(self, count=None):
+        """Cache key of the result after count operations (default: the current one)"""
+        count = self.cursor if count is None else count
+        return self.base_key + tuple(op.key() for op in self.operations[:count])
+    
+    @property
+    def image(self):
+        """Full resolution result of the active operations"""
+        return self._render(self._snapshots, self.cursor, proxy=False)
+    
+    @property
+    def preview(self):
+        """Result of the active operations on the proxy (the full image if there is no proxy)"""
+        if self._proxy_snapshots is None:
+            return self.image
+        return self._render(self._proxy_snapshots, self.cursor, proxy=True)
+    
+    @property
+    def has_proxy(self):
+        return self._proxy_snapshots is not None
+    
+    @property
+    def size(self):
+        """Size of the full resolution result, known without rendering it"""
+        return self._sizes[self.cursor]
+    
+    def _apply(self, index, img, proxy):
+        op = self.operations[index]
+        if proxy:
+            # The proxy of a result is that result fitted within preview_size, so after a
+            # downscaling resize the proxy can be the full resolution result itself
+            full_size = self._sizes[index + 1]
+            op = op.for_proxy(fit_within(full_size, self.preview_size)[0] / full_size[0])
+        if self.cache is None:
+            return op(img)
+        return self.cache.get_or_compute(self.key(index + 1) + (('proxy',) if proxy else ()), op, img)
+    
+    def _render_base(self, count):
+        """Render the first full resolution snapshot from the image as stored, applying the
+        orientation together with the first operation when that is a resize"""
+        if count and self.operations[0].name == 'resize':
+            op = fold_orientation(self.operations[:1], self.orientation)[0]
+            img = op(self._stored_base) if self.cache is None else \
+                self.cache.get_or_compute(self.key(1), op, self._stored_base)
+            self._store(self._snapshots, 1, img)
+        else:
+            self._store(self._snapshots, 0, apply_orientation(self._stored_base, self.orientation))
+    
+    def _render(self, snapshots, count, proxy):
+        if count in snapshots:
+            return snapshots[count]
+        if not any(index <= count for index in snapshots):
+            self._render_base(count)
+            if count in snapshots:
+                return snapshots[count]
+        
+        # Replay from the closest earlier snapshot
+        start = max(index for index in snapshots if index <= count)
+        img = snapshots[start]
+        for index in range(start, count):
+            img = self._apply(index, img, proxy)
+        self._store(snapshots, count, img)
+        return img
+    
+    def _store(self, snapshots, count, img):
+        snapshots[count] = img
+        while len(snapshots) > self.max_snapshots:
+            # Drop the snapshot furthest from the cursor, never the base or the current one
+            candidates = [index for index in snapshots if index not in (0, self.cursor, count)]
+            if not candidates:
+                break
+            del snapshots[max(candidates, key=lambda index: abs(index - self.cursor))]
+    
+    def push(self, operation):
+        """Apply one more operation to the current result, discarding any redo steps;
+        returns the new preview"""
+        del self.operations[self.cursor:]
+        del self._sizes[self.cursor + 1:]
+        for snapshots in (self._snapshots, self._proxy_snapshots):
+            for index in [index for index in snapshots or () if index > self.cursor]:
+                del snapshots[index]
+        
+        self.operations.append(operation)
+        self._sizes.append(operation.output_size(self._sizes[-1]))
+        self.cursor += 1
+        self.version += 1
+        return self.preview
+    
+    def undo(self):
+        if self.can_undo:
+            self.cursor -= 1
+            self.version += 1
+    
+    def redo(self):
+        if self.can_redo:
+            self.cursor += 1
+            self.version += 1
+    
+    def reset(self):
+        """Go back to the base image, keeping the operations available for redo"""
+        if self.cursor:
+            self.cursor = 0
+            self.version += 1
@@ -0,0 +1,214 @@
+from PIL import Image
+import io
+from image_pipeline import flatten_alpha
+
+# Formats with a quality setting that can be searched
+SEARCH_FORMATS = ('JPEG', 'WEBP')
+
+# Range of encoder qualities tried by QualitySearch
+QUALITY_RANGE = (10, 95)
+
+# SSIM is computed on the luma of a copy downsampled to about this many pixels, with a
+# sliding square window of this size
+SSIM_SAMPLE_PIXELS = 1024 * 1024
+SSIM_WINDOW = 7
+
+BYTE_UNITS = {'': 1, 'B': 1, 'K': 1024, 'KB': 1024, 'M': 1024 ** 2, 'MB': 1024 ** 2, 'G': 1024 ** 3, 'GB': 1024 ** 3}
+
+def parse_byte_size(text):
+    """Parse a size such as '200KB', '1.5M' or '50000' into a number of bytes"""
+    text = str(text).strip().upper()
+    number = text.rstrip('KMGB')
+    unit = text[len(number):]
+    try:
+        size = int(float(number) * BYTE_UNITS[unit])
+    except (ValueError, KeyError, OverflowError):
+        raise ValueError(f"Invalid size '{text}', expected e.g. 200KB or 1.5MB")
+    if size <= 0:
+        raise ValueError(f"Invalid size '{text}', it must be at least 1 byte")
+    return size
+
+def parse_ssim(text):
+    """Parse an SSIM target such as '0.98', which must be greater than 0 and at most 1"""
+    try:
+        value = float(text)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid SSIM '{text}', expected a number such as 0.98")
+    if not 0 < value <= 1:
+        raise ValueError(f"Invalid SSIM '{text}', it must be greater than 0 and at most 1")
+    return value
+
+def luma_sample(image, max_pixels=SSIM_SAMPLE_PIXELS):
+    """Float luma array of image, downsampled with a box filter to at most about max_pixels"""
+    import numpy as np
+    from image_analysis import sample_image
+    return np.asarray(sample_image(image.convert('L'), max_pixels), dtype=np.float64)
+
+def _window_means(values, size):
+    """Mean of every size x size window of a 2D array, using an integral image"""
+    import numpy as np
+    total = np.zeros((values.shape[0] + 1, values.shape[1] + 1))
+    np.cumsum(np.cumsum(values, axis=0), axis=1, out=total[1:, 1:])
+    sums = total[size:, size:] - total[:-size, size:] - total[size:, :-size] + total[:-size, :-size]
+    return sums / (size * size)
+
+def ssim(reference, candidate, window=SSIM_WINDOW):
+    """Mean structural similarity of two equally sized luma arrays (see luma_sample), with a
+    uniform window like skimage.metrics.structural_similarity"""
+    import numpy as np
+    if reference.shape != candidate.shape:
+        raise ValueError("SSIM needs images of the same size")
+    window = min(window, *reference.shape)
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+    # Sample rather than population covariance, as skimage does
+    norm = window * window / (window * window - 1) if window > 1 else 1.0
+    
+    mean_x = _window_means(reference, window)
+    mean_y = _window_means(candidate, window)
+    var_x = norm * (_window_means(reference * reference, window) - mean_x * mean_x)
+    var_y = norm * (_window_means(candidate * candidate, window) - mean_y * mean_y)
+    cov = norm * (_window_means(reference * candidate, window) - mean_x * mean_y)
+    
+    numerator = (2 * mean_x * mean_y + c1) * (2 * cov + c2)
+    denominator = (mean_x * mean_x + mean_y * mean_y + c1) * (var_x + var_y + c2)
+    return float(np.mean(numerator / denominator))
+
+def _first_true(ok, lo, hi, guess=None):
+    """Smallest x in [lo, hi] with ok(x), where ok is False below some threshold and True from
+    it on; hi + 1 if there is none. Starting from a guess near the threshold, the search gallops
+    outwards to bracket it before bisecting, so a good guess needs only a few calls"""
+    false_at, true_at = lo - 1, hi + 1
+    if guess is not None:
+        guess = min(max(guess, lo), hi)
+        step = 2
+        if ok(guess):
+            true_at = guess
+            while true_at - step >= lo and ok(true_at - step):
+                true_at -= step
+                step *= 2
+            false_at = max(true_at - step, lo - 1)
+        else:
+            false_at = guess
+            while false_at + step <= hi and not ok(false_at + step):
+                false_at += step
+                step *= 2
+            true_at = min(false_at + step, hi + 1)
+    
+    while true_at - false_at > 1:
+        middle = (false_at + true_at) // 2
+        if ok(middle):
+            true_at = middle
+        else:
+            false_at = middle
+    return true_at
+
+class QualitySearch:
+    """Search the JPEG or WebP quality for a byte budget (max_bytes) and/or a minimum SSIM
+    against the source image (min_ssim).
+    
+    With min_ssim the lowest quality reaching it is used, giving the smallest such file; with
+    only max_bytes the highest quality that fits is used. When both are given and the SSIM target
+    does not fit the budget, the budget wins and the result is marked as not met. Each of the
+    subsampling_variants (JPEG) or method_variants (WebP) is searched and the smallest file is
+    kept (the largest when there is only a budget).
+    
+    Trial encodes go to memory and are cached per image. The quality found is the starting point
+    for the next image, so one instance shared across a batch of similar images needs only a few
+    encodes per image"""
+    
+    def __init__(self, format='JPEG', max_bytes=None, min_ssim=None, quality_range=QUALITY_RANGE,
+                 subsampling_variants=None, method_variants=None, **save_kwargs):
+        format = format.upper()
+        if format not in SEARCH_FORMATS:
+            raise ValueError(f"Quality search supports {', '.join(SEARCH_FORMATS)}, not {format}")
+        if max_bytes is None and min_ssim is None:
+            raise ValueError("Quality search needs a size or SSIM target")
+        if max_bytes is not None and int(max_bytes) <= 0:
+            raise ValueError(f"Quality search size target must be at least 1 byte, not {max_bytes}")
+        if min_ssim is not None and not 0 < float(min_ssim) <= 1:
+            raise ValueError(f"Quality search SSIM target must be greater than 0 and at most 1, not {min_ssim}")
+        self.format = format
+        self.max_bytes = int(max_bytes) if max_bytes is not None else None
+        self.min_ssim = float(min_ssim) if min_ssim is not None else None
+        self.quality_range = quality_range
+        self.save_kwargs = save_kwargs
+        
+        if format == 'JPEG' and subsampling_variants:
+            self.variants = [{'subsampling': value} for value in subsampling_variants]
+        elif format == 'WEBP' and method_variants:
+            self.variants = [{'method': value} for value in method_variants]
+        else:
+            self.variants = [{}]
+        
+        self.warm_quality = {}
+        self.images = 0
+        self.encodes = 0
+    
+    def _encode(self, img, quality, variant):
+        buffer = io.BytesIO()
+        img.save(buffer, format=self.format, **{**self.save_kwargs, 'quality': quality, **variant})
+        self.encodes += 1
+        return buffer.getvalue()
+    
+    def search(self, img):
+        """Encode img at the best quality for the targets; returns a dict with the encoded
+        'data' and its 'quality', 'params', 'size', 'ssim' (None if not measured), the number
+        of 'trials' encoded and whether the targets were 'met'"""
+        if self.format == 'JPEG':
+            img = flatten_alpha(img)
+        reference = luma_sample(img) if self.min_ssim else None
+        lo, hi = self.quality_range
+        trials = {}
+        
+        def encoded(quality, variant):
+            key = (quality, tuple(sorted(variant.items())))
+            if key not in trials:
+                data = self._encode(img, quality, variant)
+                trials[key] = {"data": data, "size": len(data), "ssim": None}
+            return trials[key]
+        
+        def measured(quality, variant):
+            result = encoded(quality, variant)
+            if reference is not None and result["ssim"] is None:
+                with Image.open(io.BytesIO(result["data"])) as decoded:
+                    result["ssim"] = ssim(reference, luma_sample(decoded))
+            return result
+        
+        def fits(quality, variant):
+            return encoded(quality, variant)["size"] <= self.max_bytes
+        
+        best = best_rank = None
+        for variant in self.variants:
+            variant_key = tuple(sorted(variant.items()))
+            met = True
+            quality = top = hi
+            if self.max_bytes:
+                # Highest quality that fits, searched as the first quality that does not; the
+                # SSIM search below then only needs to look at qualities that fit
+                guess = self.warm_quality.get((variant_key, 'size'))
+                first_over = _first_true(lambda q: not fits(q, variant), lo, hi,
+                                         guess + 1 if guess is not None else None)
+                quality = top = max(first_over - 1, lo)
+                met = first_over > lo
+                self.warm_quality[(variant_key, 'size')] = quality
+            if self.min_ssim:
+                guess = self.warm_quality.get((variant_key, 'ssim'))
+                first_good = _first_true(lambda q: measured(q, variant)["ssim"] >= self.min_ssim, lo, top, guess)
+                if first_good <= top:
+                    quality = self.warm_quality[(variant_key, 'ssim')] = first_good
+                else:
+                    met = False
+            
+            result = dict(measured(quality, variant))
+            result.update(quality=quality, params=dict(variant), met=met)
+            # Prefer variants meeting the targets, then the smallest file, or with only a
+            # budget the file making the most use of it
+            rank = (not met, result["size"] if self.min_ssim else -result["size"])
+            if best is None or rank < best_rank:
+                best, best_rank = result, rank
+        
+        self.images += 1
+        best["format"] = self.format
+        best["trials"] = len(trials)
+        return best
@@ -0,0 +1,281 @@
+from pathlib import Path
+from PIL import Image, ImageDraw, ImageFont
+
+DEFAULT_STRIP_HEIGHT = 256
+
+# Bytes per pixel of the raw layouts that can be read a few rows at a time
+RAW_PIXEL_SIZES = {'L': 1, 'RGB': 3, 'BGR': 3, 'RGBX': 4, 'BGRX': 4, 'RGBA': 4, 'BGRA': 4}
+
+# Rows of context a filter needs above and below a strip to give the same result as on the whole image
+FILTER_HALOS = {
+    "Grayscale": 0, "Sepia": 0, "Cool": 0, "Warm": 0,
+    "Blur": 2, "Gaussian Blur": 8, "Edge Enhance": 1, "Emboss": 1, "Find Edges": 1, "Vintage": 3
+}
+
+# Formats that can be written a strip at a time
+STREAMING_FORMATS = {'.ppm': 'P6', '.pnm': 'P6', '.pgm': 'P5'}
+
+class StripReader:
+    """Read horizontal strips of an image. Uncompressed BMP, PPM/PGM and TIFF files are read
+    straight from disk a few rows at a time; other formats (JPEG, PNG...) are fully decoded
+    into memory once and cropped"""
+    
+    def __init__(self, source):
+        self.img = Image.open(source) if not isinstance(source, Image.Image) else source
+        self.size = self.img.size
+        self.width, self.height = self.size
+        self.mode = self.img.mode
+        self.format = self.img.format
+        self.bands = self._raw_bands()
+        if self.bands is None:
+            self.img.load()
+    
+    def _raw_bands(self):
+        fp = getattr(self.img, 'fp', None)
+        if fp is None or not self.img.tile or self.mode not in ('L', 'RGB', 'RGBA'):
+            return None
+        
+        bands = []
+        for tile in self.img.tile:
+            codec, extents, offset, args = tile
+            rawmode, stride, orientation = (args, 0, 1) if isinstance(args, str) else (tuple(args) + (0, 1))[:3]
+            if codec != 'raw' or rawmode not in RAW_PIXEL_SIZES:
+                return None
+            x0, y0, x1, y1 = extents
+            if x0 != 0 or x1 != self.width:
+                return None
+            stride = stride or self.width * RAW_PIXEL_SIZES[rawmode]
+            bands.append((y0, y1, offset, rawmode, stride, orientation or 1))
+        return bands
+    
+    def read(self, top, bottom):
+        """Return rows [top, bottom) as a new image"""
+        if self.bands is None:
+            return self.img.crop((0, top, self.width, bottom))
+        
+        strip = Image.new(self.mode, (self.width, bottom - top))
+        for y0, y1, offset, rawmode, stride, orientation in self.bands:
+            start, end = max(top, y0), min(bottom, y1)
+            if start >= end:
+                continue
+            # Bottom-up files (BMP) store the last row first
+            first_row = (y1 - end) if orientation < 0 else (start - y0)
+            self.img.fp.seek(offset + first_row * stride)
+            data = self.img.fp.read((end - start) * stride)
+            band = Image.frombytes(self.mode, (self.width, end - start), data, 'raw', rawmode, stride, orientation)
+            strip.paste(band, (0, start - top))
+        return strip
+    
+    def close(self):
+        self.img.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+class StripWriter:
+    """Write an image strip by strip; PPM/PGM are streamed to disk, other formats
+    are assembled in one full-size output image and encoded when the writer is closed"""
+    
+    def __init__(self, output, size, mode, format=None, **save_kwargs):
+        self.output = output
+        self.size = size
+        self.mode = mode
+        self.format = format
+        self.save_kwargs = save_kwargs
+        self.rows_written = 0
+        
+        suffix = Path(output).suffix.lower() if isinstance(output, (str, Path)) else None
+        self.magic = STREAMING_FORMATS.get(suffix) if not format or format == 'PPM' else None
+        if self.magic:
+            self.mode = 'L' if self.magic == 'P5' else 'RGB'
+            self.fp = open(output, 'wb')
+            self.fp.write(f"{self.magic}\n{size[0]} {size[1]}\n255\n".encode('ascii'))
+            self.image = None
+        else:
+            self.fp = None
+            self.image = Image.new(mode, size)
+    
+    def write(self, strip):
+        """Append the next strip below the rows already written"""
+        if self.fp is not None:
+            self.fp.write(strip.convert(self.mode).tobytes())
+        else:
+            self.image.paste(strip.convert(self.image.mode), (0, self.rows_written))
+        self.rows_written += strip.height
+    
+    def close(self):
+        if self.fp is not None:
+            self.fp.close()
+        elif self.image is not None:
+            img = self.image
+            if self.format == 'JPEG':
+                from image_pipeline import flatten_alpha
+                img = flatten_alpha(img)
+            img.save(self.output, format=self.format, **self.save_kwargs)
+            self.image = None
+
+def iter_strips(height, strip_height=DEFAULT_STRIP_HEIGHT, halo=0):
+    """Yield (top, bottom, read_top, read_bottom) for strips covering height rows, where the
+    read range adds halo rows of context on both sides"""
+    for top in range(0, height, strip_height):
+        bottom = min(top + strip_height, height)
+        yield top, bottom, max(0, top - halo), min(height, bottom + halo)
+
+def watermark_patch(image_size, text, position):
+    """Render a text watermark into a small RGBA patch, returning (patch, (x, y)) where (x, y)
+    is the top left corner of the patch in the image; same layout as the GUI watermarks"""
+    width, height = image_size
+    
+    # Try to use a reasonable font size
+    font_size = max(20, min(width, height) // 20)
+    try:
+        font = ImageFont.truetype("arial.ttf", font_size)
+    except:
+        font = ImageFont.load_default()
+    
+    # Get text size
+    bbox = ImageDraw.Draw(Image.new('RGBA', (1, 1))).textbbox((0, 0), text, font=font)
+    text_width = bbox[2] - bbox[0]
+    text_height = bbox[3] - bbox[1]
+    
+    # Calculate position
+    margin = 20
+    if position == "Top Left":
+        x, y = margin, margin
+    elif position == "Top Right":
+        x, y = width - text_width - margin, margin
+    elif position == "Bottom Left":
+        x, y = margin, height - text_height - margin
+    elif position == "Bottom Right":
+        x, y = width - text_width - margin, height - text_height - margin
+    else:  # Center
+        x, y = (width - text_width) // 2, (height - text_height) // 2
+    
+    # The patch covers the background box and the glyphs, which may extend past the text box
+    left, top = x - 5, y - 5
+    right = x + max(text_width + 5, bbox[2]) + 1
+    bottom = y + max(text_height + 5, bbox[3]) + 1
+    
+    patch = Image.new('RGBA', (right - left, bottom - top), (255, 255, 255, 0))
+    draw = ImageDraw.Draw(patch)
+    draw.rectangle([0, 0, text_width + 10, text_height + 10], fill=(0, 0, 0, 128))
+    draw.text((x - left, y - top), text, font=font, fill=(255, 255, 255, 200))
+    return patch, (left, top)
+
+def composite_patch(img, patch, origin, offset_y=0):
+    """Alpha composite patch onto img in place, with origin given in full image coordinates
+    and img being the strip that starts at row offset_y"""
+    x, y = origin[0], origin[1] - offset_y
+    left, top = max(x, 0), max(y, 0)
+    right, bottom = min(x + patch.width, img.width), min(y + patch.height, img.height)
+    if left >= right or top >= bottom:
+        return img
+    
+    region = img.crop((left, top, right, bottom)).convert('RGBA')
+    region.alpha_composite(patch.crop((left - x, top - y, right - x, bottom - y)))
+    img.paste(region.convert(img.mode), (left, top))
+    return img
+
+def add_watermark(image, text, position, scale=1.0):
+    """Add a semi-transparent text watermark, compositing only the area under the text; scale
+    below 1 marks image as a preview proxy of a larger image, which gets the watermark of that
+    image scaled down"""
+    # The GUIs always returned an RGB image
+    watermarked = image.convert('RGB') if image.mode != 'RGB' else image.copy()
+    if scale == 1:
+        patch, origin = watermark_patch(watermarked.size, text, position)
+    else:
+        full_size = (round(watermarked.width / scale), round(watermarked.height / scale))
+        patch, origin = watermark_patch(full_size, text, position)
+        patch = patch.resize((max(1, round(patch.width * scale)), max(1, round(patch.height * scale))),
+                             Image.Resampling.LANCZOS)
+        origin = (round(origin[0] * scale), round(origin[1] * scale))
+    return composite_patch(watermarked, patch, origin)
+
+def _run_strips(reader, funcs, strip_height):
+    # funcs is a list of (halo, func(img, read_top)); the halos add up since each
+    # filter only produces exact rows where its input rows were exact
+    halo = sum(func_halo for func_halo, _ in funcs)
+    
+    def apply(strip, read_top):
+        for _, func in funcs:
+            strip = func(strip, read_top)
+        return strip
+    
+    for top, bottom, read_top, read_bottom in iter_strips(reader.height, strip_height, halo):
+        result = apply(reader.read(read_top, read_bottom), read_top)
+        yield top, result.crop((0, top - read_top, result.width, bottom - read_top))
+
+def _strip_functions(operations, reader, strip_height):
+    from image_filters import apply_named_filter, apply_sepia, apply_vintage, VINTAGE_CONTRAST_LUT
+    from image_pipeline import flatten_alpha
+    
+    funcs = []
+    for op in operations:
+        if op.name == 'filter' and op.params['filter_name'] == 'Vintage':
+            # The contrast step needs the mean of the whole image, so the strips are read
+            # once more to build the histogram (the blur does not change the mean)
+            histogram = None
+            for _, strip in _run_strips(reader, funcs, strip_height):
+                strip_histogram = apply_sepia(strip).convert('RGB').histogram()
+                histogram = strip_histogram if histogram is None else [
+                    a + b for a, b in zip(histogram, strip_histogram)]
+            contrast = VINTAGE_CONTRAST_LUT.bind(histogram)
+            funcs.append((FILTER_HALOS['Vintage'], lambda img, top, contrast=contrast: apply_vintage(img, contrast=contrast)))
+        elif op.name == 'filter':
+            filter_name = op.params['filter_name']
+            funcs.append((FILTER_HALOS[filter_name], lambda img, top, filter_name=filter_name: apply_named_filter(img, filter_name)))
+        elif op.name == 'flatten':
+            funcs.append((0, lambda img, top: flatten_alpha(img)))
+        elif op.name == 'convert_mode':
+            funcs.append((0, lambda img, top, mode=op.params['mode']: img.convert(mode)))
+        elif op.name == 'watermark':
+            # The patch is rendered once for the full image size and composited into the strips it overlaps
+            patch, origin = watermark_patch(reader.size, op.params['text'], op.params['position'])
+            funcs.append((0, lambda img, top, patch=patch, origin=origin: composite_patch(
+                img.convert('RGB') if img.mode != 'RGB' else img, patch, origin, top)))
+        else:
+            raise ValueError(f"Operation '{op.name}' changes the image geometry and cannot run in strips")
+    return funcs
+
+def run_pipeline_in_strips(pipeline, source, output=None, strip_height=DEFAULT_STRIP_HEIGHT):
+    """Pipeline.run() for very large images: rows are read, processed and written a strip at a time,
+    so intermediate images are bounded by the strip height instead of the image size. The whole
+    run only stays within bounded memory for raw BMP/PPM/TIFF input written as PPM/PGM: other
+    inputs are decoded in full by StripReader and other outputs are assembled in full by StripWriter"""
+    import io
+    from image_pipeline import FORMAT_MAP, encoder_options
+    
+    params = dict(pipeline.encoder.params) if pipeline.encoder else {}
+    output_format = params.pop('format', None)
+    if not output_format and isinstance(output, (str, Path)):
+        output_format = FORMAT_MAP.get(Path(output).suffix.lower())
+    if 'max_bytes' in params or 'min_ssim' in params:
+        raise ValueError("A size or SSIM target needs the whole image and cannot be encoded in strips")
+    profile = params.pop('profile', None)
+    
+    with StripReader(source) as reader:
+        output_format = output_format or reader.format or 'PNG'
+        funcs = _strip_functions(pipeline.operations, reader, strip_height)
+        target = io.BytesIO() if output is None else output
+        
+        writer = None
+        try:
+            for top, strip in _run_strips(reader, funcs, strip_height):
+                if writer is None:
+                    writer = StripWriter(target, reader.size, strip.mode, output_format,
+                                         **encoder_options(output_format, profile, **params))
+                writer.write(strip)
+        finally:
+            if writer is not None:
+                writer.close()
+        
+        return {
+            "input_size": reader.size,
+            "output_size": reader.size,
+            "format": output_format,
+            "data": target.getvalue() if output is None else None
+        }
@@ -0,0 +1,57 @@
+import base64
+import io
+import json
+from PIL import Image
+from image_manupulator import read_manifest, b64_bulk_record, run_bounded
+
+def data_uri(fmt='png'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), (255, 0, 0)).save(buffer, format=fmt)
+    return f"data:image/{fmt};base64," + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+def run_manifest(lines, output_dir, jobs=1):
+    stream = io.BytesIO("\n".join(lines).encode('utf-8'))
+    records = run_bounded(b64_bulk_record, read_manifest(stream, str(output_dir), None), jobs)
+    return {record["line"]: record for record in records}
+
+def test_decode_and_encode_records(tmp_path):
+    source = tmp_path / "photo.png"
+    Image.new('RGB', (4, 4)).save(source)
+    records = run_manifest([
+        json.dumps({"id": "first", "data": data_uri('png')}),
+        json.dumps({"id": "second", "data": data_uri('jpeg')}),
+        "",
+        json.dumps({"id": "third", "path": str(source), "output": None}),
+    ], tmp_path / "out")
+
+    assert records[1]["status"] == "ok" and records[1]["output"].endswith("first.png")
+    assert records[2]["status"] == "ok" and records[2]["output"].endswith("second.jpg")
+    assert 3 not in records
+    assert records[4]["status"] == "ok"
+    with Image.open(records[1]["output"]) as img:
+        assert img.size == (8, 8)
+
+def test_invalid_records_are_reported(tmp_path):
+    records = run_manifest([
+        "not json",
+        json.dumps(["a", "list"]),
+        json.dumps({"id": "empty"}),
+        json.dumps({"id": "bad", "data": "data:image/png;base64,$$$$"}),
+    ], tmp_path)
+    assert all(record["status"] == "error" for record in records.values())
+    assert "Invalid manifest record" in records[1]["error"]
+    assert "Invalid manifest record" in records[2]["error"]
+    assert "'data' field" in records[3]["error"]
+    assert records[4]["id"] == "bad"
+
+def test_colliding_outputs_are_reported(tmp_path):
+    # Duplicate ids and ids with the same basename would write the same file
+    records = run_manifest([
+        json.dumps({"id": "a/x", "data": data_uri()}),
+        json.dumps({"id": "b/x", "data": data_uri()}),
+        json.dumps({"id": "y", "data": data_uri()}),
+        json.dumps({"id": "y", "data": data_uri()}),
+    ], tmp_path, jobs=2)
+    assert [records[line]["status"] for line in (1, 2, 3, 4)] == ["ok", "error", "ok", "error"]
+    assert "line 1" in records[2]["error"]
+    assert "line 3" in records[4]["error"]
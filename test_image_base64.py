@@ -0,0 +1,65 @@
+import base64
+import binascii
+import io
+import os
+import pytest
+from PIL import Image
+from image_base64 import encode_base64_stream, decode_base64_stream
+from image_manupulator import image_to_base64, base64_to_image
+
+class ShortReads(io.BytesIO):
+    """File object returning at most a few bytes per read, like a pipe"""
+
+    def read(self, size=-1):
+        return super().read(min(size, 7) if size and size > 0 else 7)
+
+@pytest.mark.parametrize("length", [0, 1, 2, 3, 4, 100, 1000])
+@pytest.mark.parametrize("chunk_size", [3, 4, 9, 64])
+def test_encode_stream_matches_b64encode(length, chunk_size):
+    data = os.urandom(length)
+    for source in (io.BytesIO(data), ShortReads(data)):
+        encoded = io.BytesIO()
+        written = encode_base64_stream(source, encoded, b'data:image/png;base64,', chunk_size)
+        assert encoded.getvalue() == b'data:image/png;base64,' + base64.b64encode(data)
+        assert written == len(encoded.getvalue())
+
+@pytest.mark.parametrize("length", [1, 2, 3, 100, 1000])
+@pytest.mark.parametrize("chunk_size", [1, 5, 8, 64])
+def test_decode_stream_round_trip(length, chunk_size):
+    data = os.urandom(length)
+    text = base64.encodebytes(data)  # wrapped lines, whitespace is ignored
+    for prefix in (b'', b'data:image/png;base64,'):
+        decoded = io.BytesIO()
+        assert decode_base64_stream(io.BytesIO(prefix + text), decoded, chunk_size) == length
+        assert decoded.getvalue() == data
+
+@pytest.mark.parametrize("text", [b'', b'abc$', b'QQ==QQ==', b'data:image/png;base64'])
+def test_decode_stream_rejects_invalid_input(text):
+    with pytest.raises((ValueError, binascii.Error)):
+        decode_base64_stream(io.BytesIO(text), io.BytesIO(), 4)
+
+def test_image_round_trip(tmp_path):
+    source, text, output = tmp_path / "source.png", tmp_path / "source.txt", tmp_path / "output.png"
+    Image.new('RGBA', (16, 8), (10, 20, 30, 40)).save(source)
+    assert not image_to_base64(str(source), str(text)).startswith("Error")
+    assert not base64_to_image(str(text), str(output)).startswith("Error")
+    with Image.open(source) as expected, Image.open(output) as result:
+        assert result.mode == 'RGBA'
+        assert result.tobytes() == expected.tobytes()
+
+def test_image_with_exif_is_reencoded(tmp_path):
+    # Files with EXIF are not embedded byte for byte, so GPS and camera data are left out
+    source = tmp_path / "photo.jpg"
+    exif = Image.Exif()
+    exif[0x010f] = "Camera"
+    Image.new('RGB', (16, 8)).save(source, exif=exif.tobytes())
+    uri = image_to_base64(str(source))
+    assert uri.startswith("data:image/jpeg;base64,")
+    with Image.open(io.BytesIO(base64.b64decode(uri.split(',', 1)[1]))) as result:
+        assert not result.info.get('exif')
+
+def test_image_without_exif_is_embedded_as_is(tmp_path):
+    source = tmp_path / "photo.jpg"
+    Image.new('RGB', (16, 8), (200, 100, 0)).save(source)
+    uri = image_to_base64(str(source))
+    assert base64.b64decode(uri.split(',', 1)[1]) == source.read_bytes()
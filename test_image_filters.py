@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageEnhance
+from image_filters import apply_enhancements, apply_named_filter, apply_named_filters, LUTChain
+
+def sample_image(size=(64, 48)):
+    noise = Image.merge('RGB', [Image.effect_noise(size, 60) for _ in range(3)])
+    gradient = Image.linear_gradient('L').resize(size).convert('RGB')
+    return Image.blend(noise, gradient, 0.5)
+
+def max_difference(a, b):
+    return int(np.abs(np.asarray(a, dtype=int) - np.asarray(b, dtype=int)).max())
+
+def enhance_chain(img, brightness=1.0, contrast=1.0, saturation=1.0, sharpness=1.0):
+    """The ImageEnhance blends apply_enhancements replaces"""
+    for enhancer, factor in ((ImageEnhance.Brightness, brightness), (ImageEnhance.Contrast, contrast),
+                             (ImageEnhance.Color, saturation), (ImageEnhance.Sharpness, sharpness)):
+        if factor != 1.0:
+            img = enhancer(img).enhance(factor)
+    return img
+
+@pytest.mark.parametrize("factors, tolerance", [
+    ({"brightness": 1.3}, 0),
+    ({"brightness": 0.6}, 0),
+    ({"contrast": 0.7}, 0),
+    ({"contrast": 1.5}, 0),
+    ({"brightness": 1.2, "contrast": 0.8}, 0),
+    ({"sharpness": 2.0}, 1),
+    ({"saturation": 1.5}, 1),
+    ({"brightness": 1.2, "contrast": 0.8, "saturation": 1.4, "sharpness": 1.6}, 2),
+])
+def test_enhancements_match_image_enhance(factors, tolerance):
+    img = sample_image()
+    assert max_difference(apply_enhancements(img, **factors), enhance_chain(img, **factors)) <= tolerance
+
+def test_enhancements_keep_alpha_and_grayscale():
+    img = sample_image().convert('RGBA')
+    img.putalpha(Image.linear_gradient('L').resize(img.size))
+    result = apply_enhancements(img, brightness=1.2, saturation=1.5)
+    assert result.mode == 'RGBA'
+    assert result.getchannel('A').tobytes() == img.getchannel('A').tobytes()
+
+    gray = sample_image().convert('L')
+    result = apply_enhancements(gray, contrast=0.8, saturation=2.0)
+    assert result.mode == 'L'
+    assert max_difference(result, ImageEnhance.Contrast(gray).enhance(0.8)) == 0
+
+def test_enhancements_identity():
+    img = sample_image()
+    assert apply_enhancements(img).tobytes() == img.tobytes()
+
+def float_scale(img, factors):
+    """The float64 NumPy implementation the Cool and Warm LUTs replaced"""
+    values = np.asarray(img).astype(float)
+    for channel, factor in enumerate(factors):
+        values[:, :, channel] *= factor
+    return Image.fromarray(np.clip(values, 0, 255).astype(np.uint8))
+
+@pytest.mark.parametrize("filter_name, factors", [("Cool", (0.8, 1.0, 1.2)), ("Warm", (1.2, 1.1, 0.8))])
+def test_lut_filters_match_float_version(filter_name, factors):
+    img = sample_image()
+    assert apply_named_filter(img, filter_name).tobytes() == float_scale(img, factors).tobytes()
+
+def test_fused_point_filters_match_separate_passes():
+    img = sample_image()
+    names = ["Warm", "Cool", "Grayscale", "Warm"]
+    separate = img
+    for name in names:
+        separate = apply_named_filter(separate, name)
+    assert apply_named_filters(img, names).tobytes() == separate.tobytes()
+
+def test_lut_contrast_matches_image_enhance():
+    img = sample_image()
+    chain = LUTChain().scale(red=1.1).contrast(0.9)
+    expected = ImageEnhance.Contrast(float_scale(img, (1.1, 1.0, 1.0))).enhance(0.9)
+    assert chain.apply(img).tobytes() == expected.tobytes()
+
+def test_bound_contrast_gives_the_same_result_on_strips():
+    img = sample_image()
+    chain = LUTChain().contrast(0.8)
+    bound = chain.bind(img.histogram())
+    top, bottom = img.crop((0, 0, img.width, 10)), img.crop((0, 10, img.width, img.height))
+    whole = chain.apply(img)
+    assert bound.apply(top).tobytes() == whole.crop((0, 0, img.width, 10)).tobytes()
+    assert bound.apply(bottom).tobytes() == whole.crop((0, 10, img.width, img.height)).tobytes()
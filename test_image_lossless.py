@@ -0,0 +1,80 @@
+import pytest
+from PIL import Image, ImageChops, ImageOps, ImageStat
+from image_lossless import (JPEGTRAN, JPEGTRAN_TRANSFORMS, run_jpegtran, set_jpeg_orientation, transpose_file,
+                            auto_orient_file)
+from image_metadata import header_exif
+from image_pipeline import ORIENTATION_TRANSPOSE, EXIF_ORIENTATION, compose_transposes
+
+def sample_image(size=(32, 16)):
+    """An image that looks different under every transpose: a gradient with one bright corner"""
+    img = Image.linear_gradient('L').resize(size).convert('RGB')
+    img.paste((255, 0, 0), (0, 0, size[0] // 4, size[1] // 4))
+    return img
+
+def save_jpeg(path, img, orientation=None):
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[EXIF_ORIENTATION] = orientation
+    img.save(path, quality=95, subsampling=0, exif=exif.tobytes())
+
+def mean_difference(a, b):
+    assert a.size == b.size
+    return max(ImageStat.Stat(ImageChops.difference(a.convert('RGB'), b.convert('RGB'))).mean)
+
+@pytest.mark.parametrize("orientation", sorted(ORIENTATION_TRANSPOSE))
+def test_orientation_transpose_matches_exif_transpose(orientation):
+    img = sample_image()
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = orientation
+    img.info['exif'] = exif.tobytes()
+    assert ImageOps.exif_transpose(img).tobytes() == img.transpose(ORIENTATION_TRANSPOSE[orientation]).tobytes()
+
+@pytest.mark.parametrize("first", list(Image.Transpose))
+@pytest.mark.parametrize("second", list(Image.Transpose))
+def test_compose_transposes(first, second):
+    img = sample_image()
+    method = compose_transposes(first, second)
+    composed = img.transpose(method) if method is not None else img
+    assert composed.tobytes() == img.transpose(first).transpose(second).tobytes()
+
+def test_set_jpeg_orientation(tmp_path):
+    path = tmp_path / "photo.jpg"
+    save_jpeg(path, sample_image(), orientation=6)
+    size = path.stat().st_size
+    assert set_jpeg_orientation(path, 1)
+    assert path.stat().st_size == size
+    with Image.open(path) as img:
+        assert header_exif(img)[EXIF_ORIENTATION] == 1
+        img.load()
+
+def test_set_jpeg_orientation_without_tag(tmp_path):
+    path = tmp_path / "photo.jpg"
+    sample_image().save(path)
+    assert not set_jpeg_orientation(path, 1)
+
+@pytest.mark.parametrize("orientation", sorted(ORIENTATION_TRANSPOSE))
+def test_auto_orient_file(tmp_path, orientation):
+    source, output = tmp_path / "photo.jpg", tmp_path / "upright.jpg"
+    save_jpeg(source, sample_image(), orientation)
+    assert auto_orient_file(source, output)[0] == orientation
+    with Image.open(source) as original, Image.open(output) as result:
+        assert header_exif(result).get(EXIF_ORIENTATION, 1) == 1
+        assert mean_difference(result, ImageOps.exif_transpose(original)) < 4
+
+def test_transpose_resets_orientation(tmp_path):
+    # Rotating the stored pixels of an orientation 6 photo must not leave the tag to be applied on top
+    source, output = tmp_path / "photo.jpg", tmp_path / "rotated.jpg"
+    save_jpeg(source, sample_image(), orientation=6)
+    transpose_file(source, output, Image.Transpose.ROTATE_90)
+    with Image.open(source) as original, Image.open(output) as result:
+        assert header_exif(result).get(EXIF_ORIENTATION, 1) == 1
+        assert mean_difference(result, original.transpose(Image.Transpose.ROTATE_90)) < 4
+
+@pytest.mark.skipif(not JPEGTRAN, reason="jpegtran is not installed")
+@pytest.mark.parametrize("method", list(JPEGTRAN_TRANSFORMS))
+def test_jpegtran_transforms(tmp_path, method):
+    source, output = tmp_path / "photo.jpg", tmp_path / "transformed.jpg"
+    save_jpeg(source, sample_image())
+    assert run_jpegtran(JPEGTRAN_TRANSFORMS[method], source, output)
+    with Image.open(source) as original, Image.open(output) as result:
+        assert mean_difference(result, original.transpose(method)) < 4
@@ -0,0 +1,60 @@
+import base64
+import os
+import numpy as np
+import pytest
+from PIL import Image
+from image_metadata import build_index, load_index, read_metadata, exif_value
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "tree"
+    (root / "sub").mkdir(parents=True)
+    Image.new('RGB', (40, 30)).save(root / "a.jpg")
+    Image.new('RGBA', (20, 10)).save(root / "sub" / "b.png")
+    (root / "notes.txt").write_text("not an image")
+    return root
+
+def test_read_metadata(tree):
+    metadata = read_metadata(tree / "sub" / "b.png")
+    assert (metadata["width"], metadata["height"], metadata["format"]) == (20, 10, "PNG")
+    assert metadata["has_transparency"]
+
+def test_build_index(tree, tmp_path):
+    index_path = tmp_path / "index.npy"
+    summary = build_index([tree], index_path, jobs=1)
+    assert (summary["files"], summary["read"], summary["reused"], summary["removed"]) == (2, 2, 0, 0)
+    index = load_index(index_path)
+    assert list(index["path"]) == sorted(os.fsencode(os.path.abspath(path))
+                                         for path in (tree / "a.jpg", tree / "sub" / "b.png"))
+    assert list(index["width"]) == [40, 20]
+
+def test_index_reuses_unchanged_rows(tree, tmp_path):
+    index_path = tmp_path / "index.npy"
+    build_index([tree], index_path, jobs=1)
+
+    os.utime(tree / "a.jpg", (0, 0))
+    (tree / "sub" / "b.png").unlink()
+    Image.new('RGB', (5, 5)).save(tree / "c.gif")
+    summary = build_index([tree], index_path, jobs=1)
+    assert (summary["files"], summary["read"], summary["reused"], summary["removed"]) == (2, 2, 0, 1)
+
+    summary = build_index([tree], index_path, jobs=1)
+    assert (summary["read"], summary["reused"], summary["removed"]) == (0, 2, 0)
+
+def test_index_overlapping_roots_and_working_directory(tree, tmp_path, monkeypatch):
+    index_path = tmp_path / "index.npy"
+    summary = build_index([tree, tree / "sub"], index_path, jobs=1)
+    assert (summary["files"], summary["read"]) == (2, 2)
+
+    # Relative roots from another directory refer to the same absolute paths
+    monkeypatch.chdir(tree)
+    summary = build_index(["."], index_path, jobs=1)
+    assert (summary["files"], summary["read"], summary["reused"], summary["removed"]) == (2, 0, 2, 0)
+    assert len(np.unique(load_index(index_path)["path"])) == 2
+
+def test_exif_value():
+    assert exif_value(b'0230') == "0230"
+    assert exif_value(b'0230', include_binary=True) == "0230"
+    assert exif_value(b'\x00\xff' * 100) is None
+    assert exif_value(b'\x00\xff' * 100, include_binary=True) == base64.b64encode(b'\x00\xff' * 100).decode()
+    assert exif_value((1, 2)) == [1, 2]
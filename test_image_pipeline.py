@@ -0,0 +1,164 @@
+import io
+import pytest
+from PIL import Image, ImageChops, ImageOps
+from image_pipeline import (Pipeline, EditHistory, parse_operation, resize, rotate, apply_filter, flatten, watermark,
+                            encode, compose_transposes)
+from image_filters import apply_named_filter
+
+def sample_image(size=(120, 80), mode='RGB'):
+    noise = Image.merge('RGB', [Image.effect_noise(size, 60) for _ in range(3)])
+    gradient = Image.linear_gradient('L').resize(size).convert('RGB')
+    return Image.blend(noise, gradient, 0.5).convert(mode)
+
+def encoded(img, format='PNG'):
+    buffer = io.BytesIO()
+    img.save(buffer, format=format)
+    return buffer.getvalue()
+
+def test_pipeline_matches_separate_steps():
+    img = sample_image()
+    result = Pipeline([resize(60), rotate(90), apply_filter("Sepia"), encode("PNG")]).run(encoded(img))
+    expected = apply_named_filter(img.resize((60, 40), Image.Resampling.LANCZOS).rotate(90, expand=True,
+                                                                                        fillcolor='white'), "Sepia")
+    assert (result["input_size"], result["output_size"], result["format"]) == ((120, 80), (40, 60), "PNG")
+    with Image.open(io.BytesIO(result["data"])) as decoded:
+        assert decoded.tobytes() == expected.tobytes()
+
+def test_pipeline_output_format(tmp_path):
+    source = encoded(sample_image(mode='RGBA'))
+    # From the output extension, then the explicit format, then the source format
+    assert Pipeline([flatten()]).run(source, tmp_path / "out.jpg")["format"] == "JPEG"
+    assert Pipeline([encode("webp")]).run(source, tmp_path / "out.jpg")["format"] == "WEBP"
+    assert Pipeline([]).run(source)["format"] == "PNG"
+    with Image.open(tmp_path / "out.jpg") as img:
+        assert img.format == "WEBP"
+
+def test_pipeline_keys():
+    assert Pipeline([resize(100), encode("png")]).key() == Pipeline([resize(100, 100), encode("PNG")]).key()
+    assert Pipeline([resize(100)]).key() != Pipeline([resize(200)]).key()
+    with pytest.raises(ValueError):
+        Pipeline([encode("PNG"), resize(100)])
+
+@pytest.mark.parametrize("spec, expected", [
+    ("resize:800x600", resize(800, 600)),
+    ("resize:800:exact", resize(800, maintain_aspect=False)),
+    ("rotate:90", rotate(90)),
+    ("filter:gaussian_blur", apply_filter("Gaussian Blur")),
+    ("grayscale", apply_filter("Grayscale")),
+    ("watermark:Archive:top_left", watermark("Archive", "Top Left")),
+    ("encode:jpg:80:fast", encode("JPEG", quality=80, profile="fast")),
+    ("encode:webp:200KB:ssim=0.98", encode("WEBP", max_bytes=204800, min_ssim=0.98)),
+])
+def test_parse_operation(spec, expected):
+    assert parse_operation(spec).key() == expected.key()
+
+@pytest.mark.parametrize("spec", ["resize", "resize:abc", "rotate", "filter:unknown", "explode:1",
+                                  "encode:jpg:ssim=1.5"])
+def test_parse_operation_rejects(spec):
+    with pytest.raises(ValueError):
+        parse_operation(spec)
+
+def changed_box(result, base):
+    """Bounding box of the pixels an operation changed"""
+    return ImageChops.difference(result.convert('RGB'), base.convert('RGB')).getbbox()
+
+@pytest.mark.parametrize("position", ["Top Left", "Bottom Right", "Center"])
+def test_watermark_proxy_matches_full_resolution(position):
+    base = Image.new('RGB', (4000, 3000), (120, 160, 200))
+    history = EditHistory(base, preview_size=(800, 800))
+    history.push(watermark("Archive 2024", position))
+
+    preview = history.preview
+    scale = preview.width / base.width
+    full_box = changed_box(history.image, base)
+    proxy_box = changed_box(preview, base.resize(preview.size))
+    expected = [round(value * scale) for value in full_box]
+    assert all(abs(a - b) <= 2 for a, b in zip(proxy_box, expected))
+
+def test_edit_history_undo_redo():
+    base = sample_image()
+    history = EditHistory(base)
+    steps = [resize(60), apply_filter("Sepia"), rotate(90)]
+    results = [base]
+    for op in steps:
+        history.push(op)
+        results.append(history.image)
+    assert history.size == (40, 60) and not history.can_redo
+
+    history.undo()
+    history.undo()
+    assert history.image.tobytes() == results[1].tobytes()
+    assert history.size == results[1].size and history.can_redo
+    history.redo()
+    assert history.image.tobytes() == results[2].tobytes()
+
+    # A new operation discards the steps that were undone
+    history.push(apply_filter("Grayscale"))
+    assert not history.can_redo and len(history.operations) == 3
+    assert history.image.tobytes() == apply_named_filter(results[2], "Grayscale").tobytes()
+
+def test_edit_history_replays_evicted_snapshots():
+    base = sample_image()
+    history = EditHistory(base, max_snapshots=2)
+    filters = ["Sepia", "Blur", "Cool", "Warm", "Emboss"]
+    for name in filters:
+        history.push(apply_filter(name))
+    for _ in filters:
+        history.undo()
+    assert history.image.tobytes() == base.tobytes()
+    history.redo()
+    history.redo()
+    expected = apply_named_filter(apply_named_filter(base, "Sepia"), "Blur")
+    assert history.image.tobytes() == expected.tobytes()
+
+def test_edit_history_proxy_keeps_geometry():
+    base = sample_image((1200, 800))
+    history = EditHistory(base, preview_size=(300, 300))
+    assert history.has_proxy and history.preview.size == (300, 200)
+    history.push(rotate(90))
+    assert history.preview.size == (200, 300)
+    assert history.size == (800, 1200)
+
+def with_orientation(img, orientation):
+    """img encoded as PNG with an EXIF orientation tag"""
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG', exif=exif)
+    return buffer.getvalue()
+
+def max_difference(a, b):
+    return max(high for _, high in ImageChops.difference(a.convert('RGB'), b.convert('RGB')).getextrema())
+
+@pytest.mark.parametrize("orientation", range(1, 9))
+@pytest.mark.parametrize("steps", [[resize(50)], [resize(50, 50, maintain_aspect=False), rotate(90)],
+                                   [apply_filter("Sepia")]])
+def test_orientation_folding_matches_exif_transpose(orientation, steps):
+    source = with_orientation(sample_image(), orientation)
+    with Image.open(io.BytesIO(source)) as img:
+        expected = Pipeline(steps, auto_orient=False).apply(ImageOps.exif_transpose(img))
+    result = Pipeline(steps).run(source)
+    assert result["orientation"] == orientation
+    with Image.open(io.BytesIO(result["data"])) as decoded:
+        assert decoded.size == expected.size
+        # Resampling the stored image swaps the order of the horizontal and vertical passes
+        assert max_difference(decoded, expected) <= 2
+
+@pytest.mark.parametrize("orientation", [1, 3, 6, 8])
+def test_edit_history_auto_orient(orientation):
+    img = Image.open(io.BytesIO(with_orientation(sample_image(), orientation)))
+    upright = ImageOps.exif_transpose(img)
+    history = EditHistory(img)
+    assert history.size == upright.size
+    assert history.image.tobytes() == upright.tobytes()
+    history.push(resize(60))
+    expected = upright.resize(history.size, Image.Resampling.LANCZOS)
+    assert max_difference(history.image, expected) <= 1
+    history.undo()
+    assert history.image.tobytes() == upright.tobytes()
+
+def test_compose_transposes():
+    assert compose_transposes(Image.Transpose.ROTATE_90, Image.Transpose.ROTATE_270) is None
+    assert compose_transposes(Image.Transpose.ROTATE_90, Image.Transpose.ROTATE_90) == Image.Transpose.ROTATE_180
+    assert compose_transposes(Image.Transpose.FLIP_LEFT_RIGHT,
+                              Image.Transpose.ROTATE_90) == Image.Transpose.TRANSPOSE
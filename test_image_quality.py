@@ -0,0 +1,79 @@
+import io
+import pytest
+from PIL import Image
+from image_quality import QualitySearch, parse_byte_size, parse_ssim, ssim, luma_sample, _first_true
+
+def sample_image(size=(256, 192)):
+    noise = Image.merge('RGB', [Image.effect_noise(size, 40) for _ in range(3)])
+    gradient = Image.linear_gradient('L').resize(size).convert('RGB')
+    return Image.blend(noise, gradient, 0.6)
+
+@pytest.mark.parametrize("text, expected", [("200KB", 204800), ("1.5M", 1572864), ("50000", 50000), ("2k", 2048)])
+def test_parse_byte_size(text, expected):
+    assert parse_byte_size(text) == expected
+
+@pytest.mark.parametrize("text", [".98", "0KB", "-1", "abc", "10XB", "inf"])
+def test_parse_byte_size_rejects(text):
+    with pytest.raises(ValueError):
+        parse_byte_size(text)
+
+@pytest.mark.parametrize("text", ["0", "1.5", "-0.5", "abc"])
+def test_parse_ssim_rejects(text):
+    with pytest.raises(ValueError):
+        parse_ssim(text)
+
+def test_parse_ssim():
+    assert parse_ssim("1") == 1.0
+    assert parse_ssim("0.98") == 0.98
+
+@pytest.mark.parametrize("kwargs", [{}, {"max_bytes": 0}, {"min_ssim": 0}, {"min_ssim": 1.2}])
+def test_quality_search_rejects_targets(kwargs):
+    with pytest.raises(ValueError):
+        QualitySearch('JPEG', **kwargs)
+
+def test_quality_search_rejects_format():
+    with pytest.raises(ValueError):
+        QualitySearch('PNG', max_bytes=1000)
+
+@pytest.mark.parametrize("threshold", [10, 11, 37, 95, 96])
+@pytest.mark.parametrize("guess", [None, 10, 50, 95])
+def test_first_true(threshold, guess):
+    assert _first_true(lambda x: x >= threshold, 10, 95, guess) == min(threshold, 96)
+
+def test_ssim():
+    reference = luma_sample(sample_image())
+    assert ssim(reference, reference) == pytest.approx(1.0)
+    blurred = luma_sample(sample_image().resize((64, 48)).resize((256, 192)))
+    assert ssim(reference, blurred) < 0.9
+
+@pytest.mark.parametrize("format", ['JPEG', 'WEBP'])
+def test_size_target(format):
+    img = sample_image()
+    search = QualitySearch(format, max_bytes=8000)
+    result = search.search(img)
+    assert result["met"] and result["size"] <= 8000
+    # The next quality up does not fit, so the highest fitting quality was found
+    if result["quality"] < 95:
+        buffer = io.BytesIO()
+        img.save(buffer, format=format, quality=result["quality"] + 1)
+        assert buffer.tell() > 8000
+
+def test_ssim_target():
+    img = sample_image()
+    result = QualitySearch('JPEG', min_ssim=0.95).search(img)
+    assert result["met"] and result["ssim"] >= 0.95
+    with Image.open(io.BytesIO(result["data"])) as decoded:
+        assert ssim(luma_sample(img), luma_sample(decoded)) == pytest.approx(result["ssim"])
+
+def test_unreachable_size_target():
+    result = QualitySearch('JPEG', max_bytes=1).search(sample_image())
+    assert not result["met"]
+
+def test_variants_and_warm_start():
+    search = QualitySearch('JPEG', max_bytes=10000, subsampling_variants=(0, 2))
+    first = search.search(sample_image())
+    assert first["params"]["subsampling"] in (0, 2)
+    encodes = search.encodes
+    second = search.search(sample_image())
+    # The second image starts from the quality found for the first
+    assert second["met"] and search.encodes - encodes <= encodes
@@ -0,0 +1,60 @@
+import pytest
+from PIL import Image
+from image_pipeline import Pipeline, apply_filter, flatten, watermark
+
+def sample_image(size=(96, 200)):
+    """Noisy color image, so every filter changes most pixels"""
+    noise = [Image.effect_noise(size, 64) for _ in range(3)]
+    gradient = Image.linear_gradient('L').resize(size)
+    return Image.merge('RGB', [Image.blend(band, gradient, 0.5) for band in noise])
+
+@pytest.fixture
+def sources(tmp_path):
+    img = sample_image()
+    paths = {}
+    for suffix in ('.png', '.bmp', '.ppm', '.jpg'):
+        paths[suffix] = tmp_path / f"source{suffix}"
+        img.save(paths[suffix])
+    return paths
+
+OPERATIONS = [
+    [apply_filter("Sepia")],
+    [apply_filter("Blur")],
+    [apply_filter("Gaussian Blur")],
+    [apply_filter("Edge Enhance"), apply_filter("Find Edges")],
+    [apply_filter("Vintage")],
+    [flatten(), watermark("Archive", "Bottom Right")],
+]
+
+@pytest.mark.parametrize("operations", OPERATIONS)
+@pytest.mark.parametrize("suffix", ['.png', '.bmp', '.ppm'])
+def test_strips_match_whole_image(tmp_path, sources, suffix, operations):
+    whole, strips = tmp_path / "whole.png", tmp_path / "strips.png"
+    Pipeline(operations).run(sources[suffix], whole)
+    Pipeline(operations).run(sources[suffix], strips, strip_height=32)
+    with Image.open(whole) as expected, Image.open(strips) as result:
+        assert result.tobytes() == expected.tobytes()
+
+@pytest.mark.parametrize("suffix", ['.jpg', '.png', '.bmp'])
+def test_ppm_output_from_other_formats(tmp_path, sources, suffix):
+    # The output suffix decides the format, not the source
+    whole, strips = tmp_path / "whole.png", tmp_path / "strips.ppm"
+    operations = [apply_filter("Sepia")]
+    Pipeline(operations).run(sources[suffix], whole)
+    Pipeline(operations).run(sources[suffix], strips, strip_height=32)
+    assert strips.read_bytes()[:2] == b'P6'
+    with Image.open(whole) as expected, Image.open(strips) as result:
+        assert result.format == 'PPM'
+        assert result.tobytes() == expected.convert('RGB').tobytes()
+
+def test_pgm_output(tmp_path, sources):
+    output = tmp_path / "strips.pgm"
+    Pipeline([apply_filter("Grayscale")]).run(sources['.jpg'], output, strip_height=32)
+    assert output.read_bytes()[:2] == b'P5'
+    with Image.open(output) as result:
+        assert result.mode == 'L'
+
+def test_ppm_output_without_strips(tmp_path, sources):
+    output = tmp_path / "whole.ppm"
+    Pipeline([apply_filter("Sepia")]).run(sources['.jpg'], output)
+    assert output.read_bytes()[:2] == b'P6'
@@ -1,7 +1,6 @@
 import streamlit as st
 import base64
-from PIL import Image, ImageOps, ImageEnhance, ImageFilter, ImageFont, ImageDraw
-from PIL.ExifTags import TAGS, GPSTAGS
+from PIL import Image, ImageOps
 import io
 import os
 import json
@@ -9,9 +8,17 @@ import zipfile
 from pathlib import Path
 from datetime import datetime
 import pillow_heif
-import numpy as np
-from collections import Counter
 import tempfile
+import time
+import itertools
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from image_pipeline import (Pipeline, EditHistory, resize, rotate, enhance, apply_filter, crop_to_ratio,
+                            flatten, watermark, encode, apply_orientation, ENCODER_PROFILES,
+                            DEFAULT_ENCODER_PROFILE)
+from image_metadata import metadata_from_image, read_thumbnail, read_exif
+from image_analysis import PALETTE_MODES, extract_color_palette
+from image_cache import LRUCache, content_digest
 
 # Register HEIF opener
 pillow_heif.register_heif_opener()
@@ -80,160 +87,103 @@ def get_image_info(image):
     }
     return info
 
-def apply_sepia(image):
-    """Apply sepia effect"""
-    img_array = np.array(image)
-    sepia_filter = np.array([
-        [0.393, 0.769, 0.189],
-        [0.349, 0.686, 0.168],
-        [0.272, 0.534, 0.131]
-    ])
-    sepia_img = img_array.dot(sepia_filter.T)
-    sepia_img = np.clip(sepia_img, 0, 255).astype(np.uint8)
-    return Image.fromarray(sepia_img)
+def pil_to_bytes(image, format='PNG'):
+    """Convert PIL image to bytes"""
+    img_bytes = io.BytesIO()
+    image.save(img_bytes, format=format)
+    img_bytes.seek(0)
+    return img_bytes
 
-def apply_vintage(image):
-    """Apply vintage effect"""
-    # Apply sepia
-    vintage_img = apply_sepia(image)
-    # Add slight blur
-    vintage_img = vintage_img.filter(ImageFilter.GaussianBlur(radius=0.5))
-    # Reduce contrast
-    enhancer = ImageEnhance.Contrast(vintage_img)
-    return enhancer.enhance(0.9)
+# Previews shown in the editor are encoded at most this large
+PREVIEW_MAX_SIZE = 1600
 
-def apply_cool_filter(image):
-    """Apply cool color filter"""
-    img_array = np.array(image).astype(float)
-    img_array[:, :, 0] *= 0.8  # Reduce red
-    img_array[:, :, 2] *= 1.2  # Boost blue
-    img_array = np.clip(img_array, 0, 255).astype(np.uint8)
-    return Image.fromarray(img_array)
+@st.cache_resource
+def get_result_cache():
+    """Cache of decoded images, operation results and encoded downloads shared by all sessions"""
+    return LRUCache()
 
-def apply_warm_filter(image):
-    """Apply warm color filter"""
-    img_array = np.array(image).astype(float)
-    img_array[:, :, 0] *= 1.2  # Boost red
-    img_array[:, :, 1] *= 1.1  # Boost green slightly
-    img_array[:, :, 2] *= 0.8  # Reduce blue
-    img_array = np.clip(img_array, 0, 255).astype(np.uint8)
-    return Image.fromarray(img_array)
+def upload_digest(uploaded_file):
+    """Hash of the upload bytes, computed once per uploaded file"""
+    digests = st.session_state.setdefault('upload_digests', {})
+    file_id = getattr(uploaded_file, 'file_id', None) or uploaded_file.name
+    if file_id not in digests:
+        digests[file_id] = content_digest(uploaded_file.getvalue())
+    return digests[file_id]
 
-def crop_to_aspect_ratio(image, ratio):
-    """Crop image to specific aspect ratio"""
-    width, height = image.size
-    
-    if ratio == "1:1":
-        size = min(width, height)
-        new_width, new_height = size, size
-    elif ratio == "4:3":
-        if width > height:
-            new_height = height
-            new_width = int(height * 4 / 3)
-        else:
-            new_width = width
-            new_height = int(width * 3 / 4)
-    elif ratio == "16:9":
-        if width > height:
-            new_height = height
-            new_width = int(height * 16 / 9)
-        else:
-            new_width = width
-            new_height = int(width * 9 / 16)
-    elif ratio == "3:2":
-        if width > height:
-            new_height = height
-            new_width = int(height * 3 / 2)
-        else:
-            new_width = width
-            new_height = int(width * 2 / 3)
-    else:
-        return image
-    
-    # Ensure we don't exceed original dimensions
-    new_width = min(new_width, width)
-    new_height = min(new_height, height)
-    
-    # Center crop
-    left = (width - new_width) // 2
-    top = (height - new_height) // 2
-    right = left + new_width
-    bottom = top + new_height
-    
-    return image.crop((left, top, right, bottom))
+def decode_upload(uploaded_file):
+    """Fully decode an uploaded file"""
+    image = Image.open(io.BytesIO(uploaded_file.getvalue()))
+    image.load()
+    return image
 
-def add_watermark(image, text, position):
-    """Add text watermark to image"""
-    watermarked = image.copy()
-    
-    # Create a transparent overlay
-    overlay = Image.new('RGBA', watermarked.size, (255, 255, 255, 0))
-    draw = ImageDraw.Draw(overlay)
-    
-    # Try to use a reasonable font size
-    font_size = max(20, min(watermarked.width, watermarked.height) // 20)
-    try:
-        font = ImageFont.truetype("arial.ttf", font_size)
-    except:
-        font = ImageFont.load_default()
-    
-    # Get text size
-    bbox = draw.textbbox((0, 0), text, font=font)
-    text_width = bbox[2] - bbox[0]
-    text_height = bbox[3] - bbox[1]
-    
-    # Calculate position
-    margin = 20
-    if position == "Top Left":
-        x, y = margin, margin
-    elif position == "Top Right":
-        x, y = watermarked.width - text_width - margin, margin
-    elif position == "Bottom Left":
-        x, y = margin, watermarked.height - text_height - margin
-    elif position == "Bottom Right":
-        x, y = watermarked.width - text_width - margin, watermarked.height - text_height - margin
-    else:  # Center
-        x, y = (watermarked.width - text_width) // 2, (watermarked.height - text_height) // 2
-    
-    # Add semi-transparent background
-    draw.rectangle([x-5, y-5, x+text_width+5, y+text_height+5], fill=(0, 0, 0, 128))
-    draw.text((x, y), text, font=font, fill=(255, 255, 255, 200))
+def show_cached_image(cache, result_key, image, caption):
+    """st.image() with the encoded preview cached alongside the result"""
+    preview = cache.get_or_compute(result_key + ('preview',), render_preview, image)
+    st.image(preview, caption=caption, use_column_width=True)
+
+def render_preview(image):
+    """Encode a display sized copy of image, so reruns don't re-encode the full image for st.image;
+    an upload is shown upright for its EXIF orientation"""
+    preview = image
+    if max(image.size) > PREVIEW_MAX_SIZE:
+        preview = image.copy()
+        preview.thumbnail((PREVIEW_MAX_SIZE, PREVIEW_MAX_SIZE), Image.Resampling.LANCZOS)
+    preview = apply_orientation(preview)
+    if preview.mode in ('RGBA', 'LA', 'P'):
+        return pil_to_bytes(preview, 'PNG')
+    return pil_to_bytes(preview.convert('RGB'), 'JPEG')
+
+def iter_batch_results(pipeline, uploaded_files, mode="Sequential", workers=1):
+    """Run a pipeline over uploaded files, yielding (file, result, error) as each one finishes"""
+    if mode == "Sequential" or workers <= 1:
+        for uploaded_file in uploaded_files:
+            try:
+                yield uploaded_file, pipeline.run(uploaded_file), None
+            except Exception as e:
+                yield uploaded_file, None, e
+        return
     
-    # Composite the overlay
-    if watermarked.mode != 'RGBA':
-        watermarked = watermarked.convert('RGBA')
-    watermarked = Image.alpha_composite(watermarked, overlay)
+    # Pillow releases the GIL while decoding, resampling and encoding, so threads scale
+    # too; processes use spawn because forking the Streamlit server is not safe
+    if mode == "Processes":
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
     
-    if watermarked.mode == 'RGBA':
-        watermarked = watermarked.convert('RGB')
+    with executor:
+        files = iter(uploaded_files)
+        pending = {}
+        # Only keep a couple of images per worker in flight so memory stays bounded
+        for uploaded_file in itertools.islice(files, workers * 2):
+            pending[executor.submit(pipeline.run, uploaded_file.getvalue())] = uploaded_file
         
-    return watermarked
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                uploaded_file = pending.pop(future)
+                next_file = next(files, None)
+                if next_file is not None:
+                    pending[executor.submit(pipeline.run, next_file.getvalue())] = next_file
+                
+                try:
+                    yield uploaded_file, future.result(), None
+                except Exception as e:
+                    yield uploaded_file, None, e
 
-def extract_color_palette(image, num_colors=10):
-    """Extract color palette from image"""
-    rgb_img = image.convert('RGB')
-    pixels = list(rgb_img.getdata())
-    color_counts = Counter(pixels)
-    most_common = color_counts.most_common(num_colors)
-    
-    palette_info = []
-    total_pixels = len(pixels)
-    for color, count in most_common:
-        percentage = (count / total_pixels) * 100
-        palette_info.append({
-            'color': color,
-            'count': count,
-            'percentage': percentage
-        })
-    
-    return palette_info
+# Batch ZIPs are spooled to temp files with this prefix; files left behind by a run that
+# was interrupted are removed once they are this many seconds old
+BATCH_ZIP_PREFIX = "processed_images_"
+BATCH_ZIP_MAX_AGE = 3600
 
-def pil_to_bytes(image, format='PNG'):
-    """Convert PIL image to bytes"""
-    img_bytes = io.BytesIO()
-    image.save(img_bytes, format=format)
-    img_bytes.seek(0)
-    return img_bytes
+def remove_stale_batch_zips(max_age=BATCH_ZIP_MAX_AGE):
+    """Delete batch ZIP temp files older than max_age seconds"""
+    cutoff = time.time() - max_age
+    for path in Path(tempfile.gettempdir()).glob(f"{BATCH_ZIP_PREFIX}*.zip"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except OSError:
+            pass
 
 # Initialize session state
 if 'processed_images' not in st.session_state:
@@ -261,20 +211,33 @@ if tool == "📊 Single Image Editor":
     if uploaded_file is not None:
         # Load image
         try:
-            image = Image.open(uploaded_file)
+            # Everything derived from the upload is cached under its content hash plus the
+            # operations applied, so reruns reuse the decode, results and downloads
+            cache = get_result_cache()
+            upload_key = (upload_digest(uploaded_file),)
+            original_image = cache.get_or_compute(upload_key, decode_upload, uploaded_file)
+            
+            # Edits accumulate in a per-session history, a new upload starts a new one. Edits are
+            # previewed on a screen sized proxy, the full resolution image is only rendered for
+            # download; the history starts from the upload turned upright for its EXIF orientation
+            history = st.session_state.get('edit_history')
+            if history is None or history.base_key != upload_key:
+                history = EditHistory(original_image, upload_key, cache,
+                                      preview_size=(PREVIEW_MAX_SIZE, PREVIEW_MAX_SIZE))
+                st.session_state.edit_history = history
+            image, result_key = history.preview, history.key()
             st.session_state.current_image = image
-            original_image = image.copy()
             
             # Display original image info
             col1, col2 = st.columns([2, 1])
             
             with col1:
                 st.subheader("🖼️ Image Preview")
-                st.image(image, caption="Original Image", use_column_width=True)
+                show_cached_image(cache, upload_key, original_image, "Original Image")
             
             with col2:
                 st.subheader("📊 Image Information")
-                info = get_image_info(image)
+                info = cache.get_or_compute(upload_key + ('info',), get_image_info, original_image)
                 st.write(f"**Format:** {info['format']}")
                 st.write(f"**Mode:** {info['mode']}")
                 st.write(f"**Dimensions:** {info['width']} × {info['height']}")
@@ -291,26 +254,25 @@ if tool == "📊 Single Image Editor":
                 st.write("### Resize")
                 col1, col2, col3 = st.columns(3)
                 with col1:
-                    new_width = st.number_input("Width", min_value=1, value=image.width, key="width")
+                    new_width = st.number_input("Width", min_value=1, value=history.size[0], key="width")
                 with col2:
-                    new_height = st.number_input("Height", min_value=1, value=image.height, key="height")
+                    new_height = st.number_input("Height", min_value=1, value=history.size[1], key="height")
                 with col3:
                     maintain_aspect = st.checkbox("Maintain aspect ratio", value=True)
                 
                 if st.button("Resize Image"):
-                    if maintain_aspect:
-                        image.thumbnail((new_width, new_height), Image.Resampling.LANCZOS)
-                    else:
-                        image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+                    op = resize(new_width, new_height, maintain_aspect=maintain_aspect, draft=False)
+                    image, result_key = history.push(op), history.key()
                     st.success("Image resized!")
-                    st.image(image, caption="Resized Image", use_column_width=True)
+                    show_cached_image(cache, result_key, image, "Resized Image")
                 
                 st.write("### Rotate")
                 angle = st.slider("Rotation Angle", min_value=-180, max_value=180, value=0, step=1)
                 if st.button("Rotate Image"):
-                    image = image.rotate(angle, expand=True, fillcolor='white')
+                    op = rotate(angle)
+                    image, result_key = history.push(op), history.key()
                     st.success(f"Image rotated by {angle} degrees!")
-                    st.image(image, caption="Rotated Image", use_column_width=True)
+                    show_cached_image(cache, result_key, image, "Rotated Image")
             
             with tab2:
                 st.write("### Image Enhancement")
@@ -322,24 +284,10 @@ if tool == "📊 Single Image Editor":
                 sharpness = st.slider("Sharpness", min_value=0.0, max_value=3.0, value=1.0, step=0.1)
                 
                 if st.button("Apply Enhancements"):
-                    # Apply brightness
-                    enhancer = ImageEnhance.Brightness(image)
-                    image = enhancer.enhance(brightness)
-                    
-                    # Apply contrast
-                    enhancer = ImageEnhance.Contrast(image)
-                    image = enhancer.enhance(contrast)
-                    
-                    # Apply saturation
-                    enhancer = ImageEnhance.Color(image)
-                    image = enhancer.enhance(saturation)
-                    
-                    # Apply sharpness
-                    enhancer = ImageEnhance.Sharpness(image)
-                    image = enhancer.enhance(sharpness)
-                    
+                    op = enhance(brightness, contrast, saturation, sharpness)
+                    image, result_key = history.push(op), history.key()
                     st.success("Enhancements applied!")
-                    st.image(image, caption="Enhanced Image", use_column_width=True)
+                    show_cached_image(cache, result_key, image, "Enhanced Image")
             
             with tab3:
                 st.write("### Filters")
@@ -352,29 +300,10 @@ if tool == "📊 Single Image Editor":
                 selected_filter = st.selectbox("Choose Filter", filter_options)
                 
                 if st.button("Apply Filter") and selected_filter != "None":
-                    if selected_filter == "Grayscale":
-                        image = image.convert('L').convert('RGB')
-                    elif selected_filter == "Sepia":
-                        image = apply_sepia(image)
-                    elif selected_filter == "Blur":
-                        image = image.filter(ImageFilter.BLUR)
-                    elif selected_filter == "Gaussian Blur":
-                        image = image.filter(ImageFilter.GaussianBlur(radius=2))
-                    elif selected_filter == "Edge Enhance":
-                        image = image.filter(ImageFilter.EDGE_ENHANCE)
-                    elif selected_filter == "Emboss":
-                        image = image.filter(ImageFilter.EMBOSS)
-                    elif selected_filter == "Find Edges":
-                        image = image.filter(ImageFilter.FIND_EDGES)
-                    elif selected_filter == "Vintage":
-                        image = apply_vintage(image)
-                    elif selected_filter == "Cool":
-                        image = apply_cool_filter(image)
-                    elif selected_filter == "Warm":
-                        image = apply_warm_filter(image)
-                    
+                    op = apply_filter(selected_filter)
+                    image, result_key = history.push(op), history.key()
                     st.success(f"{selected_filter} filter applied!")
-                    st.image(image, caption=f"{selected_filter} Filter Applied", use_column_width=True)
+                    show_cached_image(cache, result_key, image, f"{selected_filter} Filter Applied")
             
             with tab4:
                 st.write("### Cropping")
@@ -382,51 +311,80 @@ if tool == "📊 Single Image Editor":
                 selected_ratio = st.selectbox("Aspect Ratio", aspect_ratios)
                 
                 if st.button("Crop Image") and selected_ratio != "Original":
-                    image = crop_to_aspect_ratio(image, selected_ratio)
+                    op = crop_to_ratio(selected_ratio)
+                    image, result_key = history.push(op), history.key()
                     st.success(f"Image cropped to {selected_ratio} aspect ratio!")
-                    st.image(image, caption="Cropped Image", use_column_width=True)
+                    show_cached_image(cache, result_key, image, "Cropped Image")
                 
                 st.write("### Watermark")
                 watermark_text = st.text_input("Watermark Text", value="Watermark")
                 watermark_position = st.selectbox("Position", ["Top Left", "Top Right", "Bottom Left", "Bottom Right", "Center"])
                 
                 if st.button("Add Watermark"):
-                    image = add_watermark(image, watermark_text, watermark_position)
+                    op = watermark(watermark_text, watermark_position)
+                    image, result_key = history.push(op), history.key()
                     st.success("Watermark added!")
-                    st.image(image, caption="Watermarked Image", use_column_width=True)
+                    show_cached_image(cache, result_key, image, "Watermarked Image")
                 
                 st.write("### Color Analysis")
                 if st.button("Extract Color Palette"):
-                    palette = extract_color_palette(image)
+                    palette = cache.get_or_compute(result_key + ('palette',),
+                                                   lambda: extract_color_palette(history.image))
                     st.write("**Top 10 Colors:**")
                     for i, color_info in enumerate(palette):
                         color = color_info['color']
                         percentage = color_info['percentage']
                         st.write(f"{i+1}. RGB{color} - {percentage:.2f}%")
             
+            # Undo/redo only move the history cursor, results come from its snapshots or the cache
+            st.subheader("🕘 Edit History")
+            if history.active_operations:
+                st.write(" → ".join(op.name for op in history.active_operations))
+                show_cached_image(cache, result_key, image, "Current Image")
+            else:
+                st.write("No edits yet")
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                if st.button("↶ Undo", disabled=not history.can_undo):
+                    history.undo()
+                    st.rerun()
+            with col2:
+                if st.button("↷ Redo", disabled=not history.can_redo):
+                    history.redo()
+                    st.rerun()
+            with col3:
+                if st.button("⟲ Reset", disabled=not history.is_modified):
+                    history.reset()
+                    st.rerun()
+            
             # Download processed image
-            if image != original_image:
+            if history.is_modified:
                 st.subheader("💾 Download Processed Image")
                 
                 format_choice = st.selectbox("Output Format", ["PNG", "JPEG", "WEBP"])
                 
-                # Convert image for download
-                if format_choice == "JPEG" and image.mode in ('RGBA', 'LA', 'P'):
-                    background = Image.new('RGB', image.size, (255, 255, 255))
-                    if image.mode in ('RGBA', 'LA'):
-                        background.paste(image, mask=image.split()[-1])
-                    else:
-                        background.paste(image)
-                    image = background
-                
-                img_bytes = pil_to_bytes(image, format_choice)
-                
-                st.download_button(
-                    label=f"Download as {format_choice}",
-                    data=img_bytes,
-                    file_name=f"processed_image.{format_choice.lower()}",
-                    mime=f"image/{format_choice.lower()}"
-                )
+                # The edits are replayed at full resolution and encoded once per result and format
+                # (JPEG is flattened onto white)
+                download_pipeline = Pipeline([encode(format_choice)])
+                download_key = result_key + (download_pipeline.key(),)
+                if download_key not in cache and history.has_proxy:
+                    st.caption(f"Preview shown at reduced size, the download is rendered at "
+                               f"{history.size[0]} × {history.size[1]}")
+                    render_download = st.button("Render Full Resolution")
+                else:
+                    render_download = True
+                
+                if render_download:
+                    with st.spinner("Rendering full resolution image..."):
+                        img_bytes = cache.get_or_compute(download_key,
+                                                         lambda: download_pipeline.run(history.image)['data'])
+                    
+                    st.download_button(
+                        label=f"Download as {format_choice}",
+                        data=img_bytes,
+                        file_name=f"processed_image.{format_choice.lower()}",
+                        mime=f"image/{format_choice.lower()}"
+                    )
                 
         except Exception as e:
             st.error(f"Error loading image: {str(e)}")
@@ -458,6 +416,8 @@ elif tool == "📦 Batch Processor":
                 batch_height = st.number_input("Target Height", min_value=1, value=600)
             with col3:
                 batch_maintain_aspect = st.checkbox("Maintain aspect ratio", value=True, key="batch_aspect")
+                batch_draft = st.checkbox("Fast JPEG decode", value=True, key="batch_draft",
+                                          help="Decode JPEGs at reduced scale before resizing")
         
         elif operation == "Convert Format":
             target_format = st.selectbox("Target Format", ["PNG", "JPEG", "WEBP"])
@@ -466,111 +426,99 @@ elif tool == "📦 Batch Processor":
             batch_filter = st.selectbox("Filter", ["Grayscale", "Sepia", "Blur", "Vintage", "Cool", "Warm"])
         
         elif operation == "Compress":
-            quality = st.slider("JPEG Quality", min_value=10, max_value=100, value=85)
+            compress_target = st.selectbox("Target", ["Fixed quality", "File size", "SSIM"],
+                                           help="Search the JPEG quality of each image for a size or SSIM target")
+            if compress_target == "File size":
+                target_kb = st.number_input("Maximum size (KB)", min_value=1, value=200)
+            elif compress_target == "SSIM":
+                target_ssim = st.slider("Minimum SSIM", min_value=0.80, max_value=0.999, value=0.98, step=0.001,
+                                        format="%.3f")
+            else:
+                quality = st.slider("JPEG Quality", min_value=10, max_value=100, value=85)
+        
+        encoder_profile = st.selectbox("Encoder Effort", list(ENCODER_PROFILES),
+                                       index=list(ENCODER_PROFILES).index(DEFAULT_ENCODER_PROFILE),
+                                       help="fast favours throughput, max the smallest files")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            execution_mode = st.selectbox("Execution Mode", ["Threads", "Processes", "Sequential"],
+                                          help="Process several images in parallel")
+        with col2:
+            max_workers = os.cpu_count() or 1
+            batch_workers = st.number_input("Workers", min_value=1, max_value=max(64, max_workers),
+                                            value=max_workers, disabled=execution_mode == "Sequential")
         
         if st.button("Process Batch"):
-            processed_files = []
+            if operation == "Resize":
+                batch_pipeline = Pipeline([
+                    resize(batch_width, batch_height, maintain_aspect=batch_maintain_aspect, draft=batch_draft),
+                    encode("PNG", profile=encoder_profile)
+                ])
+            elif operation == "Convert Format":
+                if target_format == "JPEG":
+                    batch_pipeline = Pipeline([encode("JPEG", quality=95, profile=encoder_profile)])
+                else:
+                    batch_pipeline = Pipeline([encode(target_format, profile=encoder_profile)])
+            elif operation == "Apply Filter":
+                batch_pipeline = Pipeline([apply_filter(batch_filter), encode("PNG", profile=encoder_profile)])
+            elif compress_target == "File size":
+                batch_pipeline = Pipeline([flatten(), encode("JPEG", max_bytes=target_kb * 1024,
+                                                                      profile=encoder_profile)])
+            elif compress_target == "SSIM":
+                batch_pipeline = Pipeline([flatten(), encode("JPEG", min_ssim=target_ssim, profile=encoder_profile)])
+            else:
+                batch_pipeline = Pipeline([flatten(), encode("JPEG", quality=quality, profile=encoder_profile)])
+            
+            # Spool results into a temp-file backed ZIP as each image finishes, so only
+            # one processed image is held in memory while the batch runs
+            remove_stale_batch_zips()
+            zip_handle = tempfile.NamedTemporaryFile(prefix=BATCH_ZIP_PREFIX, suffix=".zip", delete=False)
+            
+            processed_count = 0
             progress_bar = st.progress(0)
             status_text = st.empty()
             
-            for i, uploaded_file in enumerate(uploaded_files):
-                try:
-                    # Update progress
+            with zip_handle, zipfile.ZipFile(zip_handle, 'w') as zip_file:
+                results = iter_batch_results(batch_pipeline, uploaded_files, execution_mode, batch_workers)
+                for i, (uploaded_file, result, error) in enumerate(results):
+                    # Update progress as each image completes
                     progress = (i + 1) / len(uploaded_files)
                     progress_bar.progress(progress)
-                    status_text.text(f"Processing {uploaded_file.name}...")
-                    
-                    # Load image
-                    image = Image.open(uploaded_file)
-                    
-                    # Apply operation
-                    if operation == "Resize":
-                        if batch_maintain_aspect:
-                            image.thumbnail((batch_width, batch_height), Image.Resampling.LANCZOS)
-                        else:
-                            image = image.resize((batch_width, batch_height), Image.Resampling.LANCZOS)
-                    
-                    elif operation == "Convert Format":
-                        if target_format == "JPEG" and image.mode in ('RGBA', 'LA', 'P'):
-                            background = Image.new('RGB', image.size, (255, 255, 255))
-                            if image.mode in ('RGBA', 'LA'):
-                                background.paste(image, mask=image.split()[-1])
-                            else:
-                                background.paste(image)
-                            image = background
-                    
-                    elif operation == "Apply Filter":
-                        if batch_filter == "Grayscale":
-                            image = image.convert('L').convert('RGB')
-                        elif batch_filter == "Sepia":
-                            image = apply_sepia(image)
-                        elif batch_filter == "Blur":
-                            image = image.filter(ImageFilter.BLUR)
-                        elif batch_filter == "Vintage":
-                            image = apply_vintage(image)
-                        elif batch_filter == "Cool":
-                            image = apply_cool_filter(image)
-                        elif batch_filter == "Warm":
-                            image = apply_warm_filter(image)
-                    
-                    elif operation == "Compress":
-                        if image.mode in ('RGBA', 'LA', 'P'):
-                            background = Image.new('RGB', image.size, (255, 255, 255))
-                            if image.mode in ('RGBA', 'LA'):
-                                background.paste(image, mask=image.split()[-1])
-                            else:
-                                background.paste(image)
-                            image = background
-                    
-                    # Save to bytes
-                    output_format = target_format if operation == "Convert Format" else "PNG"
-                    if operation == "Compress":
-                        output_format = "JPEG"
+                    status_text.text(f"Processed {i + 1}/{len(uploaded_files)}: {uploaded_file.name}")
                     
-                    img_bytes = io.BytesIO()
-                    save_kwargs = {}
-                    if output_format == "JPEG":
-                        save_kwargs['quality'] = quality if operation == "Compress" else 95
-                        save_kwargs['optimize'] = True
-                    
-                    image.save(img_bytes, format=output_format, **save_kwargs)
-                    img_bytes.seek(0)
+                    if error is not None:
+                        st.error(f"Error processing {uploaded_file.name}: {str(error)}")
+                        continue
                     
                     # Store processed file
                     filename = Path(uploaded_file.name).stem
-                    extension = output_format.lower()
+                    extension = result['format'].lower()
                     if extension == "jpeg":
                         extension = "jpg"
                     
-                    processed_files.append({
-                        'name': f"{filename}_processed.{extension}",
-                        'data': img_bytes.getvalue(),
-                        'format': output_format
-                    })
-                    
-                except Exception as e:
-                    st.error(f"Error processing {uploaded_file.name}: {str(e)}")
+                    zip_file.writestr(f"{filename}_processed.{extension}", result['data'])
+                    processed_count += 1
+                    del result
             
             status_text.text("Processing complete!")
             progress_bar.progress(1.0)
             
-            if processed_files:
-                st.success(f"Successfully processed {len(processed_files)} images!")
-                
-                # Create ZIP file for download
-                zip_bytes = io.BytesIO()
-                with zipfile.ZipFile(zip_bytes, 'w') as zip_file:
-                    for file_info in processed_files:
-                        zip_file.writestr(file_info['name'], file_info['data'])
-                
-                zip_bytes.seek(0)
-                
-                st.download_button(
-                    label="📥 Download All Processed Images (ZIP)",
-                    data=zip_bytes.getvalue(),
-                    file_name="processed_images.zip",
-                    mime="application/zip"
-                )
+            try:
+                if processed_count:
+                    st.success(f"Successfully processed {processed_count} images!")
+                    
+                    # Streamlit keeps download data in memory, so the finished ZIP is read in
+                    # once here; the temp file is not needed after that
+                    with open(zip_handle.name, 'rb') as zip_file:
+                        st.download_button(
+                            label="📥 Download All Processed Images (ZIP)",
+                            data=zip_file,
+                            file_name="processed_images.zip",
+                            mime="application/zip"
+                        )
+            finally:
+                Path(zip_handle.name).unlink(missing_ok=True)
 
 elif tool == "🔍 Image Inspector":
     st.header("🔍 Image Inspector")
@@ -582,10 +530,17 @@ elif tool == "🔍 Image Inspector":
     
     if uploaded_file is not None:
         try:
-            image = Image.open(uploaded_file)
+            # Opening only parses the header; pixels are decoded for a reduced scale
+            # thumbnail, and in full only for an exact palette
+            cache = get_result_cache()
+            upload_key = (upload_digest(uploaded_file),)
+            image = Image.open(io.BytesIO(uploaded_file.getvalue()))
+            metadata = metadata_from_image(image, include_exif=False)
+            thumbnail = cache.get_or_compute(upload_key + ('thumbnail',), read_thumbnail,
+                                             io.BytesIO(uploaded_file.getvalue()), (PREVIEW_MAX_SIZE, PREVIEW_MAX_SIZE))
             
             # Display image
-            st.image(image, caption="Uploaded Image", use_column_width=True)
+            show_cached_image(cache, upload_key + ('thumbnail',), thumbnail, "Uploaded Image")
             
             # Basic information
             st.subheader("📊 Basic Information")
@@ -602,11 +557,18 @@ elif tool == "🔍 Image Inspector":
                 st.write(f"**Dimensions:** {info['width']} × {info['height']}")
                 st.write(f"**Aspect Ratio:** {info['aspect_ratio']}")
                 st.write(f"**Transparency:** {'Yes' if info['has_transparency'] else 'No'}")
+                st.write(f"**EXIF:** {'Yes' if metadata['has_exif'] else 'No'} (orientation {metadata['orientation']})")
+                color_profile = f"ICC, {metadata['icc_profile_size']:,} bytes" if metadata['icc_profile_size'] else "None"
+                st.write(f"**Color Profile:** {color_profile}")
             
             # Color analysis
             st.subheader("🎨 Color Analysis")
+            palette_mode = st.selectbox("Palette Mode", PALETTE_MODES,
+                                        help="'exact' counts every pixel, the other modes group similar colors on a downsampled copy")
             if st.button("Analyze Colors"):
-                palette = extract_color_palette(image)
+                # Approximate modes downsample anyway, so they work from the thumbnail
+                source = cache.get_or_compute(upload_key, decode_upload, uploaded_file) if palette_mode == "exact" else thumbnail
+                palette = extract_color_palette(source, mode=palette_mode)
                 
                 st.write("**Most Common Colors:**")
                 for i, color_info in enumerate(palette):
@@ -626,19 +588,8 @@ elif tool == "🔍 Image Inspector":
             st.subheader("📷 EXIF Data")
             if st.button("Extract EXIF Data"):
                 try:
-                    exif_data = {}
-                    if hasattr(image, '_getexif') and image._getexif() is not None:
-                        exif = image._getexif()
-                        for tag_id, value in exif.items():
-                            tag = TAGS.get(tag_id, tag_id)
-                            if tag == "GPSInfo":
-                                gps_data = {}
-                                for gps_tag_id, gps_value in value.items():
-                                    gps_tag = GPSTAGS.get(gps_tag_id, gps_tag_id)
-                                    gps_data[gps_tag] = str(gps_value)
-                                exif_data[tag] = gps_data
-                            else:
-                                exif_data[tag] = str(value)
+                    # Typed values from the header, binary blobs such as MakerNote are left out
+                    exif_data = read_exif(image)
                     
                     if exif_data:
                         st.json(exif_data)